@@ -0,0 +1,174 @@
+"""A local stand-in for the Beehiiv subscriptions endpoint.
+
+Serves ``GET /v2/publications/{id}/subscriptions`` for ``total``
+synthetic subscribers. Records are generated on demand from their index,
+so a million-subscriber publication costs no memory and every run sees
+the same data. ``latency`` (seconds, plus up to ``jitter``) is added to
+every response and ``rate_limit_ratio`` of the requests get a 429.
+"""
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PATH = re.compile(r'^/v2/publications/(?P<publication_id>[^/]+)/subscriptions/?$')
+EPOCH = datetime(2022, 1, 1, tzinfo=timezone.utc)
+MAX_LIMIT = 1000
+
+SOURCES = [
+    ('twitter', 'social'), ('facebook', 'social'), ('google', 'search'),
+    ('newsletter', 'email'), ('', ''), ('partner', 'referral'),
+]
+CAMPAIGNS = ['', 'launch', 'spring', 'evergreen']
+
+
+def _iso(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def synthetic_subscriber(index, seed=0):
+    """The subscriber at ``index`` (0 is the oldest)."""
+    rng = random.Random(seed * 1_000_003 + index)
+    created = EPOCH + timedelta(minutes=index * 5 + rng.randrange(5))
+    status = 'inactive' if rng.random() < 0.2 else 'active'
+    updated = created + timedelta(days=rng.randrange(0, 400))
+    received = rng.randrange(0, 200)
+    opened = rng.randrange(0, received + 1)
+    clicked = rng.randrange(0, opened + 1) if rng.random() < 0.4 else 0
+    unique_clicked = min(clicked, rng.randrange(0, clicked + 1) + (1 if clicked else 0))
+    source, channel = rng.choice(SOURCES)
+    return {
+        'id': f'sub_{seed}_{index:08d}',
+        'email': f'reader{index}@example.com',
+        'status': status,
+        'created': int(created.timestamp()),
+        'created_at': _iso(created),
+        'updated_at': _iso(updated),
+        'subscription_tier': 'free',
+        'utm_data': {
+            'utm_source': source,
+            'utm_medium': 'organic' if source else '',
+            'utm_channel': channel,
+            'utm_campaign': rng.choice(CAMPAIGNS),
+        },
+        'stats': {
+            'emails_received': received,
+            'open_rate': round(opened / received * 100, 2) if received else 0,
+            'click_through_rate': round(clicked / received * 100, 2) if received else 0,
+            'total_clicked': clicked,
+            'total_unique_clicked': unique_clicked,
+        },
+    }
+
+
+class MockBeehiivServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, total, latency=0.0, jitter=0.0, rate_limit_ratio=0.0,
+                 retry_after=0, seed=0, address=('127.0.0.1', 0)):
+        super().__init__(address, MockBeehiivHandler)
+        self.total = total
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v2'
+
+    def should_rate_limit(self):
+        with self.lock:
+            self.requests += 1
+            if self.random.random() < self.rate_limit_ratio:
+                self.rate_limited += 1
+                return True
+        return False
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+    def page(self, page, limit, descending):
+        start = (page - 1) * limit
+        stop = min(start + limit, self.total)
+        positions = range(start, stop) if start < self.total else range(0)
+        if descending:
+            indexes = (self.total - 1 - position for position in positions)
+        else:
+            indexes = iter(positions)
+        return {
+            'data': [synthetic_subscriber(index, self.seed) for index in indexes],
+            'limit': limit,
+            'page': page,
+            'total_results': self.total,
+            'total_pages': -(-self.total // limit),
+        }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class MockBeehiivHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if not PATH.match(url.path):
+            self.send_json(404, {'errors': [{'message': 'Not found'}]})
+            return
+
+        server = self.server
+        server.delay()
+        if server.should_rate_limit():
+            self.send_json(
+                429, {'errors': [{'message': 'Too many requests'}]},
+                headers={'Retry-After': str(server.retry_after)},
+            )
+            return
+
+        params = parse_qs(url.query)
+        try:
+            page = max(int(params.get('page', ['1'])[0]), 1)
+            limit = min(max(int(params.get('limit', ['10'])[0]), 1), MAX_LIMIT)
+        except ValueError:
+            self.send_json(400, {'errors': [{'message': 'Invalid pagination'}]})
+            return
+        descending = params.get('direction', ['asc'])[0] == 'desc'
+        self.send_json(200, server.page(page, limit, descending))
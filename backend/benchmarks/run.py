@@ -0,0 +1,289 @@
+"""Benchmark the Beehiiv client, the sync and the subscribers view.
+
+Everything runs against the local mock API (``benchmarks.mock_api``) and a
+throwaway SQLite database, so no credentials or network are needed::
+
+    cd backend
+    python -m benchmarks.run --sizes 1000,100000 --latency 0.02 --rate-limit-ratio 0.01
+    python -m benchmarks.run --json bench.json
+    python -m benchmarks.run --baseline bench.json   # exits 1 on a regression
+
+For each size it reports throughput, p50/p99 latency (per API page for
+the client, per request for the view) and peak Python memory as seen by
+tracemalloc.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+from subscribers.beehiiv_client import BeehiivClient  # noqa: E402
+from subscribers.publications import save_publication  # noqa: E402
+from subscribers.sync import sync_publication  # noqa: E402
+
+from .mock_api import MockBeehiivServer  # noqa: E402
+
+DEFAULT_SIZES = '1000,100000,1000000'
+VIEW_URL = '/api/subscribers/'
+VIEW_SCENARIOS = [
+    ('first page, uncached', {}, False),
+    ('first page, cached', {}, True),
+    ('sort open_rate desc', {'sort': 'stats.open_rate', 'direction': 'desc', 'limit': '100'}, False),
+    ('filter + search', {'status': 'active', 'source_channel': 'twitter/social', 'search': '7'}, False),
+    ('deep page by cursor', {'sort': 'engagement_rank', 'limit': '200'}, False),
+]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+@contextmanager
+def peak_memory(enabled):
+    """Yields a dict that holds ``peak_mb`` once the block is done."""
+    result = {'peak_mb': None}
+    if not enabled:
+        yield result
+        return
+    tracemalloc.start()
+    try:
+        yield result
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result['peak_mb'] = round(peak / 1024 / 1024, 1)
+
+
+def measure(name, size, run, memory=True, unit='records'):
+    """Time ``run()``, which returns ``(count, latencies)``."""
+    with peak_memory(memory) as mem:
+        started = time.perf_counter()
+        count, latencies = run()
+        seconds = time.perf_counter() - started
+    return {
+        'benchmark': name,
+        'size': size,
+        'count': count,
+        'unit': unit,
+        'seconds': round(seconds, 3),
+        'throughput': round(count / seconds, 1) if seconds else None,
+        'p50_ms': _ms(percentile(latencies, 0.5)),
+        'p99_ms': _ms(percentile(latencies, 0.99)),
+        'peak_mb': mem['peak_mb'],
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def make_client(server, publication_id, options, concurrency=1):
+    client = BeehiivClient(
+        'bench-key', publication_id,
+        concurrency=concurrency,
+        requests_per_second=options.rps,
+        base_url=server.base_url,
+    )
+    latencies = []
+    get_subscribers = client.get_subscribers
+
+    def timed_get_subscribers(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return get_subscribers(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    client.get_subscribers = timed_get_subscribers
+    return client, latencies
+
+
+def bench_client(server, size, options):
+    publication_id = f'bench_{size}'
+    results = []
+
+    for concurrency in sorted({1, options.concurrency}):
+        def fetch_all():
+            client, latencies = make_client(server, publication_id, options, concurrency)
+            return len(client.get_all_subscribers()), latencies
+
+        results.append(measure(
+            f'get_all_subscribers (concurrency {concurrency})', size, fetch_all, options.memory
+        ))
+
+    def metrics():
+        client, latencies = make_client(server, publication_id, options)
+        return client.get_subscriber_metrics(include_subscribers=False)['total_subscribers'], latencies
+
+    results.append(measure('get_subscriber_metrics (streaming)', size, metrics, options.memory))
+
+    return results
+
+
+def bench_view(server, size, options):
+    publication_id = f'bench_{size}'
+
+    def sync():
+        client, latencies = make_client(server, publication_id, options, options.concurrency)
+        return sync_publication(client, mode='full'), latencies
+
+    results = [measure('sync_publication (full)', size, sync, options.memory)]
+
+    http = Client()
+    save_publication('bench-key', publication_id)
+    for name, params, warm in VIEW_SCENARIOS:
+        params = {**params, 'publication': publication_id}
+        if name == 'deep page by cursor':
+            params['cursor'] = _cursor_near_end(http, params, size)
+
+        def requests():
+            latencies = []
+            cache.clear()
+            if warm:
+                http.get(VIEW_URL, params)
+            for _ in range(options.requests):
+                if not warm:
+                    cache.clear()
+                started = time.perf_counter()
+                response = http.get(VIEW_URL, params)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise RuntimeError(f'{VIEW_URL} returned {response.status_code}: {response.content[:200]}')
+            return len(latencies), latencies
+
+        results.append(measure(f'view: {name}', size, requests, options.memory, unit='requests'))
+    return results
+
+
+def _cursor_near_end(http, params, size):
+    """Walk to a cursor about 90% of the way through the list (without timing it)."""
+    limit = int(params.get('limit', 50))
+    page = max(1, int(size * 0.9) // limit)
+    response = http.get(VIEW_URL, {**params, 'page': page})
+    cache.clear()
+    return response.json().get('next_cursor') or ''
+
+
+def run(options):
+    results = []
+    setup_test_environment()
+    workdir = tempfile.mkdtemp(prefix='beehiiv-bench-')
+    settings.DATABASES['default'].setdefault('TEST', {})['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+    # The benchmark's syncs archive snapshots too; keep them out of the project
+    settings.SUBSCRIBER_SNAPSHOT_DIR = os.path.join(workdir, 'snapshots')
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        for size in options.sizes:
+            server = MockBeehiivServer(
+                size,
+                latency=options.latency,
+                jitter=options.jitter,
+                rate_limit_ratio=options.rate_limit_ratio,
+                seed=options.seed,
+            )
+            with server:
+                for bench in (bench_client, bench_view):
+                    for result in bench(server, size, options):
+                        print_result(result)
+                        results.append(result)
+                print(f'  mock API: {server.requests} requests, {server.rate_limited} rate limited',
+                      file=sys.stderr)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def print_result(result):
+    def show(value, suffix=''):
+        return '-' if value is None else f'{value}{suffix}'
+
+    print(
+        f"{result['size']:>9}  {result['benchmark']:<40} "
+        f"{show(result['throughput']):>11} {result['unit']}/s  "
+        f"p50 {show(result['p50_ms'], 'ms'):>10}  p99 {show(result['p99_ms'], 'ms'):>10}  "
+        f"peak {show(result['peak_mb'], 'MB'):>9}",
+        flush=True,
+    )
+
+
+def compare(results, baseline, tolerance):
+    """Return the benchmarks whose throughput dropped by more than ``tolerance``."""
+    previous = {(r['benchmark'], r['size']): r for r in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result['benchmark'], result['size']))
+        if not before or not before['throughput'] or not result['throughput']:
+            continue
+        change = result['throughput'] / before['throughput'] - 1
+        if change < -tolerance:
+            regressions.append((result, before, change))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f'comma-separated subscriber counts (default {DEFAULT_SIZES})')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to each API response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra latency, up to this many seconds')
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help='share of API requests answered with 429')
+    parser.add_argument('--rps', type=float, default=1000.0, help='client-side rate limit (requests per second)')
+    parser.add_argument('--concurrency', type=int, default=4, help='concurrent page fetches')
+    parser.add_argument('--requests', type=int, default=20, help='requests per view scenario')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='skip tracemalloc, which slows the benchmarks down')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='results file of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed throughput drop against the baseline (default 0.2 = 20%%)')
+    options = parser.parse_args(argv)
+    options.sizes = [int(size) for size in options.sizes.split(',') if size]
+    return options
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    results = run(options)
+
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            regressions = compare(results, json.load(f), options.tolerance)
+        for result, before, change in regressions:
+            print(
+                f"REGRESSION {result['benchmark']} @ {result['size']}: "
+                f"{before['throughput']} -> {result['throughput']} {result['unit']}/s ({change:.0%})",
+                file=sys.stderr,
+            )
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
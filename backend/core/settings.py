@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
+from datetime import timedelta
 import os
 from dotenv import load_dotenv
 import dj_database_url
@@ -93,9 +94,14 @@ WSGI_APPLICATION = "core.wsgi.application"
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
 if os.getenv('DATABASE_URL'):
-    # Production database (Render)
+    # Production database (Render). Under ASGI each request runs its queries
+    # on a thread of its own, so persistent connections are best turned off
+    # there (DATABASE_CONN_MAX_AGE=0).
     DATABASES = {
-        'default': dj_database_url.config(default=os.getenv('DATABASE_URL'), conn_max_age=600)
+        'default': dj_database_url.config(
+            default=os.getenv('DATABASE_URL'),
+            conn_max_age=int(os.getenv('DATABASE_CONN_MAX_AGE', 600)),
+        )
     }
 else:
     # Local SQLite database
@@ -107,6 +113,47 @@ else:
     }
 
 
+# Cache
+# Redis in production (REDIS_URL), in-process memory otherwise
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
+# Celery
+# Without a broker (local development, tests) tasks run inline.
+
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', os.getenv('REDIS_URL', 'memory://'))
+CELERY_TASK_ALWAYS_EAGER = CELERY_BROKER_URL == 'memory://'
+CELERY_TASK_EAGER_PROPAGATES = False
+# Syncs are long; each worker process reserves one at a time so queued
+# publications spread evenly over the workers.
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_BEAT_SCHEDULE = {
+    'incremental-subscriber-sync': {
+        'task': 'subscribers.tasks.sync_all_publications',
+        'schedule': timedelta(minutes=int(os.getenv('SUBSCRIBERS_INCREMENTAL_SYNC_MINUTES', 15))),
+        'kwargs': {'mode': 'incremental'},
+    },
+    'full-subscriber-sync': {
+        'task': 'subscribers.tasks.sync_all_publications',
+        'schedule': timedelta(hours=int(os.getenv('SUBSCRIBERS_FULL_SYNC_INTERVAL_HOURS', 24))),
+        'kwargs': {'mode': 'full'},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -151,17 +198,108 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 CORS_ALLOW_ALL_ORIGINS = True
 
-# Add these lines for more detailed error reporting
+# Subscriber sync: incremental syncs run in between full reconciles, which
+# are needed to pick up deletions and changes to older subscribers.
+SUBSCRIBERS_FULL_SYNC_INTERVAL_HOURS = int(os.getenv('SUBSCRIBERS_FULL_SYNC_INTERVAL_HOURS', 24))
+
+# Records upserted per transaction during a sync. Full syncs checkpoint
+# after every batch and resume from there if interrupted (within the full
+# sync interval).
+SUBSCRIBERS_SYNC_BATCH_SIZE = int(os.getenv('SUBSCRIBERS_SYNC_BATCH_SIZE', 1000))
+
+# Subscriber API responses are fresh for SUBSCRIBERS_CACHE_TTL seconds and
+# may be served stale (while refreshed in the background) for
+# SUBSCRIBERS_CACHE_STALE_TTL seconds after that.
+SUBSCRIBERS_CACHE_TTL = int(os.getenv('SUBSCRIBERS_CACHE_TTL', 300))
+SUBSCRIBERS_CACHE_STALE_TTL = int(os.getenv('SUBSCRIBERS_CACHE_STALE_TTL', 86400))
+
+# Full syncs, and incremental ones once the latest snapshot is
+# SUBSCRIBER_SNAPSHOT_INTERVAL seconds old, archive the subscribers' stats
+# under SUBSCRIBER_SNAPSHOT_DIR (see subscribers.snapshots); set it to an
+# empty string to turn this off. A local directory only works if the web
+# service and the workers share a filesystem. Snapshots older than
+# SUBSCRIBER_SNAPSHOT_RETENTION_DAYS are deleted (0 keeps them all).
+SUBSCRIBER_SNAPSHOT_DIR = os.getenv('SUBSCRIBER_SNAPSHOT_DIR', str(BASE_DIR / 'snapshots'))
+SUBSCRIBER_SNAPSHOT_INTERVAL = int(os.getenv('SUBSCRIBER_SNAPSHOT_INTERVAL', 86400))
+SUBSCRIBER_SNAPSHOT_RETENTION_DAYS = int(os.getenv('SUBSCRIBER_SNAPSHOT_RETENTION_DAYS', 365))
+
+# With SUBSCRIBER_SNAPSHOT_BUCKET set, snapshots go to that S3-compatible
+# bucket instead (django-storages; credentials from the AWS_* variables),
+# where the web service and the workers both reach them.
+if os.getenv('SUBSCRIBER_SNAPSHOT_BUCKET'):
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        'snapshots': {
+            'BACKEND': 'storages.backends.s3.S3Storage',
+            'OPTIONS': {
+                'bucket_name': os.getenv('SUBSCRIBER_SNAPSHOT_BUCKET'),
+                'location': os.getenv('SUBSCRIBER_SNAPSHOT_PREFIX', 'snapshots'),
+                'endpoint_url': os.getenv('AWS_S3_ENDPOINT_URL') or None,
+                'file_overwrite': False,
+            },
+        },
+    }
+
+# Beehiiv webhooks: deliveries older than WEBHOOK_SIGNATURE_TOLERANCE
+# seconds are refused; queued events are applied WEBHOOK_APPLY_DELAY
+# seconds after the first one arrives, up to WEBHOOK_BATCH_SIZE at a time.
+WEBHOOK_SIGNATURE_TOLERANCE = int(os.getenv('WEBHOOK_SIGNATURE_TOLERANCE', 300))
+WEBHOOK_APPLY_DELAY = int(os.getenv('WEBHOOK_APPLY_DELAY', 2))
+WEBHOOK_BATCH_SIZE = int(os.getenv('WEBHOOK_BATCH_SIZE', 1000))
+
+# A sync holds a per-publication lock for at most this many seconds
+SUBSCRIBERS_SYNC_LOCK_TIMEOUT = int(os.getenv('SUBSCRIBERS_SYNC_LOCK_TIMEOUT', 3600))
+
+# Parallel page fetches per sync, and the request rate allowed per API key
+# (shared by every publication and worker using that key).
+BEEHIIV_SYNC_CONCURRENCY = int(os.getenv('BEEHIIV_SYNC_CONCURRENCY', 4))
+BEEHIIV_REQUESTS_PER_SECOND = float(os.getenv('BEEHIIV_REQUESTS_PER_SECOND', 2.5))
+
+# HTTP transport: keep-alive pool size (defaults to the concurrency),
+# timeouts in seconds and retries for 5xx/429/connection errors.
+BEEHIIV_POOL_SIZE = int(os.getenv('BEEHIIV_POOL_SIZE', 0)) or None
+BEEHIIV_CONNECT_TIMEOUT = float(os.getenv('BEEHIIV_CONNECT_TIMEOUT', 5))
+BEEHIIV_READ_TIMEOUT = float(os.getenv('BEEHIIV_READ_TIMEOUT', 30))
+BEEHIIV_MAX_RETRIES = int(os.getenv('BEEHIIV_MAX_RETRIES', 5))
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'subscribers.renderers.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Logging
+# LOG_LEVEL controls the app loggers (default INFO); DEBUG adds per-page
+# request details.
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'structured': {
+            'format': '%(asctime)s level=%(levelname)s logger=%(name)s %(message)s',
+        },
+    },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
+            'formatter': 'structured',
         },
     },
     'root': {
         'handlers': ['console'],
-        'level': 'DEBUG',
+        'level': 'WARNING',
+    },
+    'loggers': {
+        'subscribers': {
+            'level': LOG_LEVEL,
+        },
+        'django': {
+            'level': os.getenv('DJANGO_LOG_LEVEL', 'INFO').upper(),
+        },
     },
 }
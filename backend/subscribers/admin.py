@@ -1,3 +1,21 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import RankingPreset, Subscriber, SyncState
+
+
+@admin.register(Subscriber)
+class SubscriberAdmin(admin.ModelAdmin):
+    list_display = ('email', 'status', 'publication_id', 'created_at', 'open_rate', 'click_rate', 'engagement_rank')
+    list_filter = ('status', 'publication_id')
+    search_fields = ('email', 'beehiiv_id')
+
+
+@admin.register(SyncState)
+class SyncStateAdmin(admin.ModelAdmin):
+    list_display = ('publication_id', 'last_synced_at', 'subscriber_count')
+
+
+@admin.register(RankingPreset)
+class RankingPresetAdmin(admin.ModelAdmin):
+    list_display = ('publication_id', 'name', 'is_default')
+    list_filter = ('publication_id',)
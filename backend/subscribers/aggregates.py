@@ -0,0 +1,47 @@
+from .enrichment import stat_value
+
+
+class SubscriberAggregator:
+    """Streaming summary of subscriber records.
+
+    Feed records with ``add``/``add_many`` as they arrive and read the
+    totals with ``result()``; memory use does not depend on how many
+    records went through.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.active = 0
+        self.clicked_once = 0
+        self.total_clicks = 0
+        self.open_rate_sum = 0.0
+        self.click_rate_sum = 0.0
+
+    def add(self, subscriber):
+        stats = subscriber.get('stats') or {}
+        self.total += 1
+        if subscriber.get('status') == 'active':
+            self.active += 1
+        if stat_value(stats, 'total_unique_clicked') >= 1:
+            self.clicked_once += 1
+        self.total_clicks += stat_value(stats, 'total_clicked')
+        self.open_rate_sum += stat_value(stats, 'open_rate')
+        self.click_rate_sum += stat_value(stats, 'click_rate')
+
+    def add_many(self, subscribers):
+        for subscriber in subscribers:
+            self.add(subscriber)
+
+    def result(self):
+        total = self.total
+        percent_clicked_once = (self.clicked_once / total * 100) if total > 0 else 0
+        return {
+            'total_subscribers': total,
+            'active_subscribers': self.active,
+            'inactive_subscribers': total - self.active,
+            'subscribers_clicked': self.clicked_once,
+            'percent_clicked_once': round(percent_clicked_once, 1),
+            'total_clicks': self.total_clicks,
+            'average_open_rate': round(self.open_rate_sum / total, 2) if total else 0,
+            'average_click_rate': round(self.click_rate_sum / total, 2) if total else 0,
+        }
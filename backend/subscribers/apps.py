@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SubscribersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'subscribers'
+
+    def ready(self):
+        # Connects the signals that invalidate the cached publication list
+        from . import publications  # noqa: F401
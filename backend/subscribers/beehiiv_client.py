@@ -1,95 +1,254 @@
-import os
-import requests
+import asyncio
+import logging
 from dotenv import load_dotenv
-import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .aggregates import SubscriberAggregator
+from .transport import (
+    DEFAULT_CONNECT_TIMEOUT, DEFAULT_MAX_RETRIES, DEFAULT_READ_TIMEOUT,
+    DEFAULT_REQUESTS_PER_SECOND, AsyncBeehiivTransport, BeehiivAPIError, BeehiivTransport
+)
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+BEEHIIV_API_URL = "https://api.beehiiv.com/v2"
+
+
+def subscriptions_request(base_url, publication_id, page, limit, order_by=None, direction=None):
+    """URL and query params of one page of a publication's subscriptions."""
+    url = f"{base_url}/publications/{publication_id}/subscriptions"
+
+    # Updated expand parameters based on Beehiiv API documentation
+    params = {
+        "limit": limit,
+        "page": page,
+        "expand[]": ["stats", "utm_data"]  # Changed from subscription_stats to stats
+    }
+    if order_by:
+        params["order_by"] = order_by
+    if direction:
+        params["direction"] = direction
+    return url, params
+
+
+def check_response(response, page):
+    """Raise BeehiivAPIError for anything but a 200."""
+    if response.status_code != 200:
+        logger.warning(
+            "Beehiiv API returned %s for page %s: %s",
+            response.status_code, page, response.text[:500]
+        )
+        raise BeehiivAPIError(
+            response.status_code,
+            retry_after=response.headers.get("Retry-After")
+        )
+
+
 class BeehiivClient:
-    def __init__(self, api_key, publication_id):
+    def __init__(self, api_key, publication_id, concurrency=1,
+                 requests_per_second=DEFAULT_REQUESTS_PER_SECOND, pool_size=None,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, base_url=BEEHIIV_API_URL, rate_limiter=None):
         self.api_key = api_key
         self.publication_id = publication_id
-        self.base_url = "https://api.beehiiv.com/v2"
-        self.session = requests.Session()
-        self.session.headers.update({
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        })
-        
-    def get_subscribers(self, page=1, limit=100):
-        url = f"{self.base_url}/publications/{self.publication_id}/subscriptions"
-        
-        headers = {
-            "Accept": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        
-        # Updated expand parameters based on Beehiiv API documentation
-        params = {
-            "limit": limit,
-            "page": page,
-            "expand[]": ["stats", "utm_data"]  # Changed from subscription_stats to stats
-        }
+        self.base_url = base_url
+        self.concurrency = concurrency
+        # One pooled connection per concurrent page fetch
+        self.transport = BeehiivTransport(
+            api_key,
+            pool_size=pool_size or max(concurrency, 1),
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            max_retries=max_retries,
+            requests_per_second=requests_per_second,
+            rate_limiter=rate_limiter,
+        )
+        self.session = self.transport.session
+        self.rate_limiter = self.transport.rate_limiter
         
+    def get_subscribers(self, page=1, limit=100, order_by=None, direction=None):
+        url, params = subscriptions_request(self.base_url, self.publication_id, page, limit, order_by, direction)
+        logger.debug("Fetching subscribers page %s (limit %s)", page, limit)
+        response = self.transport.get(url, params=params)
+        check_response(response, page)
+        return response.json()
+
+    def iter_pages(self, concurrency=None, limit=1000, start_page=1):
+        """Yield the subscriber list one page at a time, from ``start_page`` on.
+
+        With ``concurrency`` > 1 up to that many pages are fetched ahead of
+        the consumer by a thread pool; pages are still yielded in order.
+        """
+        concurrency = concurrency or self.concurrency
+        if concurrency > 1:
+            yield from self._iter_pages_concurrently(concurrency, limit, start_page)
+            return
+
+        page = start_page
+        while True:
+            subscribers = self.get_subscribers(page=page, limit=limit).get('data', [])
+            if not subscribers:  # No more results
+                break
+            yield subscribers
+            page += 1
+
+    def _iter_pages_concurrently(self, concurrency, limit, start_page=1):
+        first = self.get_subscribers(page=start_page, limit=limit)
+        subscribers = first.get('data', [])
+        if not subscribers:
+            return
+        yield subscribers
+
+        # When the API tells us how many pages there are we fetch exactly
+        # those; otherwise we keep going until a page comes back empty.
+        total_pages = first.get('total_pages')
+        next_page = start_page + 1
+        in_flight = deque()
+        executor = ThreadPoolExecutor(max_workers=concurrency)
         try:
-            print("Making request with params:", params)
-            response = requests.get(url, headers=headers, params=params)
-            print(f"Full URL with params: {response.request.url}")
-            print(f"Response status: {response.status_code}")
-            
-            if response.status_code == 200:
-                raw_data = response.json()
-                if 'data' in raw_data and raw_data['data']:
-                    # Log the first subscriber's data structure
-                    print("First subscriber data structure:", 
-                          json.dumps(raw_data['data'][0], indent=2))
-                return raw_data
-            else:
-                print(f"Error response: {response.text}")
-                raise Exception(f"API Error (Status {response.status_code})")
-                
-        except Exception as e:
-            print(f"Request failed: {str(e)}")
-            raise
-
-    def get_all_subscribers(self):
+            while True:
+                while len(in_flight) < concurrency and (total_pages is None or next_page <= total_pages):
+                    in_flight.append(executor.submit(self.get_subscribers, next_page, limit))
+                    next_page += 1
+                if not in_flight:
+                    break
+
+                subscribers = in_flight.popleft().result().get('data', [])
+                if not subscribers:
+                    break
+                yield subscribers
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def iter_subscribers(self, concurrency=None):
+        """Yield subscribers one by one while only holding a page or so in memory."""
+        for page in self.iter_pages(concurrency=concurrency):
+            yield from page
+
+    def get_all_subscribers(self, concurrency=None):
         """Fetch all subscribers by automatically handling pagination"""
-        all_subscribers = []
-        page = 1
-        limit = 1000  # Maximum allowed by Beehiiv API
-        
+        return list(self.iter_subscribers(concurrency=concurrency))
+
+    def get_subscriber_metrics(self, include_subscribers=True):
+        """Summary stats for the publication, computed in a single pass.
+
+        Pass ``include_subscribers=False`` to get just the numbers without
+        keeping the subscriber list in memory.
+        """
+        aggregator = SubscriberAggregator()
+        subscribers = [] if include_subscribers else None
+
+        for page in self.iter_pages():
+            aggregator.add_many(page)
+            if include_subscribers:
+                subscribers.extend(page)
+
+        metrics = aggregator.result()
+        logger.debug(
+            "Metrics for %s: %s subscribers, %s%% clicked at least once",
+            self.publication_id, metrics['total_subscribers'], metrics['percent_clicked_once']
+        )
+
+        if include_subscribers:
+            metrics['subscribers'] = subscribers
+        return metrics
+
+
+class AsyncBeehiivClient:
+    """asyncio version of BeehiivClient for use in async views.
+
+    Requests go through one keep-alive ``httpx.AsyncClient``; while they are
+    in flight the event loop keeps serving other requests. Use it as an
+    async context manager (or call ``aclose()``) to release the connections.
+    """
+
+    def __init__(self, api_key, publication_id, concurrency=1,
+                 requests_per_second=DEFAULT_REQUESTS_PER_SECOND, pool_size=None,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, base_url=BEEHIIV_API_URL, rate_limiter=None):
+        self.api_key = api_key
+        self.publication_id = publication_id
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.transport = AsyncBeehiivTransport(
+            api_key,
+            pool_size=pool_size or max(concurrency, 1),
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            max_retries=max_retries,
+            requests_per_second=requests_per_second,
+            rate_limiter=rate_limiter,
+        )
+        self.rate_limiter = self.transport.rate_limiter
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+    async def get_subscribers(self, page=1, limit=100, order_by=None, direction=None):
+        url, params = subscriptions_request(self.base_url, self.publication_id, page, limit, order_by, direction)
+        logger.debug("Fetching subscribers page %s (limit %s)", page, limit)
+        response = await self.transport.get(url, params=params)
+        check_response(response, page)
+        return response.json()
+
+    async def iter_pages(self, concurrency=None, limit=1000, start_page=1):
+        """Yield the subscriber list one page at a time, like ``BeehiivClient.iter_pages``.
+
+        With ``concurrency`` > 1 up to that many page requests run at once
+        as tasks on the event loop; pages are still yielded in order.
+        """
+        concurrency = concurrency or self.concurrency
+        if concurrency > 1:
+            async for subscribers in self._iter_pages_concurrently(concurrency, limit, start_page):
+                yield subscribers
+            return
+
+        page = start_page
         while True:
-            response = self.get_subscribers(page=page, limit=limit)
-            subscribers = response.get('data', [])
-            
+            subscribers = (await self.get_subscribers(page=page, limit=limit)).get('data', [])
             if not subscribers:  # No more results
                 break
-                
-            all_subscribers.extend(subscribers)
+            yield subscribers
             page += 1
-            
-        return all_subscribers
 
-    def get_subscriber_metrics(self):
-        subscribers = self.get_all_subscribers()  # Use get_all_subscribers instead of get_subscribers
-        
-        total_subscribers = len(subscribers)
-        
-        # Count subscribers who have clicked at least once
-        subscribers_with_clicks = sum(
-            1 for sub in subscribers 
-            if sub.get('stats', {}).get('total_unique_clicked', 0) >= 1
-        )
-        
-        # Calculate percentage of subscribers who clicked at least once
-        percent_clicked_once = (subscribers_with_clicks / total_subscribers * 100) if total_subscribers > 0 else 0
-        
-        print(f"Debug: Total subscribers: {total_subscribers}")
-        print(f"Debug: Subscribers who clicked at least once: {subscribers_with_clicks}")
-        print(f"Debug: Percentage: {percent_clicked_once}%")
-        
-        return {
-            'total_subscribers': total_subscribers,
-            'percent_clicked_once': round(percent_clicked_once, 1),
-            'subscribers': subscribers
-        }
\ No newline at end of file
+    async def _iter_pages_concurrently(self, concurrency, limit, start_page=1):
+        first = await self.get_subscribers(page=start_page, limit=limit)
+        subscribers = first.get('data', [])
+        if not subscribers:
+            return
+        yield subscribers
+
+        total_pages = first.get('total_pages')
+        next_page = start_page + 1
+        in_flight = deque()
+        try:
+            while True:
+                while len(in_flight) < concurrency and (total_pages is None or next_page <= total_pages):
+                    in_flight.append(asyncio.ensure_future(self.get_subscribers(next_page, limit)))
+                    next_page += 1
+                if not in_flight:
+                    break
+
+                subscribers = (await in_flight.popleft()).get('data', [])
+                if not subscribers:
+                    break
+                yield subscribers
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    async def get_all_subscribers(self, concurrency=None):
+        """Fetch all subscribers by automatically handling pagination"""
+        subscribers = []
+        async for page in self.iter_pages(concurrency=concurrency):
+            subscribers.extend(page)
+        return subscribers
@@ -0,0 +1,116 @@
+"""Churn analytics, computed once per sync and stored in ChurnReport.
+
+``histogram`` counts unsubscribed readers per days-to-unsubscribe bucket.
+``cohorts`` groups readers by signup month; ``survival`` is the share of
+a cohort still subscribed N days after signing up, left as None while the
+cohort is younger than N days.
+"""
+import logging
+
+import numpy as np
+from django.utils import timezone
+
+from .enrichment import DATETIME_UNIT, to_datetime64
+from .models import ChurnReport, Subscriber
+
+logger = logging.getLogger(__name__)
+
+# Bucket edges in days; the last bucket is open-ended
+HISTOGRAM_EDGES = (0, 1, 7, 30, 90, 180, 365)
+SURVIVAL_DAYS = (30, 90, 180, 365)
+
+
+def _bucket_label(index):
+    low = HISTOGRAM_EDGES[index]
+    if index + 1 == len(HISTOGRAM_EDGES):
+        return f'{low}+'
+    high = HISTOGRAM_EDGES[index + 1] - 1
+    return str(low) if low == high else f'{low}-{high}'
+
+
+def days_histogram(days):
+    """Counts of ``days`` per HISTOGRAM_EDGES bucket."""
+    buckets = np.searchsorted(HISTOGRAM_EDGES[1:], days, side='right')
+    counts = np.bincount(buckets, minlength=len(HISTOGRAM_EDGES))
+    return [
+        {'bucket': _bucket_label(index), 'min_days': HISTOGRAM_EDGES[index], 'count': int(count)}
+        for index, count in enumerate(counts)
+    ]
+
+
+def cohort_survival(created, days, inactive, now):
+    """Per signup month: size, active count and survival at SURVIVAL_DAYS."""
+    known = ~np.isnat(created)
+    months = created[known].astype('datetime64[M]')
+    if not len(months):
+        return []
+    cohorts, inverse = np.unique(months, return_inverse=True)
+    days, inactive = days[known], inactive[known]
+
+    sizes = np.bincount(inverse, minlength=len(cohorts))
+    active = np.bincount(inverse, weights=~inactive, minlength=len(cohorts))
+    # A cohort is old enough for day N once its last signup is N days old
+    cohort_ends = (cohorts + np.timedelta64(1, 'M')).astype(DATETIME_UNIT)
+    age_days = (to_datetime64(now) - cohort_ends) / np.timedelta64(1, 'D')
+
+    survival = {}
+    for threshold in SURVIVAL_DAYS:
+        churned = np.bincount(
+            inverse, weights=inactive & (np.nan_to_num(days, nan=np.inf) < threshold),
+            minlength=len(cohorts),
+        )
+        rate = np.round(1 - churned / sizes, 4)
+        survival[threshold] = np.where(age_days >= threshold, rate, np.nan)
+
+    return [
+        {
+            'month': str(month),
+            'subscribers': int(sizes[i]),
+            'active': int(active[i]),
+            'survival': {
+                str(threshold): None if np.isnan(values[i]) else float(values[i])
+                for threshold, values in survival.items()
+            },
+        }
+        for i, month in enumerate(cohorts)
+    ]
+
+
+def compute_churn(created, days, inactive, now):
+    """Churn analytics for parallel arrays of signup dates, days to unsubscribe and status."""
+    churned_days = days[inactive & ~np.isnan(days)]
+    return {
+        'subscribers': len(created),
+        'unsubscribed': int(inactive.sum()),
+        'median_days_to_unsubscribe': float(np.median(churned_days)) if len(churned_days) else None,
+        'histogram': days_histogram(churned_days),
+        'cohorts': cohort_survival(created, days, inactive, now),
+    }
+
+
+def load_churn_columns(publication_id):
+    rows = Subscriber.objects.filter(publication_id=publication_id).values_list(
+        'created_at', 'status', 'days_to_unsubscribe'
+    )
+    created, statuses, days = [], [], []
+    for created_at, status, days_to_unsubscribe in rows.iterator(chunk_size=5000):
+        created.append(None if created_at is None else to_datetime64(created_at))
+        statuses.append(status == 'inactive')
+        days.append(np.nan if days_to_unsubscribe is None else days_to_unsubscribe)
+    return (
+        np.array(created, dtype=DATETIME_UNIT),
+        np.array(days, dtype=float),
+        np.array(statuses, dtype=bool),
+    )
+
+
+def refresh_churn(publication_id, now=None):
+    """Recompute and store the publication's ChurnReport."""
+    now = now or timezone.now()
+    created, days, inactive = load_churn_columns(publication_id)
+    report, _ = ChurnReport.objects.update_or_create(
+        publication_id=publication_id,
+        defaults={'computed_at': now, **compute_churn(created, days, inactive, now)},
+    )
+    logger.debug('Churn for %s: %s of %s unsubscribed', publication_id, report.unsubscribed, report.subscribers)
+    return report
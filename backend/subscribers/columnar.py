@@ -0,0 +1,53 @@
+"""Packed string columns for the columnar snapshot format.
+
+A list of Python strings costs an object header per value; ``StringArray``
+keeps them in one UTF-8 buffer addressed by an offsets array, which is
+also how snapshots store subscriber ids (see ``snapshots``).
+"""
+import numpy as np
+
+
+class StringArray:
+    """Unique strings packed into one UTF-8 buffer, addressed by offsets."""
+    __slots__ = ('buffer', 'offsets')
+
+    def __init__(self, buffer=b'', offsets=None):
+        self.buffer = buffer
+        self.offsets = np.zeros(1, dtype=np.int64) if offsets is None else offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [(value or '').encode() for value in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return cls(b''.join(encoded), offsets)
+
+    @classmethod
+    def concat(cls, arrays):
+        arrays = list(arrays)
+        if not arrays:
+            return cls()
+        offsets = [arrays[0].offsets]
+        shift = arrays[0].offsets[-1]
+        for array in arrays[1:]:
+            offsets.append(array.offsets[1:] + shift)
+            shift += array.offsets[-1]
+        return cls(b''.join(array.buffer for array in arrays), np.concatenate(offsets))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]].decode()
+
+    def take(self, indices):
+        return [self[int(index)] for index in indices]
+
+    def tolist(self):
+        bounds = self.offsets.tolist()
+        buffer = self.buffer
+        return [buffer[start:end].decode() for start, end in zip(bounds, bounds[1:])]
+
+    @property
+    def nbytes(self):
+        return len(self.buffer) + self.offsets.nbytes
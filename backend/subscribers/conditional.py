@@ -0,0 +1,75 @@
+"""Conditional, precompressed responses for cached API payloads.
+
+``encode_content`` turns a rendered payload into what the response cache
+stores: the bytes, their gzip (and, when the ``brotli`` package is
+installed, brotli) compressed forms and an ETag of the content. Cache
+hits then cost neither serialization nor compression, and
+``encoded_response`` answers a matching ``If-None-Match`` or
+``If-Modified-Since`` with an empty 304.
+"""
+import gzip
+import hashlib
+import re
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+# Bodies this small aren't worth compressing (same cut-off as GZipMiddleware)
+MIN_COMPRESSED_SIZE = 200
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Preferred first
+ENCODINGS = ('br', 'gzip')
+
+
+def encode_content(content, last_modified=None):
+    """Cache entry for rendered ``content``; ``last_modified`` is a datetime or None."""
+    encodings = {}
+    if len(content) >= MIN_COMPRESSED_SIZE:
+        encodings['gzip'] = gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0)
+        if brotli is not None:
+            encodings['br'] = brotli.compress(content, quality=BROTLI_QUALITY)
+    return {
+        'content': content,
+        'encodings': encodings,
+        # Weak: the compressed forms are the same representation
+        'etag': f'W/"{hashlib.md5(content).hexdigest()}"',
+        'last_modified': int(last_modified.timestamp()) if last_modified else None,
+    }
+
+
+def accepted_encoding(request, available):
+    """The preferred encoding in ``available`` that the request accepts, or None."""
+    accepted = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if not re.search(r'q\s*=\s*0(\.0*)?\s*$', params):
+            accepted.add(coding.strip().lower())
+    for encoding in ENCODINGS:
+        if encoding in available and (encoding in accepted or '*' in accepted):
+            return encoding
+    return None
+
+
+def encoded_response(request, encoded, status=200, content_type='application/json'):
+    """Response for an ``encode_content`` entry: 304, compressed or plain."""
+    encoding = accepted_encoding(request, encoded['encodings'])
+    body = encoded['encodings'][encoding] if encoding else encoded['content']
+    response = HttpResponse(body, status=status, content_type=content_type)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['ETag'] = encoded['etag']
+    if encoded['last_modified'] is not None:
+        response['Last-Modified'] = http_date(encoded['last_modified'])
+    # Browsers keep the body but revalidate it on every load
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return get_conditional_response(
+        request, etag=encoded['etag'], last_modified=encoded['last_modified'], response=response
+    )
@@ -0,0 +1,43 @@
+import json
+import os
+
+from django.conf import settings
+
+from .beehiiv_client import AsyncBeehiivClient, BeehiivClient
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'config.json')
+
+
+def load_config():
+    """Read the legacy single-publication ``config.json``.
+
+    Publications now live in the database (see ``subscribers.publications``),
+    which imports this file once. Raises FileNotFoundError /
+    json.JSONDecodeError when it is missing or corrupt.
+    """
+    with open(CONFIG_PATH, 'r') as f:
+        return json.load(f)
+
+
+def _client_options(config, rate_limiter):
+    return dict(
+        api_key=config['api_key'],
+        publication_id=config['publication_id'],
+        concurrency=settings.BEEHIIV_SYNC_CONCURRENCY,
+        requests_per_second=settings.BEEHIIV_REQUESTS_PER_SECOND,
+        pool_size=settings.BEEHIIV_POOL_SIZE,
+        connect_timeout=settings.BEEHIIV_CONNECT_TIMEOUT,
+        read_timeout=settings.BEEHIIV_READ_TIMEOUT,
+        max_retries=settings.BEEHIIV_MAX_RETRIES,
+        rate_limiter=rate_limiter,
+    )
+
+
+def build_client(config, rate_limiter=None):
+    """Create a BeehiivClient for a publication config using the sync settings."""
+    return BeehiivClient(**_client_options(config, rate_limiter))
+
+
+def build_async_client(config, rate_limiter=None):
+    """Create an AsyncBeehiivClient for a publication config using the sync settings."""
+    return AsyncBeehiivClient(**_client_options(config, rate_limiter))
@@ -0,0 +1,162 @@
+"""Derived subscriber fields, computed a page at a time.
+
+Timestamps arrive as unix seconds or ISO strings in one of
+``DATE_FORMATS``. A page is parsed in one go: the format is detected from
+the first value and the whole column is converted into a numpy
+``datetime64`` array, falling back to value-by-value parsing only when a
+page mixes formats.
+"""
+import logging
+from datetime import datetime, timezone
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DATE_FORMATS = [
+    '%Y-%m-%dT%H:%M:%S.%fZ',
+    '%Y-%m-%dT%H:%M:%SZ',
+    '%Y-%m-%d %H:%M:%S'
+]
+
+# Beehiiv has used a couple of names for the same stat over time
+STAT_ALIASES = {
+    'total_received': ('total_received', 'emails_received'),
+    'open_rate': ('open_rate',),
+    'click_rate': ('click_rate', 'click_through_rate'),
+    'total_clicked': ('total_clicked',),
+    'total_unique_clicked': ('total_unique_clicked',),
+}
+
+UTM_FIELDS = ('utm_source', 'utm_medium', 'utm_channel', 'utm_campaign')
+
+DATETIME_UNIT = 'datetime64[us]'
+DAY = np.timedelta64(1, 'D')
+
+
+def stat_value(stats, field):
+    """A subscriber stat by its current name or any older alias (0 when missing)."""
+    for key in STAT_ALIASES[field]:
+        value = stats.get(key)
+        if value is not None:
+            return value
+    return 0
+
+
+def utm_value(record, field):
+    """A UTM field, either top-level or inside the expanded ``utm_data``."""
+    return record.get(field) or (record.get('utm_data') or {}).get(field) or ''
+
+
+def parse_timestamp(value):
+    """Parse a Beehiiv timestamp (unix seconds or one of DATE_FORMATS)."""
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=timezone.utc)
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+    return None
+
+
+def detect_format(values):
+    """The DATE_FORMATS entry matching the first string in ``values``, if any."""
+    for value in values:
+        if isinstance(value, str) and value:
+            for date_format in DATE_FORMATS:
+                try:
+                    datetime.strptime(value, date_format)
+                    return date_format
+                except ValueError:
+                    continue
+            return None
+    return None
+
+
+def _parse_one_by_one(values):
+    parsed = [parse_timestamp(value) for value in values]
+    return np.array(
+        [None if ts is None else ts.replace(tzinfo=None) for ts in parsed], dtype=DATETIME_UNIT
+    )
+
+
+def parse_dates(values):
+    """Parse a column of timestamps into a UTC ``datetime64[us]`` array (NaT when missing)."""
+    values = list(values)
+    if not values:
+        return np.array([], dtype=DATETIME_UNIT)
+
+    present = [value for value in values if value not in (None, '')]
+    if all(isinstance(value, (int, float)) for value in present):
+        seconds = np.array([np.nan if value in (None, '') else value for value in values], dtype=float)
+        result = np.full(len(values), np.datetime64('NaT'), dtype=DATETIME_UNIT)
+        known = ~np.isnan(seconds)
+        result[known] = (seconds[known] * 1_000_000).astype('int64').astype(DATETIME_UNIT)
+        return result
+
+    if detect_format(present) is not None and all(isinstance(value, str) for value in present):
+        # Every DATE_FORMATS layout is ISO 8601 once the "Z" is dropped
+        try:
+            return np.array(
+                [value.rstrip('Z') if value else 'NaT' for value in values],
+                dtype=DATETIME_UNIT,
+            )
+        except ValueError:
+            pass
+    return _parse_one_by_one(values)
+
+
+def to_datetime64(moment):
+    """A timezone-aware ``datetime`` as a UTC ``datetime64[us]`` scalar."""
+    return np.datetime64(moment.astimezone(timezone.utc).replace(tzinfo=None), 'us')
+
+
+def to_datetimes(array):
+    """Aware ``datetime`` objects (or None) for a ``datetime64`` array."""
+    return [
+        None if value is None else value.replace(tzinfo=timezone.utc)
+        for value in array.astype(DATETIME_UNIT).tolist()
+    ]
+
+
+def days_between(start, end):
+    """Whole days from ``start`` to ``end`` (never negative; NaN where either is missing)."""
+    days = ((end - start) / DAY).astype(float)
+    days = np.floor(days)
+    return np.where(np.isnan(days), np.nan, np.maximum(days, 0))
+
+
+def record_dates(records):
+    """Parsed ``(created, updated)`` arrays for a page of API records."""
+    created = parse_dates(record.get('created_at', record.get('created')) for record in records)
+    updated = parse_dates(record.get('updated_at') for record in records)
+    return created, updated
+
+
+def enrich_subscribers(records):
+    """Add the derived fields the dashboard shows to a page of raw API records.
+
+    Records are updated in place. Returns the parsed ``(created, updated)``
+    arrays so callers can reuse them.
+    """
+    created, updated = record_dates(records)
+    days = days_between(created, updated)
+
+    for record, value in zip(records, days.tolist()):
+        if record.get('status') == 'inactive':
+            record['days_to_unsubscribe'] = None if value != value else int(value)
+    return created, updated
+
+
+def enrich_subscriber(subscriber):
+    enrich_subscribers([subscriber])
+    return subscriber
+
+
+def calculate_days_to_unsubscribe(subscriber):
+    if subscriber.get('status') != 'inactive':
+        return None
+    return enrich_subscriber(dict(subscriber)).get('days_to_unsubscribe')
@@ -0,0 +1,166 @@
+"""UTM facet index: subscriber counts and engagement per UTM combination.
+
+Full syncs rebuild a publication's facets with one GROUP BY. Incremental
+syncs apply deltas instead: before a page is upserted the current
+contribution of its existing rows is read, and each touched combination
+gets ``new - old`` added. Breakdowns by any subset of the UTM fields are
+then aggregated from the (small) facet table.
+"""
+from collections import defaultdict
+
+from django.db.models import Count, Q, Sum
+
+from .enrichment import UTM_FIELDS
+from .models import Subscriber, UtmFacet
+
+COUNTERS = ('subscribers', 'active', 'clicked_once', 'total_clicks', 'open_rate_sum', 'click_rate_sum')
+CONTRIBUTION_FIELDS = ('status', 'open_rate', 'click_rate', 'total_clicked', 'total_unique_clicked')
+
+
+class InvalidFacet(ValueError):
+    pass
+
+
+def contribution(status, open_rate, click_rate, total_clicked, total_unique_clicked):
+    """One subscriber's share of its facet's COUNTERS."""
+    return (
+        1,
+        1 if status == 'active' else 0,
+        1 if (total_unique_clicked or 0) >= 1 else 0,
+        total_clicked or 0,
+        open_rate or 0,
+        click_rate or 0,
+    )
+
+
+def stored_contributions(publication_id, beehiiv_ids):
+    """``[(utm key, contribution)]`` of the stored rows among ``beehiiv_ids``."""
+    rows = Subscriber.objects.filter(
+        publication_id=publication_id, beehiiv_id__in=list(beehiiv_ids)
+    ).values_list(*UTM_FIELDS, *CONTRIBUTION_FIELDS)
+    return [(row[:len(UTM_FIELDS)], contribution(*row[len(UTM_FIELDS):])) for row in rows]
+
+
+def object_contributions(subscribers):
+    """``[(utm key, contribution)]`` of unsaved Subscriber objects."""
+    return [
+        (
+            tuple(getattr(subscriber, field) for field in UTM_FIELDS),
+            contribution(*(getattr(subscriber, field) for field in CONTRIBUTION_FIELDS)),
+        )
+        for subscriber in subscribers
+    ]
+
+
+def apply_deltas(publication_id, removed, added):
+    """Move the ``removed`` contributions out of, and ``added`` into, their facets."""
+    deltas = defaultdict(lambda: [0] * len(COUNTERS))
+    for sign, contributions in ((-1, removed), (1, added)):
+        for key, values in contributions:
+            delta = deltas[key]
+            for i, value in enumerate(values):
+                delta[i] += sign * value
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+
+    condition = Q()
+    for key in deltas:
+        condition |= Q(**dict(zip(UTM_FIELDS, key)))
+    current = {
+        tuple(getattr(facet, field) for field in UTM_FIELDS): facet
+        for facet in UtmFacet.objects.filter(condition, publication_id=publication_id)
+    }
+
+    changed, emptied = [], []
+    for key, delta in deltas.items():
+        facet = current.get(key) or UtmFacet(publication_id=publication_id, **dict(zip(UTM_FIELDS, key)))
+        for field, value in zip(COUNTERS, delta):
+            setattr(facet, field, getattr(facet, field) + value)
+        if facet.subscribers <= 0:
+            if facet.pk:
+                emptied.append(facet.pk)
+        else:
+            changed.append(facet)
+
+    if emptied:
+        UtmFacet.objects.filter(pk__in=emptied).delete()
+    UtmFacet.objects.bulk_create(
+        changed,
+        update_conflicts=True,
+        unique_fields=['publication_id', *UTM_FIELDS],
+        update_fields=list(COUNTERS),
+    )
+
+
+def rebuild_facets(publication_id):
+    """Recompute every facet of a publication from the subscriber table."""
+    rows = (
+        Subscriber.objects.filter(publication_id=publication_id).order_by()
+        .values(*UTM_FIELDS)
+        .annotate(
+            subscribers=Count('id'),
+            active=Count('id', filter=Q(status='active')),
+            clicked_once=Count('id', filter=Q(total_unique_clicked__gte=1)),
+            total_clicks=Sum('total_clicked'),
+            open_rate_sum=Sum('open_rate'),
+            click_rate_sum=Sum('click_rate'),
+        )
+    )
+    facets = [
+        UtmFacet(publication_id=publication_id, **{
+            **row, 'total_clicks': row['total_clicks'] or 0,
+            'open_rate_sum': row['open_rate_sum'] or 0, 'click_rate_sum': row['click_rate_sum'] or 0,
+        })
+        for row in rows
+    ]
+    UtmFacet.objects.filter(publication_id=publication_id).delete()
+    UtmFacet.objects.bulk_create(facets, batch_size=1000)
+    return len(facets)
+
+
+def has_facets(publication_id):
+    return UtmFacet.objects.filter(publication_id=publication_id).exists()
+
+
+def parse_group_by(value):
+    if not value:
+        return list(UTM_FIELDS)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in UTM_FIELDS]
+    if unknown or not fields:
+        raise InvalidFacet(f'Unknown facet fields: {", ".join(unknown)}')
+    return fields
+
+
+def facet_breakdown(publication_id, group_by=UTM_FIELDS):
+    """Counts and engagement per combination of the ``group_by`` UTM fields, largest first."""
+    rows = (
+        UtmFacet.objects.filter(publication_id=publication_id)
+        .values(*group_by)
+        .annotate(**{counter: Sum(counter) for counter in COUNTERS})
+        .order_by('-subscribers', *group_by)
+    )
+    facets = []
+    for row in rows:
+        total = row['subscribers']
+        facets.append({
+            **{field: row[field] for field in group_by},
+            'subscribers': total,
+            'active': row['active'],
+            'clicked_once': row['clicked_once'],
+            'percent_clicked_once': round(row['clicked_once'] / total * 100, 1) if total else 0,
+            'total_clicks': row['total_clicks'],
+            'average_open_rate': round(row['open_rate_sum'] / total, 2) if total else 0,
+            'average_click_rate': round(row['click_rate_sum'] / total, 2) if total else 0,
+        })
+    return facets
+
+
+def source_channels(publication_id):
+    """Distinct "source/channel" pairs (empty values as "-"), as the table filter shows them."""
+    pairs = (
+        UtmFacet.objects.filter(publication_id=publication_id)
+        .order_by().values_list('utm_source', 'utm_channel').distinct()
+    )
+    return sorted({f'{source or "-"}/{channel or "-"}' for source, channel in pairs})
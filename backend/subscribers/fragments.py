@@ -0,0 +1,45 @@
+"""Subscriber rows serialized once per data version and cached as bytes.
+
+A page of the subscriber table is its rows' JSON joined together, and the
+same rows turn up under many filters, sorts and pages. Each row is
+therefore rendered once per version of the publication's data (a sync or
+webhook batch bumps it) and kept in the cache; a page reads its ids and
+sort keys from the database, fetches the cached rows in one round trip
+and only loads and renders the ones missing.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .instrumentation import serialization_seconds
+from .models import Subscriber
+from .queries import subscriber_row
+from .renderers import dumps
+from .response_cache import ENTRY_FORMAT, data_version
+
+ROW_COLUMNS = ('data', 'engagement_rank', 'engagement_percentile')
+
+
+def fragment_key(publication_id, version, pk):
+    return f'subscribers:{publication_id}:row:v{ENTRY_FORMAT}:{version}:{pk}'
+
+
+def subscriber_fragments(publication_id, ids):
+    """The rendered rows of the subscribers with primary keys ``ids``, in that order.
+
+    Rows deleted in the meantime are left out.
+    """
+    version = data_version(publication_id)
+    keys = {pk: fragment_key(publication_id, version, pk) for pk in ids}
+    fragments = cache.get_many(list(keys.values()))
+
+    missing = [pk for pk in ids if keys[pk] not in fragments]
+    if missing:
+        rows = Subscriber.objects.filter(publication_id=publication_id, id__in=missing).values_list(
+            'id', *ROW_COLUMNS
+        )
+        with serialization_seconds.time(view='subscriber-rows'):
+            rendered = {keys[pk]: dumps(subscriber_row(*values)) for pk, *values in rows}
+        cache.set_many(rendered, timeout=settings.SUBSCRIBERS_CACHE_TTL + settings.SUBSCRIBERS_CACHE_STALE_TTL)
+        fragments.update(rendered)
+
+    return [fragments[keys[pk]] for pk in ids if keys[pk] in fragments]
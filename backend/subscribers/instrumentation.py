@@ -0,0 +1,210 @@
+"""Counters and histograms, exposed in Prometheus text format.
+
+Metrics recorded by the Celery workers (syncs, enrichment, Beehiiv API
+requests) are ``shared``: with the Redis cache their values live in one
+Redis hash per metric, so the web process's ``/metrics`` reports every
+worker's syncs. Other metrics, and all of them without Redis (where
+tasks run in the web process anyway), are kept in process memory; those
+cover only the process that answers the scrape.
+"""
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{value}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def shared_client():
+    """The Redis client behind the default cache, or None if the cache is not Redis."""
+    backend = caches['default']
+    if isinstance(backend, RedisCache):
+        return backend._cache.get_client(write=True)
+    return None
+
+
+def _number(raw):
+    value = float(raw)
+    return int(value) if value.is_integer() else value
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=(), shared=False):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.shared = shared
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def _client(self):
+        return shared_client() if self.shared else None
+
+    def _hash(self, suffix=''):
+        return f'metrics:{self.name}{suffix}'
+
+    def _read(self, suffix=''):
+        """``{label values: number}`` stored in this metric's Redis hash."""
+        return {
+            tuple(json.loads(field)): _number(value)
+            for field, value in self._client().hgetall(self._hash(suffix)).items()
+        }
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        client = self._client()
+        if client is not None:
+            client.hincrbyfloat(self._hash(), json.dumps(key), amount)
+            return
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def _values(self):
+        if self._client() is not None:
+            return self._read()
+        with self.lock:
+            return dict(self.values)
+
+    def value(self, **labels):
+        return self._values().get(self._key(labels), 0)
+
+    def render(self):
+        lines = self.header()
+        for key, value in sorted(self._values().items()):
+            lines.append(f'{self.name}{_format_labels(self.label_names, key)} {value}')
+        return lines
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        client = self._client()
+        if client is not None:
+            client.hset(self._hash(), json.dumps(key), value)
+            return
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS, shared=False):
+        super().__init__(name, documentation, labels, shared)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        bucket = bisect.bisect_left(self.buckets, value)
+        client = self._client()
+        if client is not None:
+            # Bucket counts and sums in two hashes, written in one round trip
+            pipeline = client.pipeline(transaction=False)
+            pipeline.hincrby(self._hash(':buckets'), json.dumps([*key, bucket]), 1)
+            pipeline.hincrbyfloat(self._hash(':sum'), json.dumps(key), value)
+            pipeline.execute()
+            return
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bucket] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _values(self):
+        """``{label values: (bucket counts, sum)}``."""
+        if self._client() is None:
+            with self.lock:
+                return {key: (list(counts), total) for key, (counts, total) in self.values.items()}
+        values = {key: ([0] * (len(self.buckets) + 1), float(total)) for key, total in self._read(':sum').items()}
+        for (*key, bucket), count in self._read(':buckets').items():
+            values.setdefault(tuple(key), ([0] * (len(self.buckets) + 1), 0.0))[0][bucket] = count
+        return values
+
+    def count(self, **labels):
+        counts, _ = self._values().get(self._key(labels), ([0], 0.0))
+        return sum(counts)
+
+    def render(self):
+        lines = self.header()
+        for key, (counts, total) in sorted(self._values().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                labels = _format_labels(self.label_names + ('le',), key + (bound,))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.label_names, key)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+api_request_seconds = registry.register(Histogram(
+    'beehiiv_api_request_seconds', 'Latency of Beehiiv API requests', labels=('status',), shared=True
+))
+sync_pages = registry.register(Counter(
+    'subscriber_sync_pages_total', 'API pages stored by subscriber syncs', labels=('mode',), shared=True
+))
+sync_records = registry.register(Counter(
+    'subscriber_sync_records_total', 'Subscriber records stored by syncs', labels=('mode',), shared=True
+))
+sync_seconds = registry.register(Histogram(
+    'subscriber_sync_seconds', 'Duration of subscriber syncs', labels=('mode',), shared=True
+))
+sync_records_per_second = registry.register(Gauge(
+    'subscriber_sync_records_per_second', 'Throughput of the most recent sync', labels=('mode',), shared=True
+))
+enrichment_seconds = registry.register(Histogram(
+    'subscriber_enrichment_seconds', 'Time spent enriching one page of subscribers', shared=True
+))
+serialization_seconds = registry.register(Histogram(
+    'api_serialization_seconds', 'Time spent rendering API responses', labels=('view',)
+))
@@ -0,0 +1,43 @@
+"""Expiring locks in the shared cache.
+
+A lock is a cache key holding a random token, taken with ``cache.add``.
+Only the holder of the token may release it, and on Redis the check and
+the delete are one atomic script: a lock that expired and was taken by
+another worker in the meantime is never deleted by the previous holder.
+"""
+import secrets
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+
+# Deletes KEYS[1] only if it still holds the token ARGV[1]
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def acquire_lock(key, timeout):
+    """Take the lock ``key`` for at most ``timeout`` seconds; returns its token, or None if it is held."""
+    # An int, which Django's Redis cache stores as is rather than pickled,
+    # so the release script can compare it
+    token = secrets.randbits(63)
+    if cache.add(key, token, timeout=timeout):
+        return token
+    return None
+
+
+def release_lock(key, token):
+    """Release the lock ``key`` if ``token`` still holds it; returns whether it did."""
+    # ``cache`` is a proxy; the backend behind it decides how to release
+    backend = caches['default']
+    if isinstance(backend, RedisCache):
+        client = backend._cache.get_client(key, write=True)
+        return bool(client.eval(RELEASE_SCRIPT, 1, backend.make_and_validate_key(key), token))
+    # Other backends (local memory in development) have no compare-and-delete
+    if cache.get(key) == token:
+        cache.delete(key)
+        return True
+    return False
@@ -1,27 +1,93 @@
-from django.core.management.base import BaseCommand
-from subscribers.beehiiv_client import BeehiivClient
-import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from subscribers.config import build_client
+from subscribers.publications import client_pool, get_publication, key_rate_limiter
+from subscribers.sync import sync_publication
+from subscribers.tasks import acquire_sync_lock, release_sync_lock
+
+# Seconds between progress lines (every batch is reported with -v 2)
+PROGRESS_INTERVAL = 2
+
 
 class Command(BaseCommand):
-    help = 'Fetch subscribers from Beehiiv API'
+    help = 'Sync subscribers from the Beehiiv API into the local store'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode',
+            choices=['auto', 'full', 'incremental'],
+            default='auto',
+            help='Full reconcile, incremental delta, or let the sync decide (default)',
+        )
+        parser.add_argument(
+            '--publication',
+            help='Publication ID to sync (default: the default publication)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.SUBSCRIBERS_SYNC_BATCH_SIZE,
+            help='Records upserted per transaction (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.BEEHIIV_SYNC_CONCURRENCY,
+            help='Pages fetched ahead while a batch is written (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--rps', type=float,
+            help='Beehiiv requests per second for this API key (default: BEEHIIV_REQUESTS_PER_SECOND)',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Ignore the checkpoint of an interrupted full sync and start from page 1',
+        )
 
     def handle(self, *args, **options):
-        client = BeehiivClient()
+        config = get_publication(options['publication'])
+        if config is None:
+            raise CommandError('Publication is not configured')
+        if options['batch_size'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--batch-size and --concurrency must be positive')
+
+        if options['rps']:
+            rate_limiter = key_rate_limiter(config['api_key'], options['rps'])
+        else:
+            rate_limiter = client_pool.limiter(config['api_key'])
+        client = build_client(config, rate_limiter=rate_limiter)
+        client.concurrency = options['concurrency']
+
+        started = time.monotonic()
+        last_report = [0.0]
+
+        def progress(pages, records):
+            now = time.monotonic()
+            if options['verbosity'] < 2 and now - last_report[0] < PROGRESS_INTERVAL:
+                return
+            last_report[0] = now
+            elapsed = now - started
+            self.stdout.write(
+                f'{pages} pages, {records} records stored, {records / elapsed if elapsed else 0:.0f} records/s'
+            )
+
+        # The same lock as the sync task, so the command never overlaps a worker's sync
+        token = acquire_sync_lock(config['publication_id'])
+        if token is None:
+            raise CommandError(f"A sync of {config['publication_id']} is already running; try again once it finishes")
+
+        self.stdout.write(f"Syncing {config['publication_id']} ({options['mode']})...")
         try:
-            # Add debug info before making the request
-            self.stdout.write(self.style.SUCCESS('Attempting to fetch subscribers...'))
-            subscribers = client.get_subscribers(limit=10)  # Start with a smaller limit for testing
-            
-            # Print raw response first
-            self.stdout.write(self.style.SUCCESS('Raw response:'))
-            self.stdout.write(json.dumps(subscribers, indent=2))
-            
-            # Then try to process the data
-            self.stdout.write(self.style.SUCCESS(f'Successfully fetched subscribers'))
-            for subscriber in subscribers.get('data', [])[:5]:
-                self.stdout.write(json.dumps(subscriber, indent=2))
+            count = sync_publication(
+                client, mode=options['mode'], progress=progress,
+                batch_size=options['batch_size'], resume=not options['restart'],
+            )
+        except KeyboardInterrupt:
+            raise CommandError('Interrupted; run the command again to resume the full sync')
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Error fetching subscribers: {str(e)}'))
-            # Print more error details if available
-            if hasattr(e, 'response'):
-                self.stdout.write(self.style.ERROR(f'Response content: {e.response.content}'))
\ No newline at end of file
+            raise CommandError(f'Error syncing subscribers: {e}') from e
+        finally:
+            release_sync_lock(config['publication_id'], token)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Synced {count} subscribers in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f} records/s)'
+        ))
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import time
+
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+from subscribers.models import WebhookEvent
+from subscribers.publications import get_publication
+from subscribers.webhooks import SIGNATURE_HEADER, TIMESTAMP_HEADER, sign
+
+from benchmarks.mock_api import synthetic_subscriber
+
+DEFAULT_URL = 'http://localhost:8000/api/webhooks/beehiiv/{publication_id}/'
+
+
+def synthetic_events(count, seed=0):
+    """``count`` subscription events for the mock API's synthetic subscribers."""
+    for index in range(count):
+        record = synthetic_subscriber(index, seed)
+        event_type = 'subscription.unsubscribed' if record['status'] == 'inactive' else 'subscription.updated'
+        yield {'uid': f'evt_{seed}_{index:08d}', 'event_type': event_type, 'data': record}
+
+
+def file_events(path):
+    """Events from a file with one JSON event per line."""
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    raise CommandError(f'{path}:{number}: {e}') from e
+
+
+class Command(BaseCommand):
+    help = 'Replay Beehiiv webhook events against the webhook endpoint, signed, and report events/s'
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--file', help='Newline-delimited JSON events to send')
+        source.add_argument('--synthetic', type=int, help='Send this many generated events')
+        source.add_argument(
+            '--from-db', action='store_true',
+            help="Resend the publication's stored events (they are redeliveries, so only new ones are queued)",
+        )
+        parser.add_argument(
+            '--publication',
+            help='Publication ID to send to (default: the default publication)',
+        )
+        parser.add_argument('--url', help=f'Endpoint (default: {DEFAULT_URL})')
+        parser.add_argument('--secret', help="Signing secret (default: the publication's webhook secret)")
+        parser.add_argument(
+            '--batch', type=int, default=1,
+            help='Events per delivery (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=8,
+            help='Deliveries in flight at once (default: %(default)s)',
+        )
+
+    def handle(self, *args, **options):
+        config = get_publication(options['publication'])
+        if config is None:
+            raise CommandError('Publication is not configured')
+        secret = options['secret'] or config['webhook_secret']
+        if not secret:
+            raise CommandError('The publication has no webhook secret; pass --secret')
+        if options['batch'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--batch and --concurrency must be positive')
+
+        publication_id = config['publication_id']
+        if options['file']:
+            events = list(file_events(options['file']))
+        elif options['synthetic'] is not None:
+            events = list(synthetic_events(options['synthetic']))
+        else:
+            events = list(
+                WebhookEvent.objects.filter(publication_id=publication_id)
+                .order_by('id').values_list('payload', flat=True)
+            )
+        url = options['url'] or DEFAULT_URL.format(publication_id=publication_id)
+        batches = [events[i:i + options['batch']] for i in range(0, len(events), options['batch'])]
+
+        self.stdout.write(f'Sending {len(events)} events in {len(batches)} deliveries to {url}...')
+        started = time.monotonic()
+        failures = asyncio.run(self.send(url, secret, batches, options['batch'] == 1, options['concurrency']))
+        elapsed = time.monotonic() - started
+
+        if failures:
+            raise CommandError(f'{len(failures)} deliveries failed, e.g. {failures[0]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Sent {len(events)} events in {elapsed:.1f}s ({len(events) / elapsed if elapsed else 0:.0f} events/s)'
+        ))
+
+    async def send(self, url, secret, batches, single, concurrency):
+        """POST every batch, ``concurrency`` at a time; returns the failures."""
+        failures = []
+        pending = iter(batches)
+
+        async def worker(client):
+            for batch in pending:
+                body = json.dumps(batch[0] if single else batch).encode()
+                timestamp = str(int(time.time()))
+                headers = {
+                    'Content-Type': 'application/json',
+                    TIMESTAMP_HEADER: timestamp,
+                    SIGNATURE_HEADER: f'sha256={sign(secret, timestamp, body)}',
+                }
+                try:
+                    response = await client.post(url, content=body, headers=headers)
+                    if response.status_code >= 300:
+                        failures.append(f'HTTP {response.status_code}: {response.text[:200]}')
+                except httpx.HTTPError as e:
+                    failures.append(str(e))
+
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+            await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        return failures
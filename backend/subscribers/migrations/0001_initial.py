@@ -0,0 +1,50 @@
+# Generated by Django 5.1.5 on 2026-10-18 08:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('publication_id', models.CharField(max_length=64, unique=True)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('subscriber_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Subscriber',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('publication_id', models.CharField(max_length=64)),
+                ('beehiiv_id', models.CharField(max_length=64)),
+                ('email', models.CharField(blank=True, default='', max_length=254)),
+                ('status', models.CharField(blank=True, default='', max_length=32)),
+                ('created_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(blank=True, null=True)),
+                ('total_received', models.IntegerField(default=0)),
+                ('open_rate', models.FloatField(default=0)),
+                ('click_rate', models.FloatField(default=0)),
+                ('total_clicked', models.IntegerField(default=0)),
+                ('total_unique_clicked', models.IntegerField(default=0)),
+                ('utm_source', models.CharField(blank=True, default='', max_length=255)),
+                ('utm_medium', models.CharField(blank=True, default='', max_length=255)),
+                ('utm_channel', models.CharField(blank=True, default='', max_length=255)),
+                ('utm_campaign', models.CharField(blank=True, default='', max_length=255)),
+                ('data', models.JSONField(default=dict)),
+                ('synced_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['publication_id', 'status'], name='subscribers_publica_c9378e_idx'), models.Index(fields=['publication_id', 'created_at'], name='subscribers_publica_882d92_idx'), models.Index(fields=['publication_id', 'open_rate'], name='subscribers_publica_b813df_idx'), models.Index(fields=['publication_id', 'click_rate'], name='subscribers_publica_65c5fc_idx'), models.Index(fields=['publication_id', 'total_clicked'], name='subscribers_publica_38031d_idx'), models.Index(fields=['publication_id', 'total_unique_clicked'], name='subscribers_publica_166fc3_idx')],
+                'constraints': [models.UniqueConstraint(fields=('publication_id', 'beehiiv_id'), name='unique_subscriber_per_publication')],
+            },
+        ),
+    ]
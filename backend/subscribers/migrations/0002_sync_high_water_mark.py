@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-18 08:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncstate',
+            name='high_water_mark',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='syncstate',
+            name='last_full_sync_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
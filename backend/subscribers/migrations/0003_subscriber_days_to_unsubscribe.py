@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 08:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0002_sync_high_water_mark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscriber',
+            name='days_to_unsubscribe',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
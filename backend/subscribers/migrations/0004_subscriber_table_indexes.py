@@ -0,0 +1,29 @@
+# Generated by Django 5.1.5 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0003_subscriber_days_to_unsubscribe'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(fields=['publication_id', 'total_received'], name='subscribers_publica_3a5349_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(fields=['publication_id', 'days_to_unsubscribe'], name='subscribers_publica_b1a042_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(fields=['publication_id', 'email'], name='subscribers_publica_9638ca_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(fields=['publication_id', 'utm_source', 'utm_channel'], name='subscribers_publica_0a6319_idx'),
+        ),
+    ]
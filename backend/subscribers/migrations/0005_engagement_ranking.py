@@ -0,0 +1,46 @@
+# Generated by Django 5.1.5 on 2026-10-18 08:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0004_subscriber_table_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankingPreset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('publication_id', models.CharField(max_length=64)),
+                ('name', models.CharField(max_length=64)),
+                ('weights', models.JSONField(default=dict)),
+                ('is_default', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='subscriber',
+            name='engagement_percentile',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='subscriber',
+            name='engagement_rank',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='subscriber',
+            name='engagement_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(fields=['publication_id', 'engagement_rank'], name='subscribers_publica_ecbc98_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='rankingpreset',
+            constraint=models.UniqueConstraint(fields=('publication_id', 'name'), name='unique_ranking_preset_name'),
+        ),
+    ]
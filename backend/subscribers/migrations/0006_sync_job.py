@@ -0,0 +1,31 @@
+# Generated by Django 5.1.5 on 2026-10-18 08:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0005_engagement_ranking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('publication_id', models.CharField(max_length=64)),
+                ('mode', models.CharField(default='auto', max_length=16)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed'), ('skipped', 'Skipped')], default='queued', max_length=16)),
+                ('pages_fetched', models.IntegerField(default=0)),
+                ('records_synced', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['publication_id', '-created_at'], name='subscribers_publica_0516f2_idx')],
+            },
+        ),
+    ]
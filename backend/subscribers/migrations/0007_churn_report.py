@@ -0,0 +1,26 @@
+# Generated by Django 5.1.5 on 2026-10-18 08:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0006_sync_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChurnReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('publication_id', models.CharField(max_length=64, unique=True)),
+                ('computed_at', models.DateTimeField()),
+                ('subscribers', models.IntegerField(default=0)),
+                ('unsubscribed', models.IntegerField(default=0)),
+                ('median_days_to_unsubscribe', models.FloatField(blank=True, null=True)),
+                ('histogram', models.JSONField(default=list)),
+                ('cohorts', models.JSONField(default=list)),
+            ],
+        ),
+    ]
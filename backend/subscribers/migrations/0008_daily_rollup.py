@@ -0,0 +1,36 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0007_churn_report'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('publication_id', models.CharField(max_length=64)),
+                ('date', models.DateField()),
+                ('computed_at', models.DateTimeField(blank=True, null=True)),
+                ('total_subscribers', models.IntegerField(blank=True, null=True)),
+                ('active_subscribers', models.IntegerField(blank=True, null=True)),
+                ('inactive_subscribers', models.IntegerField(blank=True, null=True)),
+                ('subscribers_clicked', models.IntegerField(blank=True, null=True)),
+                ('total_clicks', models.BigIntegerField(blank=True, null=True)),
+                ('open_rate_sum', models.FloatField(blank=True, null=True)),
+                ('click_rate_sum', models.FloatField(blank=True, null=True)),
+                ('open_rate_distribution', models.JSONField(default=list)),
+                ('click_rate_distribution', models.JSONField(default=list)),
+                ('new_subscribers', models.IntegerField(default=0)),
+                ('unsubscribed', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('publication_id', 'date'), name='unique_daily_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0008_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UtmFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('publication_id', models.CharField(max_length=64)),
+                ('utm_source', models.CharField(blank=True, default='', max_length=255)),
+                ('utm_medium', models.CharField(blank=True, default='', max_length=255)),
+                ('utm_channel', models.CharField(blank=True, default='', max_length=255)),
+                ('utm_campaign', models.CharField(blank=True, default='', max_length=255)),
+                ('subscribers', models.IntegerField(default=0)),
+                ('active', models.IntegerField(default=0)),
+                ('clicked_once', models.IntegerField(default=0)),
+                ('total_clicks', models.BigIntegerField(default=0)),
+                ('open_rate_sum', models.FloatField(default=0)),
+                ('click_rate_sum', models.FloatField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('publication_id', 'utm_source', 'utm_medium', 'utm_channel', 'utm_campaign'), name='unique_utm_facet')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0009_utm_facet'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Publication',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('publication_id', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(blank=True, default='', max_length=255)),
+                ('api_key', models.CharField(max_length=255)),
+                ('is_default', models.BooleanField(default=False)),
+                ('enabled', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
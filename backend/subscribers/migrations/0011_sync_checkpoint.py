@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0010_publication'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncstate',
+            name='checkpoint_page',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='syncstate',
+            name='checkpoint_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
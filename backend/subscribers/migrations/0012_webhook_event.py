@@ -0,0 +1,35 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0011_sync_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='publication',
+            name='webhook_secret',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('publication_id', models.CharField(max_length=64)),
+                ('event_id', models.CharField(max_length=128)),
+                ('event_type', models.CharField(max_length=64)),
+                ('subscriber_id', models.CharField(max_length=64)),
+                ('payload', models.JSONField(default=dict)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['publication_id', 'processed_at', 'id'], name='subscribers_publica_b62f18_idx')],
+                'constraints': [models.UniqueConstraint(fields=('publication_id', 'event_id'), name='unique_webhook_event')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0012_webhook_event'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(fields=['publication_id', 'engagement_score'], name='subscribers_publica_98adde_idx'),
+        ),
+    ]
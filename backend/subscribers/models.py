@@ -1,3 +1,324 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class Publication(models.Model):
+    """A Beehiiv publication this deployment serves, with its API key.
+
+    Read through ``subscribers.publications``, which caches the list in
+    process; saving or deleting a row invalidates that cache everywhere.
+    """
+    publication_id = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, blank=True, default='')
+    api_key = models.CharField(max_length=255)
+    # Shared secret webhook deliveries are signed with; webhooks are refused without one
+    webhook_secret = models.CharField(max_length=255, blank=True, default='')
+    is_default = models.BooleanField(default=False)
+    enabled = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name or self.publication_id
+
+    def as_config(self):
+        return {
+            'api_key': self.api_key,
+            'publication_id': self.publication_id,
+            'name': self.name,
+            'is_default': self.is_default,
+            'webhook_secret': self.webhook_secret,
+        }
+
+
+class Subscriber(models.Model):
+    """Local copy of a Beehiiv subscription, filled by the sync job.
+
+    The full API record is kept in ``data`` so the API can return it
+    unchanged; the fields the dashboard sorts and filters on are copied
+    into real columns so they can be indexed.
+    """
+    publication_id = models.CharField(max_length=64)
+    beehiiv_id = models.CharField(max_length=64)
+    email = models.CharField(max_length=254, blank=True, default='')
+    status = models.CharField(max_length=32, blank=True, default='')
+    created_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(null=True, blank=True)
+    days_to_unsubscribe = models.IntegerField(null=True, blank=True)
+
+    # Flattened `stats`
+    total_received = models.IntegerField(default=0)
+    open_rate = models.FloatField(default=0)
+    click_rate = models.FloatField(default=0)
+    total_clicked = models.IntegerField(default=0)
+    total_unique_clicked = models.IntegerField(default=0)
+
+    # Flattened `utm_data`
+    utm_source = models.CharField(max_length=255, blank=True, default='')
+    utm_medium = models.CharField(max_length=255, blank=True, default='')
+    utm_channel = models.CharField(max_length=255, blank=True, default='')
+    utm_campaign = models.CharField(max_length=255, blank=True, default='')
+
+    # Filled by subscribers.ranking after each sync; rank 1 is the most engaged
+    engagement_score = models.FloatField(null=True, blank=True)
+    engagement_rank = models.IntegerField(null=True, blank=True)
+    engagement_percentile = models.FloatField(null=True, blank=True)
+
+    data = models.JSONField(default=dict)
+    synced_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['publication_id', 'beehiiv_id'],
+                name='unique_subscriber_per_publication',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['publication_id', 'status']),
+            models.Index(fields=['publication_id', 'created_at']),
+            models.Index(fields=['publication_id', 'open_rate']),
+            models.Index(fields=['publication_id', 'click_rate']),
+            models.Index(fields=['publication_id', 'total_clicked']),
+            models.Index(fields=['publication_id', 'total_unique_clicked']),
+            models.Index(fields=['publication_id', 'total_received']),
+            models.Index(fields=['publication_id', 'days_to_unsubscribe']),
+            models.Index(fields=['publication_id', 'email']),
+            models.Index(fields=['publication_id', 'utm_source', 'utm_channel']),
+            models.Index(fields=['publication_id', 'engagement_rank']),
+            models.Index(fields=['publication_id', 'engagement_score']),
+        ]
+
+    def __str__(self):
+        return self.email or self.beehiiv_id
+
+
+class SyncState(models.Model):
+    """Bookkeeping for the last sync of a publication.
+
+    ``high_water_mark`` is the newest created/updated timestamp seen so far;
+    incremental syncs only fetch records past it.
+
+    While a full sync runs, ``checkpoint_page`` is the last page it has
+    committed and ``checkpoint_started_at`` the sync's start (the
+    ``synced_at`` of its rows), so an interrupted sync can be resumed.
+    """
+    publication_id = models.CharField(max_length=64, unique=True)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    last_full_sync_at = models.DateTimeField(null=True, blank=True)
+    high_water_mark = models.DateTimeField(null=True, blank=True)
+    subscriber_count = models.IntegerField(default=0)
+    checkpoint_page = models.IntegerField(null=True, blank=True)
+    checkpoint_started_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.publication_id
+
+
+class SyncJob(models.Model):
+    """One run of the background sync task, with its progress."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    SKIPPED = 'skipped'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+        (SKIPPED, 'Skipped'),
+    ]
+
+    publication_id = models.CharField(max_length=64)
+    mode = models.CharField(max_length=16, default='auto')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    pages_fetched = models.IntegerField(default=0)
+    records_synced = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['publication_id', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.publication_id} {self.mode} sync ({self.status})'
+
+    @property
+    def duration_seconds(self):
+        if not self.started_at:
+            return None
+        end = self.finished_at or timezone.now()
+        return round((end - self.started_at).total_seconds(), 1)
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'publication_id': self.publication_id,
+            'mode': self.mode,
+            'status': self.status,
+            'pages_fetched': self.pages_fetched,
+            'records_synced': self.records_synced,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'duration_seconds': self.duration_seconds,
+            'error': self.error,
+        }
+
+
+class RankingPreset(models.Model):
+    """Named engagement weights for a publication.
+
+    ``weights`` maps Subscriber stat fields to their weight, e.g.
+    ``{"open_rate": 1, "click_rate": 2}``. The default preset is used by
+    the ranking that runs after every sync.
+    """
+    publication_id = models.CharField(max_length=64)
+    name = models.CharField(max_length=64)
+    weights = models.JSONField(default=dict)
+    is_default = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['publication_id', 'name'],
+                name='unique_ranking_preset_name',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.publication_id}: {self.name}'
+
+
+class ChurnReport(models.Model):
+    """Churn analytics of a publication, recomputed after every sync.
+
+    ``histogram`` buckets unsubscribed readers by days to unsubscribe and
+    ``cohorts`` holds survival by signup month (see ``subscribers.churn``).
+    """
+    publication_id = models.CharField(max_length=64, unique=True)
+    computed_at = models.DateTimeField()
+    subscribers = models.IntegerField(default=0)
+    unsubscribed = models.IntegerField(default=0)
+    median_days_to_unsubscribe = models.FloatField(null=True, blank=True)
+    histogram = models.JSONField(default=list)
+    cohorts = models.JSONField(default=list)
+
+    def __str__(self):
+        return f'{self.publication_id} churn'
+
+    def as_dict(self):
+        return {
+            'publication_id': self.publication_id,
+            'computed_at': self.computed_at,
+            'subscribers': self.subscribers,
+            'unsubscribed': self.unsubscribed,
+            'median_days_to_unsubscribe': self.median_days_to_unsubscribe,
+            'histogram': self.histogram,
+            'cohorts': self.cohorts,
+        }
+
+
+class DailyRollup(models.Model):
+    """Per-publication metrics for one day, written by the sync.
+
+    The snapshot fields (totals, sums and rate distributions) describe the
+    list as of the last sync that day and are null on days without a sync.
+    ``new_subscribers`` and ``unsubscribed`` count the day's signups and
+    unsubscribes and are backfilled from the stored dates, so trends
+    reach back before the first sync.
+    """
+    publication_id = models.CharField(max_length=64)
+    date = models.DateField()
+    computed_at = models.DateTimeField(null=True, blank=True)
+
+    total_subscribers = models.IntegerField(null=True, blank=True)
+    active_subscribers = models.IntegerField(null=True, blank=True)
+    inactive_subscribers = models.IntegerField(null=True, blank=True)
+    subscribers_clicked = models.IntegerField(null=True, blank=True)
+    total_clicks = models.BigIntegerField(null=True, blank=True)
+    open_rate_sum = models.FloatField(null=True, blank=True)
+    click_rate_sum = models.FloatField(null=True, blank=True)
+    # Subscriber counts per 10-point rate bucket (0-10, 10-20, ..., 90-100)
+    open_rate_distribution = models.JSONField(default=list)
+    click_rate_distribution = models.JSONField(default=list)
+
+    new_subscribers = models.IntegerField(default=0)
+    unsubscribed = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['publication_id', 'date'],
+                name='unique_daily_rollup',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.publication_id} {self.date}'
+
+
+class UtmFacet(models.Model):
+    """Subscriber counts and engagement totals for one UTM combination.
+
+    Kept up to date by the sync (see ``subscribers.facets``), so channel
+    breakdowns never have to scan the subscriber table.
+    """
+    publication_id = models.CharField(max_length=64)
+    utm_source = models.CharField(max_length=255, blank=True, default='')
+    utm_medium = models.CharField(max_length=255, blank=True, default='')
+    utm_channel = models.CharField(max_length=255, blank=True, default='')
+    utm_campaign = models.CharField(max_length=255, blank=True, default='')
+
+    subscribers = models.IntegerField(default=0)
+    active = models.IntegerField(default=0)
+    clicked_once = models.IntegerField(default=0)
+    total_clicks = models.BigIntegerField(default=0)
+    open_rate_sum = models.FloatField(default=0)
+    click_rate_sum = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['publication_id', 'utm_source', 'utm_medium', 'utm_channel', 'utm_campaign'],
+                name='unique_utm_facet',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.publication_id} {self.utm_source}/{self.utm_medium}/{self.utm_channel}/{self.utm_campaign}'
+
+
+class WebhookEvent(models.Model):
+    """A received Beehiiv webhook event, queued until it is applied.
+
+    ``payload`` is the event as delivered. Events are applied in batches
+    by ``subscribers.webhooks`` and marked with ``processed_at``.
+    """
+    publication_id = models.CharField(max_length=64)
+    event_id = models.CharField(max_length=128)
+    event_type = models.CharField(max_length=64)
+    subscriber_id = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # Redeliveries of an event are dropped
+            models.UniqueConstraint(
+                fields=['publication_id', 'event_id'],
+                name='unique_webhook_event',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['publication_id', 'processed_at', 'id']),
+        ]
+
+    def __str__(self):
+        return f'{self.publication_id} {self.event_type} {self.subscriber_id}'
@@ -0,0 +1,238 @@
+"""Configured publications, their pooled API clients and per-key rate limits.
+
+Publication configs live in the database and are cached in each process.
+The cache is checked against a version stamp kept in the shared cache;
+saving or deleting a Publication replaces the stamp, so every process
+reloads on its next read. A legacy ``config.json`` is imported on first
+use when the table is empty.
+
+Clients are pooled per publication and reused across requests and sync
+runs (async clients are created per use). Every client of one API key
+shares one ``CacheRateLimiter``, so the key's budget holds across
+publications, threads, event loops and (with Redis) workers.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import threading
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .config import build_async_client, build_client, load_config
+from .models import Publication
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'subscribers:publications:version'
+
+_lock = threading.Lock()
+_loaded = {'version': None, 'configs': []}
+
+
+def _current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate_publications():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+@receiver(post_save, sender=Publication)
+@receiver(post_delete, sender=Publication)
+def _publication_changed(sender, **kwargs):
+    invalidate_publications()
+
+
+def import_legacy_config():
+    """Create a Publication from ``config.json`` if one exists and the table is empty."""
+    if Publication.objects.exists():
+        return None
+    try:
+        config = load_config()
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if not config.get('api_key') or not config.get('publication_id'):
+        return None
+    logger.info('Importing publication %s from config.json', config['publication_id'])
+    publication, _ = Publication.objects.get_or_create(
+        publication_id=config['publication_id'],
+        defaults={'api_key': config['api_key'], 'is_default': True},
+    )
+    return publication
+
+
+def publication_configs():
+    """Configs of every enabled publication, default first."""
+    version = _current_version()
+    if _loaded['version'] != version:
+        with _lock:
+            if _loaded['version'] != version:
+                if import_legacy_config():
+                    version = _current_version()
+                publications = Publication.objects.filter(enabled=True).order_by('-is_default', 'id')
+                _loaded['configs'] = [publication.as_config() for publication in publications]
+                _loaded['version'] = version
+    return list(_loaded['configs'])
+
+
+def get_publication(publication_id=None):
+    """Config of ``publication_id``, or of the default publication; None if unknown."""
+    configs = publication_configs()
+    if publication_id:
+        return next((config for config in configs if config['publication_id'] == publication_id), None)
+    return configs[0] if configs else None
+
+
+def save_publication(api_key, publication_id, name=None, make_default=False, webhook_secret=None):
+    """Add or update a publication; the first one saved becomes the default."""
+    defaults = {'api_key': api_key, 'enabled': True}
+    if name is not None:
+        defaults['name'] = name
+    if webhook_secret is not None:
+        defaults['webhook_secret'] = webhook_secret
+    publication, _ = Publication.objects.update_or_create(publication_id=publication_id, defaults=defaults)
+    if make_default or not Publication.objects.filter(is_default=True).exists():
+        Publication.objects.exclude(pk=publication.pk).filter(is_default=True).update(is_default=False)
+        publication.is_default = True
+        publication.save(update_fields=['is_default'])
+    invalidate_publications()
+    return publication
+
+
+class CacheRateLimiter:
+    """Sliding-window request limit shared through the Django cache.
+
+    Allows ``rate`` requests per second for everyone using the same
+    ``name``. The window is sized so it holds a whole number of requests
+    (3 per 1.2s for a rate of 2.5), and the previous window's count is
+    weighted by how much of it still overlaps the last ``window`` seconds,
+    so a burst at the end of one window cannot be followed by a full one
+    at the start of the next. ``pause()`` holds all of them back, e.g. for
+    a 429's Retry-After. Same interface as ``TokenBucket``, including the
+    awaitable ``aacquire()``.
+    """
+
+    def __init__(self, name, rate):
+        self.prefix = f'subscribers:ratelimit:{name}'
+        self.capacity = max(1, math.ceil(rate))
+        self.window = self.capacity / rate
+
+    def reserve(self):
+        """Take a slot in the sliding window, or return the seconds to wait for one."""
+        while True:
+            now = time.time()
+            paused_until = cache.get(f'{self.prefix}:paused-until')
+            if paused_until and paused_until > now:
+                return paused_until - now
+
+            window, elapsed = divmod(now / self.window, 1)
+            window = int(window)
+            key = f'{self.prefix}:{window}'
+            # Kept through the next window, which weighs it
+            cache.add(key, 0, timeout=math.ceil(2 * self.window) + 5)
+            try:
+                used = cache.incr(key)
+            except ValueError:
+                continue  # the window expired between add and incr
+            previous = cache.get(f'{self.prefix}:{window - 1}') or 0
+            if previous * (1 - elapsed) + used <= self.capacity:
+                return 0
+
+            # Over the limit: give the slot back and wait until one frees up
+            cache.decr(key)
+            used -= 1
+            if used + 1 > self.capacity:
+                return (window + 1) * self.window - now
+            # The previous window's weight must fall by the overshoot
+            needed = 1 - (self.capacity - used - 1) / previous
+            return max((window + needed) * self.window - now, 0.001)
+
+    def acquire(self):
+        while True:
+            wait = self.reserve()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def aacquire(self):
+        while True:
+            # The cache may be a network round trip; keep it off the event loop
+            wait = await sync_to_async(self.reserve, thread_sensitive=False)()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        until = time.time() + seconds
+        key = f'{self.prefix}:paused-until'
+        if until > (cache.get(key) or 0):
+            cache.set(key, until, timeout=int(seconds) + 5)
+
+
+def _key_name(api_key):
+    # Never put the key itself into cache keys
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+def key_rate_limiter(api_key, rate):
+    """A limiter on ``api_key``'s shared request budget that allows ``rate`` requests per second."""
+    return CacheRateLimiter(_key_name(api_key), rate)
+
+
+class ClientPool:
+    """One reusable BeehiivClient per publication, rate limited per API key."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = {}
+        self.limiters = {}
+
+    def limiter(self, api_key):
+        name = _key_name(api_key)
+        limiter = self.limiters.get(name)
+        if limiter is None:
+            limiter = self.limiters.setdefault(name, key_rate_limiter(api_key, settings.BEEHIIV_REQUESTS_PER_SECOND))
+        return limiter
+
+    def get(self, config):
+        publication_id = config['publication_id']
+        with self.lock:
+            client = self.clients.get(publication_id)
+            if client is None or client.api_key != config['api_key']:
+                client = build_client(config, rate_limiter=self.limiter(config['api_key']))
+                self.clients[publication_id] = client
+            return client
+
+    def clear(self):
+        with self.lock:
+            self.clients.clear()
+            self.limiters.clear()
+
+
+client_pool = ClientPool()
+
+
+def get_client(config):
+    """The pooled client for a publication config."""
+    return client_pool.get(config)
+
+
+def get_async_client(config):
+    """A new AsyncBeehiivClient for a publication config, sharing its key's rate limit.
+
+    Async clients are not pooled: their connections belong to the event
+    loop that opened them. Use it as ``async with get_async_client(config)``.
+    """
+    return build_async_client(config, rate_limiter=client_pool.limiter(config['api_key']))
@@ -0,0 +1,231 @@
+import base64
+import json
+
+from django.db.models import Count, F, Field, Func, Q, Value
+from django.db.models.lookups import GreaterThan, LessThan
+
+from .models import Subscriber
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+# Sort keys accepted from the table, mapped onto indexed columns. The
+# frontend's column keys ("stats.open_rate", "utm_data") are accepted too.
+SORT_FIELDS = {
+    'email': ('email',),
+    'status': ('status',),
+    'created_at': ('created_at',),
+    'days_to_unsubscribe': ('days_to_unsubscribe',),
+    'total_received': ('total_received',),
+    'open_rate': ('open_rate',),
+    'click_rate': ('click_rate',),
+    'total_clicked': ('total_clicked',),
+    'total_unique_clicked': ('total_unique_clicked',),
+    'source_channel': ('utm_source', 'utm_channel'),
+    'engagement_rank': ('engagement_rank',),
+}
+SORT_ALIASES = {
+    'utm_data': 'source_channel',
+    'rank': 'engagement_rank',
+    'stats.total_received': 'total_received',
+    'stats.open_rate': 'open_rate',
+    'stats.click_rate': 'click_rate',
+    'stats.total_clicked': 'total_clicked',
+    'stats.total_unique_clicked': 'total_unique_clicked',
+}
+UTM_FILTERS = ('utm_source', 'utm_medium', 'utm_channel', 'utm_campaign')
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+def filter_subscribers(queryset, params):
+    """Apply the table's status, UTM and search filters from query params."""
+    status = params.get('status', 'all')
+    if status and status != 'all':
+        queryset = queryset.filter(status=status)
+
+    for field in UTM_FILTERS:
+        values = params.getlist(field)
+        if values:
+            queryset = queryset.filter(**{f'{field}__in': values})
+
+    # "source/channel" pairs as shown in the table; "-" means empty
+    pairs = [value for value in params.getlist('source_channel') if value != 'all']
+    if pairs:
+        condition = Q()
+        for pair in pairs:
+            source, _, channel = pair.partition('/')
+            condition |= Q(
+                utm_source='' if source == '-' else source,
+                utm_channel='' if channel == '-' else channel,
+            )
+        queryset = queryset.filter(condition)
+
+    search = params.get('search', '').strip()
+    if search:
+        queryset = queryset.filter(email__icontains=search)
+
+    return queryset
+
+
+def publication_totals(queryset):
+    totals = queryset.aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(status='active')),
+        clicked=Count('id', filter=Q(total_unique_clicked__gte=1)),
+    )
+    total = totals['total']
+    percent_clicked_once = (totals['clicked'] / total * 100) if total > 0 else 0
+    return {
+        'total_subscribers': total,
+        'active_subscribers': totals['active'],
+        'subscribers_clicked': totals['clicked'],
+        'percent_clicked_once': round(percent_clicked_once, 1),
+    }
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise InvalidQuery('Invalid cursor')
+
+
+class Row(Func):
+    """A row value, ``(a, b, ...)``, for comparing sort keys as one."""
+    template = '(%(expressions)s)'
+    output_field = Field()
+
+
+def _nullable(field):
+    return Subscriber._meta.get_field(field).null
+
+
+def _after(field, value, descending):
+    # NULLs sort last in both directions
+    if value is None:
+        return Q(pk__in=[])
+    lookup = 'lt' if descending else 'gt'
+    return Q(**{f'{field}__{lookup}': value}) | Q(**{f'{field}__isnull': True})
+
+
+def _equal(field, value):
+    if value is None:
+        return Q(**{f'{field}__isnull': True})
+    return Q(**{field: value})
+
+
+def keyset_condition(fields, values, descending):
+    """Rows strictly after ``values`` in (fields..., id) order."""
+    if not any(_nullable(field) for field in fields):
+        # One row comparison, which the (publication_id, field) indexes can range-scan
+        lookup = LessThan if descending else GreaterThan
+        return Q(lookup(Row(*fields, 'id'), Row(*(Value(value) for value in values))))
+    condition = Q(pk__in=[])
+    prefix = Q()
+    for field, value in zip(fields, values):
+        condition |= prefix & _after(field, value, descending)
+        prefix &= _equal(field, value)
+    return condition | (prefix & _after('id', values[-1], descending))
+
+
+def _cursor_values(fields, values):
+    """Turn JSON cursor values back into Python values for the lookups."""
+    if not isinstance(values, list) or len(values) != len(fields) + 1:
+        raise InvalidQuery('Invalid cursor')
+    try:
+        converted = [
+            None if value is None else Subscriber._meta.get_field(field).to_python(value)
+            for field, value in zip(fields, values)
+        ]
+        return converted + [int(values[-1])]
+    except Exception:
+        raise InvalidQuery('Invalid cursor')
+
+
+def _positive_int(params, name, default):
+    value = params.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise InvalidQuery(f'{name} must be an integer')
+    if value < 1:
+        raise InvalidQuery(f'{name} must be positive')
+    return value
+
+
+def order_subscribers(queryset, params, default_sort='created_at'):
+    """Order by the ``sort``/``direction`` params, with id as tie-breaker.
+
+    Returns the ordered queryset, the sort fields and whether it is descending.
+    """
+    sort = params.get('sort') or default_sort
+    sort = SORT_ALIASES.get(sort, sort)
+    if sort not in SORT_FIELDS:
+        raise InvalidQuery(f'Unknown sort key: {sort}')
+    direction = params.get('direction', 'asc')
+    if direction not in ('asc', 'desc'):
+        raise InvalidQuery('direction must be "asc" or "desc"')
+    descending = direction == 'desc'
+    fields = SORT_FIELDS[sort]
+
+    # Nullable columns sort their NULLs last; the others keep the plain
+    # order, which the (publication_id, field) indexes serve both ways
+    ordering = [
+        (F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True))
+        if _nullable(field) else (F(field).desc() if descending else F(field).asc())
+        for field in fields
+    ]
+    ordering.append('-id' if descending else 'id')
+    return queryset.order_by(*ordering), fields, descending
+
+
+def page_rows(queryset, params, columns):
+    """One sorted page of ``queryset`` as ``(*columns, id)`` rows, and the cursor for the next one.
+
+    ``cursor`` (from a previous response) continues after the last row seen
+    using the (sort key, id) index; ``page`` jumps to a page by offset.
+    """
+    queryset, fields, descending = order_subscribers(queryset, params)
+    limit = min(_positive_int(params, 'limit', DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+
+    offset = 0
+    cursor = params.get('cursor')
+    if cursor:
+        values = _cursor_values(fields, decode_cursor(cursor))
+        queryset = queryset.filter(keyset_condition(fields, values, descending))
+    else:
+        offset = (_positive_int(params, 'page', 1) - 1) * limit
+
+    width = len(columns) + 1
+    rows = list(queryset.values_list(*columns, 'id', *fields)[offset:offset + limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(list(last[width:]) + [last[width - 1]])
+    return [row[:width] for row in rows], next_cursor
+
+
+def subscriber_row(data, engagement_rank, engagement_percentile):
+    """A subscriber as the API returns it."""
+    return {**data, 'engagement_rank': engagement_rank, 'engagement_percentile': engagement_percentile}
+
+
+def paginate_subscriber_ids(queryset, params):
+    """Ids of one sorted page of ``queryset`` and the cursor for the next one.
+
+    Only ids and sort keys are read; the rows themselves come from
+    ``fragments.subscriber_fragments``.
+    """
+    rows, next_cursor = page_rows(queryset, params, ())
+    return [pk for pk, in rows], next_cursor
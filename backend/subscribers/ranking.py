@@ -0,0 +1,299 @@
+"""Engagement ranking of subscribers.
+
+Stats are loaded into NumPy arrays once per publication and scored in
+batch: every weighted field is normalised to [0, 1] (count fields on a
+log scale so a handful of heavy clickers do not flatten everyone else),
+and the score is the weighted mean of those columns.
+
+A full ranking keeps the bounds it normalised with, so changed
+subscribers (webhook updates) can be re-scored on the same scale without
+a full ranking (``rerank_subscribers``). Checking that the bounds still
+hold is one min/max query over the indexed stat columns; a few changed
+subscribers are then placed with an indexed count each, while larger
+batches load the stored scores once.
+"""
+import logging
+import time
+
+import numpy as np
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Max, Min
+
+from .models import RankingPreset, Subscriber
+
+logger = logging.getLogger(__name__)
+
+# The stored result of a ranking
+RANK_FIELDS = ('engagement_score', 'engagement_rank', 'engagement_percentile')
+# Rows per UPDATE when storing ranks on PostgreSQL
+UPDATE_BATCH_SIZE = 50000
+# Up to this many changed subscribers are re-ranked with one count of
+# higher scores each; more load every stored score once instead
+RERANK_COUNT_LIMIT = 50
+RANKING_FIELDS = ('total_received', 'open_rate', 'click_rate', 'total_clicked', 'total_unique_clicked')
+COUNT_FIELDS = ('total_received', 'total_clicked', 'total_unique_clicked')
+
+# Beehiiv's subscription stats carry no revenue figure, so presets are
+# built from opens and clicks only.
+PRESETS = {
+    'balanced': {'open_rate': 1.0, 'click_rate': 2.0, 'total_unique_clicked': 1.0},
+    'opens': {'open_rate': 1.0},
+    'clicks': {'click_rate': 1.0, 'total_clicked': 1.0, 'total_unique_clicked': 1.0},
+}
+DEFAULT_PRESET = 'balanced'
+
+
+class UnknownPreset(ValueError):
+    pass
+
+
+def get_weights(publication_id, preset=None):
+    """Resolve a preset name to weights.
+
+    Publication presets stored in the database win over the built-in ones;
+    with no name the publication's default preset (or ``balanced``) is used.
+    """
+    presets = RankingPreset.objects.filter(publication_id=publication_id)
+    stored = presets.filter(name=preset).first() if preset else presets.filter(is_default=True).first()
+    if stored:
+        weights = stored.weights
+    elif preset is None:
+        weights = PRESETS[DEFAULT_PRESET]
+    elif preset in PRESETS:
+        weights = PRESETS[preset]
+    else:
+        raise UnknownPreset(f'Unknown ranking preset: {preset}')
+
+    unknown = set(weights) - set(RANKING_FIELDS)
+    if unknown:
+        raise UnknownPreset(f'Unknown ranking fields: {", ".join(sorted(unknown))}')
+    return weights
+
+
+def load_stats(queryset, fields=RANKING_FIELDS):
+    """Load ids and stat columns of ``queryset`` into NumPy arrays, in id order.
+
+    Nulls become NaN. The fixed order keeps the ranks of tied scores stable
+    from run to run.
+    """
+    rows = queryset.order_by('id').values_list('id', *fields)
+    ids = []
+    columns = [[] for _ in fields]
+    for row in rows.iterator(chunk_size=5000):
+        ids.append(row[0])
+        for column, value in zip(columns, row[1:]):
+            column.append(value)
+    arrays = {
+        field: np.asarray(column, dtype=np.float64)
+        for field, column in zip(fields, columns)
+    }
+    return np.asarray(ids, dtype=np.int64), arrays
+
+
+def normalize(values, log_scale=False, bounds=None):
+    """Scale ``values`` to [0, 1] by their own min and max, or by ``bounds`` (raw min, max)."""
+    values = np.nan_to_num(values, nan=0.0)
+    low, high = (values.min(), values.max()) if bounds is None else bounds
+    if log_scale:
+        values = np.log1p(np.clip(values, 0, None))
+        low, high = np.log1p(max(low, 0)), np.log1p(max(high, 0))
+    spread = high - low
+    if spread == 0:
+        return np.zeros_like(values)
+    return (values - low) / spread
+
+
+def value_bounds(arrays, weights):
+    """``{field: (min, max)}`` of the weighted stat columns, as ``normalize`` uses them."""
+    bounds = {}
+    for field, weight in weights.items():
+        if weight and len(arrays[field]):
+            values = np.nan_to_num(arrays[field], nan=0.0)
+            bounds[field] = (float(values.min()), float(values.max()))
+    return bounds
+
+
+def stored_bounds(queryset, weights):
+    """``value_bounds`` of the stored rows, from one aggregate query."""
+    fields = [field for field, weight in weights.items() if weight]
+    if not fields:
+        return {}
+    aggregates = {}
+    for field in fields:
+        aggregates[f'{field}_min'] = Min(field)
+        aggregates[f'{field}_max'] = Max(field)
+    values = queryset.order_by().aggregate(**aggregates)
+    if values[f'{fields[0]}_min'] is None:
+        return {}
+    return {field: (float(values[f'{field}_min']), float(values[f'{field}_max'])) for field in fields}
+
+
+def compute_scores(arrays, weights, bounds=None):
+    """Weighted mean of the normalised stat columns, one score per subscriber.
+
+    ``bounds`` (from ``value_bounds``) scores against another population's
+    scale instead of the arrays' own.
+    """
+    total_weight = float(sum(weights.values()))
+    size = len(next(iter(arrays.values()))) if arrays else 0
+    scores = np.zeros(size, dtype=np.float64)
+    if not size or not total_weight:
+        return scores
+    for field, weight in weights.items():
+        if weight:
+            scores += weight * normalize(
+                arrays[field], log_scale=field in COUNT_FIELDS, bounds=bounds[field] if bounds else None
+            )
+    return scores / total_weight
+
+
+def top_k(scores, k):
+    """Indices of the ``k`` best scores, best first.
+
+    Uses a partial selection so only the k winners are sorted.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def rank_positions(scores):
+    """1-based rank of every score (ties keep input order) and its percentile."""
+    order = np.argsort(-scores, kind='stable')
+    ranks = np.empty(len(scores), dtype=np.int64)
+    ranks[order] = np.arange(1, len(scores) + 1)
+    percentiles = (len(scores) - ranks + 1) / max(len(scores), 1) * 100
+    return ranks, percentiles
+
+
+def _bounds_key(publication_id):
+    return f'subscribers:{publication_id}:ranking-bounds'
+
+
+def store_ranks(ids, scores, ranks, percentiles, batch_size=2000):
+    """Write the given rows' score, rank and percentile.
+
+    On PostgreSQL each batch is one ``UPDATE ... FROM unnest(...)``;
+    elsewhere Django's ``bulk_update`` is used.
+    """
+    if connection.vendor == 'postgresql':
+        table = Subscriber._meta.db_table
+        sql = (
+            f'UPDATE {table} AS s SET engagement_score = v.score, engagement_rank = v.rank, '
+            'engagement_percentile = v.percentile '
+            'FROM unnest(%s::bigint[], %s::double precision[], %s::integer[], %s::double precision[]) '
+            'AS v(id, score, rank, percentile) WHERE s.id = v.id'
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+                end = start + UPDATE_BATCH_SIZE
+                cursor.execute(sql, [
+                    ids[start:end].tolist(), scores[start:end].tolist(),
+                    ranks[start:end].tolist(), percentiles[start:end].tolist(),
+                ])
+        return
+
+    updates = [
+        Subscriber(id=pk, engagement_score=score, engagement_rank=rank, engagement_percentile=pct)
+        for pk, score, rank, pct in zip(ids.tolist(), scores.tolist(), ranks.tolist(), percentiles.tolist())
+    ]
+    with transaction.atomic():
+        Subscriber.objects.bulk_update(updates, list(RANK_FIELDS), batch_size=batch_size)
+
+
+def rank_publication(publication_id, preset=None, batch_size=2000):
+    """Score every subscriber of a publication and store score, rank and percentile.
+
+    Only rows whose stored values differ are written, so re-ranking after
+    a small sync touches few rows.
+    """
+    weights = get_weights(publication_id, preset)
+    queryset = Subscriber.objects.filter(publication_id=publication_id)
+
+    started = time.monotonic()
+    ids, arrays = load_stats(queryset, fields=(*(tuple(weights) or RANKING_FIELDS), *RANK_FIELDS))
+    stored = [arrays.pop(field) for field in RANK_FIELDS]
+    scores = compute_scores(arrays, weights)
+    ranks, percentiles = rank_positions(scores)
+    percentiles = np.round(percentiles, 2)
+    # NaN (never ranked) never compares equal, so new rows are written too
+    changed = (stored[0] != scores) | (stored[1] != ranks) | (stored[2] != percentiles)
+    computed = time.monotonic()
+
+    if changed.any():
+        store_ranks(ids[changed], scores[changed], ranks[changed], percentiles[changed], batch_size=batch_size)
+    cache.set(_bounds_key(publication_id), {'weights': weights, 'bounds': value_bounds(arrays, weights)}, timeout=None)
+
+    logger.info(
+        'Ranked %s subscribers for %s, %s changed (scoring %.3fs, storing %.1fs)',
+        len(ids), publication_id, int(changed.sum()), computed - started, time.monotonic() - computed
+    )
+    return len(ids)
+
+
+def rerank_subscribers(publication_id, beehiiv_ids, preset=None):
+    """Re-score only the given subscribers after a small change; returns how many were updated.
+
+    Scores are exact while the min/max the last full ranking normalised
+    with still hold; if they moved (or there is no full ranking yet) the
+    whole publication is re-ranked instead. The changed subscribers get
+    their exact rank among the stored scores, while everyone else keeps
+    theirs, so other ranks can be off by up to the number of changed rows
+    until the next full ranking.
+    """
+    weights = get_weights(publication_id, preset)
+    queryset = Subscriber.objects.filter(publication_id=publication_id)
+    stored = cache.get(_bounds_key(publication_id))
+    if not stored or stored['weights'] != weights or stored['bounds'] != stored_bounds(queryset, weights):
+        return rank_publication(publication_id, preset)
+
+    ids, arrays = load_stats(
+        queryset.filter(beehiiv_id__in=list(beehiiv_ids)), fields=tuple(weights) or RANKING_FIELDS
+    )
+    if not len(ids):
+        return 0
+    scores = compute_scores(arrays, weights, bounds=stored['bounds'])
+    others = queryset.exclude(id__in=ids.tolist()).exclude(engagement_score=None).order_by()
+    if len(ids) <= RERANK_COUNT_LIMIT:
+        # Range counts on the (publication_id, engagement_score) index
+        higher = np.array(
+            [others.filter(engagement_score__gt=score).count() for score in scores.tolist()], dtype=np.int64
+        )
+        total = others.count() + len(ids)
+    else:
+        stored_scores = np.sort(np.asarray(others.values_list('engagement_score', flat=True), dtype=np.float64))
+        higher = len(stored_scores) - np.searchsorted(stored_scores, scores, side='right')
+        total = len(stored_scores) + len(ids)
+    # Rank = stored scores above it + position among the changed rows
+    ranks = higher + rank_positions(scores)[0]
+    percentiles = np.round((total - ranks + 1) / total * 100, 2)
+    store_ranks(ids, scores, ranks, percentiles)
+    return len(ids)
+
+
+def top_subscribers(publication_id, k=10, preset=None):
+    """The ``k`` most engaged subscribers as (record, score) pairs, best first.
+
+    The weights of the last full ranking are served from the stored ranks
+    through the (publication_id, engagement_rank) index; any other preset
+    scores every subscriber in memory.
+    """
+    weights = get_weights(publication_id, preset)
+    queryset = Subscriber.objects.filter(publication_id=publication_id)
+    ranked = cache.get(_bounds_key(publication_id))
+    if ranked and ranked['weights'] == weights:
+        rows = queryset.exclude(engagement_rank=None).order_by('engagement_rank', 'id')
+        return list(rows.values_list('data', 'engagement_score')[:k])
+
+    ids, arrays = load_stats(queryset, fields=tuple(weights) or RANKING_FIELDS)
+    scores = compute_scores(arrays, weights)
+    best = top_k(scores, k)
+
+    records = dict(queryset.filter(id__in=ids[best].tolist()).values_list('id', 'data'))
+    return [(records[int(ids[i])], float(scores[i])) for i in best]
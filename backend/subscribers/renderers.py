@@ -0,0 +1,49 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .instrumentation import serialization_seconds
+
+try:
+    import orjson
+except ImportError:  # optional; DRF's stdlib encoder is the fallback
+    orjson = None
+
+_encoder = JSONEncoder()
+
+
+def dumps(data):
+    """``data`` as compact UTF-8 JSON, as JSONRenderer writes it.
+
+    Uses ``orjson`` when it is installed. Dates, decimals and the other
+    types orjson doesn't handle the way DRF does go through DRF's encoder,
+    so both paths give the same JSON.
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            data, default=_encoder.default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        )
+    return JSONRenderer().render(data)
+
+
+def splice_list(rendered, key, items):
+    """Add ``key`` holding a list of already rendered ``items`` to a rendered JSON object."""
+    head = rendered[:rendered.rindex(b'}')]
+    separator = b',' if head.strip() != b'{' else b''
+    return b''.join((head, separator, dumps(key), b':[', b','.join(items), b']}'))
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer that records how long each response takes to serialize.
+
+    Compact responses are written by ``dumps`` (orjson when installed);
+    indented ones by DRF's encoder.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        request = (renderer_context or {}).get('request')
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match else 'unknown'
+        with serialization_seconds.time(view=view):
+            if data is not None and not self.get_indent(accepted_media_type, renderer_context or {}):
+                return dumps(data)
+            return super().render(data, accepted_media_type, renderer_context)
@@ -0,0 +1,173 @@
+"""Cached API payloads with stale-while-revalidate.
+
+Entries are keyed by publication, endpoint and query parameters. Each one
+remembers the publication's data version it was built from; a sync bumps
+that version (``invalidate_publication``), which marks every entry of the
+publication stale at once. Stale entries are still served straight away
+while a single background refresh rebuilds them.
+
+Misses are single-flight: concurrent requests for the same entry wait for
+one build and share it, whether they run in one process (an in-memory
+flight per key) or in several workers (a build lock in the shared cache,
+Redis in production). A morning rush of dashboard loads then costs one
+build per entry instead of one per request.
+"""
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from .locks import acquire_lock, release_lock
+
+logger = logging.getLogger(__name__)
+
+REFRESH_LOCK_TIMEOUT = 60
+# Workers waiting for another one's build give up and build themselves after this
+BUILD_WAIT_TIMEOUT = 30
+BUILD_POLL_INTERVAL = 0.05
+# Part of every key; bump it when the shape of stored entries changes
+ENTRY_FORMAT = 2
+
+
+def _version_key(publication_id):
+    return f'subscribers:{publication_id}:version'
+
+
+def data_version(publication_id):
+    version = cache.get(_version_key(publication_id))
+    if version is None:
+        cache.add(_version_key(publication_id), 1, timeout=None)
+        version = cache.get(_version_key(publication_id), 1)
+    return version
+
+
+def invalidate_publication(publication_id):
+    """Mark every cached payload of the publication stale (call after a sync)."""
+    key = _version_key(publication_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 2, timeout=None)
+        return cache.get(key, 2)
+
+
+def cache_key(publication_id, name, params):
+    items = sorted((key, sorted(values)) for key, values in params.lists()) if params else []
+    digest = hashlib.md5(repr(items).encode()).hexdigest()
+    return f'subscribers:{publication_id}:{name}:v{ENTRY_FORMAT}:{digest}'
+
+
+def refresh_in_background(refresh):
+    def run():
+        try:
+            refresh()
+        except Exception:
+            logger.exception('Background cache refresh failed')
+        finally:
+            close_old_connections()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def _store(key, version, payload):
+    entry = {
+        'payload': payload,
+        'version': version,
+        'fresh_until': time.time() + settings.SUBSCRIBERS_CACHE_TTL,
+    }
+    timeout = settings.SUBSCRIBERS_CACHE_TTL + settings.SUBSCRIBERS_CACHE_STALE_TTL
+    cache.set(key, entry, timeout=timeout)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.payload = None
+        self.error = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def _build_shared(key, version, build):
+    """Build and store the entry, unless another worker holding the build lock stores it first."""
+    lock = f'{key}:building'
+    deadline = time.monotonic() + BUILD_WAIT_TIMEOUT
+    while True:
+        token = acquire_lock(lock, REFRESH_LOCK_TIMEOUT)
+        if token is not None:
+            break
+        entry = cache.get(key)
+        if entry is not None:
+            return entry['payload']
+        if time.monotonic() >= deadline:
+            logger.warning('Gave up waiting for another worker to build %s', key)
+            return build()
+        time.sleep(BUILD_POLL_INTERVAL)
+    try:
+        # The previous lock holder may have just stored it
+        entry = cache.get(key)
+        if entry is not None:
+            return entry['payload']
+        payload = build()
+        _store(key, version, payload)
+        return payload
+    finally:
+        release_lock(lock, token)
+
+
+def build_once(key, version, build):
+    """``_build_shared`` with one build per key at a time in this process; other callers share it."""
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.payload
+
+    try:
+        flight.payload = _build_shared(key, version, build)
+        return flight.payload
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def cached_payload(publication_id, name, params, build):
+    """Return the payload for ``name``/``params``, building it with ``build()`` on a miss.
+
+    Fresh hits are returned as-is. Stale hits (expired TTL or an older data
+    version) are returned too, and whichever request wins the refresh lock
+    rebuilds the entry in the background. Concurrent misses share one build.
+    """
+    key = cache_key(publication_id, name, params)
+    version = data_version(publication_id)
+    entry = cache.get(key)
+
+    if entry is None:
+        return build_once(key, version, build)
+
+    if entry['version'] != version or time.time() >= entry['fresh_until']:
+        if cache.add(f'{key}:refreshing', 1, timeout=REFRESH_LOCK_TIMEOUT):
+            def refresh():
+                try:
+                    _store(key, version, build())
+                finally:
+                    cache.delete(f'{key}:refreshing')
+
+            refresh_in_background(refresh)
+
+    return entry['payload']
@@ -0,0 +1,232 @@
+"""Daily metrics rollups, written at the end of every sync.
+
+Each sync stores a snapshot of the publication's totals in today's
+DailyRollup row (one aggregate query) and refreshes the per-day signup
+and unsubscribe counts. Summary reads are then a single-row lookup and a
+trend over any period is one range query on (publication_id, date).
+Webhook updates between syncs move today's row and the flow counts by
+the difference of the rows they change (``apply_changes``).
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyRollup, Subscriber
+
+RATE_BUCKETS = 10
+BUCKET_WIDTH = 100 / RATE_BUCKETS
+
+SNAPSHOT_FIELDS = (
+    'total_subscribers', 'active_subscribers', 'inactive_subscribers', 'subscribers_clicked',
+    'total_clicks', 'open_rate_sum', 'click_rate_sum',
+)
+DISTRIBUTION_FIELDS = ('open_rate_distribution', 'click_rate_distribution')
+# Subscriber columns a row's share of the rollups depends on
+ROW_FIELDS = ('status', 'open_rate', 'click_rate', 'total_clicked', 'total_unique_clicked', 'created_at', 'updated_at')
+
+
+def _bucket(field, index):
+    condition = Q()
+    if index > 0:
+        condition &= Q(**{f'{field}__gte': index * BUCKET_WIDTH})
+    if index < RATE_BUCKETS - 1:
+        condition &= Q(**{f'{field}__lt': (index + 1) * BUCKET_WIDTH})
+    return Count('id', filter=condition)
+
+
+def snapshot(queryset):
+    """Totals, sums and rate distributions of ``queryset`` in one query."""
+    aggregates = {
+        'total_subscribers': Count('id'),
+        'active_subscribers': Count('id', filter=Q(status='active')),
+        'inactive_subscribers': Count('id', filter=Q(status='inactive')),
+        'subscribers_clicked': Count('id', filter=Q(total_unique_clicked__gte=1)),
+        'total_clicks': Sum('total_clicked'),
+        'open_rate_sum': Sum('open_rate'),
+        'click_rate_sum': Sum('click_rate'),
+    }
+    for field in ('open_rate', 'click_rate'):
+        for index in range(RATE_BUCKETS):
+            aggregates[f'{field}_{index}'] = _bucket(field, index)
+    values = queryset.order_by().aggregate(**aggregates)
+
+    result = {field: values[field] or 0 for field in SNAPSHOT_FIELDS}
+    for field in ('open_rate', 'click_rate'):
+        result[f'{field}_distribution'] = [values[f'{field}_{index}'] for index in range(RATE_BUCKETS)]
+    return result
+
+
+def daily_flows(queryset):
+    """``{date: (new_subscribers, unsubscribed)}`` from the stored created/updated dates."""
+    flows = {}
+    signups = (
+        queryset.filter(created_at__isnull=False).order_by()
+        .annotate(day=TruncDate('created_at')).values('day').annotate(count=Count('id'))
+    )
+    for row in signups:
+        flows[row['day']] = [row['count'], 0]
+    # Beehiiv has no unsubscribe date; updated_at of an inactive subscription stands in
+    unsubscribes = (
+        queryset.filter(status='inactive', updated_at__isnull=False).order_by()
+        .annotate(day=TruncDate('updated_at')).values('day').annotate(count=Count('id'))
+    )
+    for row in unsubscribes:
+        flows.setdefault(row['day'], [0, 0])[1] = row['count']
+    return flows
+
+
+def refresh_rollups(publication_id, now=None):
+    """Write today's snapshot and the per-day flow counts for a publication."""
+    now = now or timezone.now()
+    queryset = Subscriber.objects.filter(publication_id=publication_id)
+    flows = daily_flows(queryset)
+
+    with transaction.atomic():
+        DailyRollup.objects.filter(publication_id=publication_id).update(new_subscribers=0, unsubscribed=0)
+        DailyRollup.objects.bulk_create(
+            [
+                DailyRollup(publication_id=publication_id, date=day, new_subscribers=new, unsubscribed=gone)
+                for day, (new, gone) in flows.items()
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['publication_id', 'date'],
+            update_fields=['new_subscribers', 'unsubscribed'],
+        )
+        rollup, _ = DailyRollup.objects.update_or_create(
+            publication_id=publication_id,
+            date=timezone.localdate(now),
+            defaults={'computed_at': now, **snapshot(queryset)},
+        )
+    return rollup
+
+
+def _bucket_index(rate):
+    """The distribution bucket ``snapshot`` counts ``rate`` in."""
+    return min(max(int((rate or 0) // BUCKET_WIDTH), 0), RATE_BUCKETS - 1)
+
+
+def apply_changes(publication_id, before, after, now=None):
+    """Move the rollups by the difference between subscriber rows ``before`` and ``after`` a change.
+
+    Rows are tuples of ROW_FIELDS; a new subscriber has no ``before`` row
+    and a deleted one no ``after`` row. Today's snapshot (started from the
+    latest one if today has none yet) and the per-day flows are adjusted,
+    so nothing is re-aggregated.
+    """
+    now = now or timezone.now()
+    totals = dict.fromkeys(SNAPSHOT_FIELDS, 0)
+    distributions = {field: [0] * RATE_BUCKETS for field in DISTRIBUTION_FIELDS}
+    flows = defaultdict(lambda: [0, 0])
+    for sign, rows in ((-1, before), (1, after)):
+        for status, open_rate, click_rate, total_clicked, total_unique_clicked, created_at, updated_at in rows:
+            totals['total_subscribers'] += sign
+            totals['active_subscribers'] += sign * (status == 'active')
+            totals['inactive_subscribers'] += sign * (status == 'inactive')
+            totals['subscribers_clicked'] += sign * ((total_unique_clicked or 0) >= 1)
+            totals['total_clicks'] += sign * (total_clicked or 0)
+            totals['open_rate_sum'] += sign * (open_rate or 0)
+            totals['click_rate_sum'] += sign * (click_rate or 0)
+            distributions['open_rate_distribution'][_bucket_index(open_rate)] += sign
+            distributions['click_rate_distribution'][_bucket_index(click_rate)] += sign
+            if created_at is not None:
+                flows[timezone.localdate(created_at)][0] += sign
+            if status == 'inactive' and updated_at is not None:
+                flows[timezone.localdate(updated_at)][1] += sign
+
+    with transaction.atomic():
+        for day, (new, gone) in flows.items():
+            if new or gone:
+                DailyRollup.objects.get_or_create(publication_id=publication_id, date=day)
+                DailyRollup.objects.filter(publication_id=publication_id, date=day).update(
+                    new_subscribers=F('new_subscribers') + new, unsubscribed=F('unsubscribed') + gone,
+                )
+
+        rollup, _ = DailyRollup.objects.select_for_update().get_or_create(
+            publication_id=publication_id, date=timezone.localdate(now)
+        )
+        if rollup.total_subscribers is None:
+            base = latest_rollup(publication_id)
+            if base is None:
+                return rollup  # never synced: the first sync writes the snapshot
+            for field in (*SNAPSHOT_FIELDS, *DISTRIBUTION_FIELDS):
+                setattr(rollup, field, getattr(base, field))
+        for field, delta in totals.items():
+            setattr(rollup, field, getattr(rollup, field) + delta)
+        for field, deltas in distributions.items():
+            setattr(rollup, field, [count + delta for count, delta in zip(getattr(rollup, field), deltas)])
+        rollup.computed_at = now
+        rollup.save(update_fields=[*SNAPSHOT_FIELDS, *DISTRIBUTION_FIELDS, 'computed_at'])
+    return rollup
+
+
+def latest_rollup(publication_id):
+    """The most recent rollup with a snapshot, or None before the first sync."""
+    return (
+        DailyRollup.objects.filter(publication_id=publication_id, total_subscribers__isnull=False)
+        .order_by('-date').first()
+    )
+
+
+def rollup_totals(rollup):
+    """The header totals of the subscriber table, from a snapshot."""
+    total = rollup.total_subscribers
+    percent_clicked_once = (rollup.subscribers_clicked / total * 100) if total > 0 else 0
+    return {
+        'total_subscribers': total,
+        'active_subscribers': rollup.active_subscribers,
+        'subscribers_clicked': rollup.subscribers_clicked,
+        'percent_clicked_once': round(percent_clicked_once, 1),
+    }
+
+
+def rollup_summary(rollup):
+    total = rollup.total_subscribers
+    return {
+        **rollup_totals(rollup),
+        'date': rollup.date,
+        'computed_at': rollup.computed_at,
+        'inactive_subscribers': rollup.inactive_subscribers,
+        'total_clicks': rollup.total_clicks,
+        'average_open_rate': round(rollup.open_rate_sum / total, 2) if total else 0,
+        'average_click_rate': round(rollup.click_rate_sum / total, 2) if total else 0,
+        'open_rate_distribution': rollup.open_rate_distribution,
+        'click_rate_distribution': rollup.click_rate_distribution,
+        'new_subscribers': rollup.new_subscribers,
+        'unsubscribed': rollup.unsubscribed,
+    }
+
+
+def trend(publication_id, start, end):
+    """Day-by-day rollups between ``start`` and ``end`` (inclusive), oldest first.
+
+    Days without a rollup row (no signups, unsubscribes or sync) are
+    filled in with zero flows so charts get a continuous series.
+    """
+    rows = {
+        rollup.date: rollup
+        for rollup in DailyRollup.objects.filter(
+            publication_id=publication_id, date__gte=start, date__lte=end
+        ).order_by('date')
+    }
+    days = []
+    day = start
+    while day <= end:
+        rollup = rows.get(day)
+        entry = {
+            'date': day,
+            'new_subscribers': rollup.new_subscribers if rollup else 0,
+            'unsubscribed': rollup.unsubscribed if rollup else 0,
+            'total_subscribers': None,
+            'active_subscribers': None,
+            'percent_clicked_once': None,
+        }
+        if rollup and rollup.total_subscribers is not None:
+            entry.update(rollup_totals(rollup))
+        days.append(entry)
+        day += timedelta(days=1)
+    return days
@@ -0,0 +1,263 @@
+"""Immutable snapshots of every subscriber's stats, kept on disk.
+
+Every full sync, and an incremental one when the latest snapshot is
+older than SUBSCRIBER_SNAPSHOT_INTERVAL, writes ``<publication>/<taken at>.npz`` to the snapshot storage
+(``snapshot_storage``: object storage when configured, so the web service
+and the workers see the same files, else SUBSCRIBER_SNAPSHOT_DIR): a
+compressed archive with one array per column, rows sorted by a 64-bit
+hash of the subscriber id so snapshots can be joined without decoding
+the ids. Snapshots are never rewritten; those older than
+SUBSCRIBER_SNAPSHOT_RETENTION_DAYS are deleted.
+
+Every column is its own member of the archive, so reading a snapshot only
+decompresses the columns asked for, and the file names let a date range
+be picked without opening the others. Trend and decay analysis over
+months of syncs therefore needs neither the API nor old rows in the
+database.
+"""
+import hashlib
+import io
+import logging
+import os
+import posixpath
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, storages
+from django.utils import timezone
+
+from .columnar import StringArray
+from .models import Subscriber
+
+logger = logging.getLogger(__name__)
+
+STAT_COLUMNS = {
+    'total_received': np.int32,
+    'open_rate': np.float32,
+    'click_rate': np.float32,
+    'total_clicked': np.int32,
+    'total_unique_clicked': np.int32,
+    'engagement_score': np.float32,
+}
+# Columns every snapshot has besides the stats
+KEY_COLUMNS = ('id_hash', 'active')
+ID_COLUMNS = ('id_buffer', 'id_offsets')
+SNAPSHOT_COLUMNS = (*KEY_COLUMNS, *STAT_COLUMNS, *ID_COLUMNS)
+NAME_FORMAT = '%Y%m%dT%H%M%S.%fZ'
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def snapshot_storage():
+    """The ``snapshots`` entry of STORAGES if there is one, else SUBSCRIBER_SNAPSHOT_DIR; None if off."""
+    if 'snapshots' in settings.STORAGES:
+        return storages['snapshots']
+    if settings.SUBSCRIBER_SNAPSHOT_DIR:
+        return FileSystemStorage(location=settings.SUBSCRIBER_SNAPSHOT_DIR)
+    return None
+
+
+def snapshot_name(publication_id, taken_at):
+    return posixpath.join(publication_id, taken_at.astimezone(dt_timezone.utc).strftime(NAME_FORMAT) + '.npz')
+
+
+def id_hashes(ids):
+    """Stable 64-bit hashes of subscriber ids."""
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'little') for value in ids],
+        dtype=np.uint64,
+    )
+
+
+def snapshot_columns(publication_id):
+    """The publication's stored subscribers as snapshot columns, sorted by id hash."""
+    rows = Subscriber.objects.filter(publication_id=publication_id).order_by().values_list(
+        'beehiiv_id', 'status', *STAT_COLUMNS
+    )
+    ids, active = [], []
+    stats = {name: [] for name in STAT_COLUMNS}
+    for beehiiv_id, status, *values in rows.iterator(chunk_size=5000):
+        ids.append(beehiiv_id)
+        active.append(status == 'active')
+        for name, value in zip(STAT_COLUMNS, values):
+            stats[name].append(np.nan if value is None else value)
+
+    hashes = id_hashes(ids)
+    order = np.argsort(hashes, kind='stable')
+    strings = StringArray.from_strings(ids[i] for i in order.tolist())
+    columns = {
+        'id_hash': hashes[order],
+        'active': np.array(active, dtype=bool)[order],
+        'id_buffer': np.frombuffer(strings.buffer, dtype=np.uint8),
+        'id_offsets': strings.offsets,
+    }
+    for name, dtype in STAT_COLUMNS.items():
+        columns[name] = np.array(stats[name], dtype=dtype)[order]
+    return columns
+
+
+def write_snapshot(publication_id, taken_at=None):
+    """Archive the publication's current subscriber stats; returns the snapshot's name."""
+    storage = snapshot_storage()
+    if storage is None:
+        return None
+    taken_at = taken_at or timezone.now()
+    name = snapshot_name(publication_id, taken_at)
+    if storage.exists(name):
+        raise SnapshotError(f'Snapshot {name} already exists')
+
+    columns = snapshot_columns(publication_id)
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **columns)
+    if isinstance(storage, FileSystemStorage):
+        # Written under a temporary name so readers never see a partial file
+        partial = storage.save(name + '.partial', ContentFile(buffer.getvalue()))
+        os.replace(storage.path(partial), storage.path(name))
+    else:
+        # Object stores make an upload visible only once it is complete
+        storage.save(name, ContentFile(buffer.getvalue()))
+    logger.info('Wrote snapshot of %s subscribers to %s', len(columns['id_hash']), name)
+    return name
+
+
+def _as_datetime(value, end=False):
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, time.max if end else time.min, tzinfo=dt_timezone.utc)
+    raise SnapshotError(f'Expected a date or datetime, got {value!r}')
+
+
+def list_snapshots(publication_id, start=None, end=None):
+    """``[(taken_at, name)]`` of the publication's snapshots, oldest first.
+
+    ``start``/``end`` are inclusive; dates cover the whole (UTC) day.
+    """
+    start, end = _as_datetime(start), _as_datetime(end, end=True)
+    storage = snapshot_storage()
+    if storage is None:
+        return []
+    try:
+        _, files = storage.listdir(publication_id)
+    except FileNotFoundError:
+        return []
+
+    snapshots = []
+    for name in files:
+        if not name.endswith('.npz'):
+            continue
+        try:
+            taken_at = datetime.strptime(name[:-len('.npz')], NAME_FORMAT).replace(tzinfo=dt_timezone.utc)
+        except ValueError:
+            continue
+        if (start is None or taken_at >= start) and (end is None or taken_at <= end):
+            snapshots.append((taken_at, posixpath.join(publication_id, name)))
+    return sorted(snapshots)
+
+
+def snapshot_due(publication_id, now=None):
+    """Whether the publication's latest snapshot is SUBSCRIBER_SNAPSHOT_INTERVAL seconds old (or missing)."""
+    now = now or timezone.now()
+    return not list_snapshots(publication_id, start=now - timedelta(seconds=settings.SUBSCRIBER_SNAPSHOT_INTERVAL))
+
+
+def prune_snapshots(publication_id, now=None):
+    """Delete the snapshots older than SUBSCRIBER_SNAPSHOT_RETENTION_DAYS; returns how many."""
+    if not settings.SUBSCRIBER_SNAPSHOT_RETENTION_DAYS:
+        return 0
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=settings.SUBSCRIBER_SNAPSHOT_RETENTION_DAYS)
+    expired = [name for taken_at, name in list_snapshots(publication_id) if taken_at < cutoff]
+    storage = snapshot_storage()
+    for name in expired:
+        storage.delete(name)
+    if expired:
+        logger.info('Deleted %s snapshots of %s older than %s', len(expired), publication_id, cutoff)
+    return len(expired)
+
+
+def load_snapshot(name, columns=None):
+    """The requested columns (default all) of one snapshot; other columns aren't read."""
+    columns = SNAPSHOT_COLUMNS if columns is None else columns
+    unknown = [column for column in columns if column not in SNAPSHOT_COLUMNS]
+    if unknown:
+        raise SnapshotError(f'Unknown snapshot columns: {", ".join(unknown)}')
+    with snapshot_storage().open(name) as f, np.load(f) as archive:
+        return {column: archive[column] for column in columns}
+
+
+def load_snapshots(publication_id, columns, start=None, end=None):
+    """``[(taken_at, columns)]`` for every snapshot in the range, oldest first."""
+    return [
+        (taken_at, load_snapshot(name, columns))
+        for taken_at, name in list_snapshots(publication_id, start, end)
+    ]
+
+
+def snapshot_ids(snapshot):
+    """Subscriber ids of a snapshot loaded with its ``ID_COLUMNS``, in row order."""
+    return StringArray(snapshot['id_buffer'].tobytes(), snapshot['id_offsets']).tolist()
+
+
+def _mean(values):
+    values = values[~np.isnan(values)] if values.dtype.kind == 'f' else values
+    return round(float(values.mean()), 4) if len(values) else None
+
+
+def engagement_trend(snapshots, field):
+    """Per snapshot: subscriber and active counts, mean and median ``field`` of active readers."""
+    points = []
+    for taken_at, columns in snapshots:
+        values = columns[field][columns['active']]
+        known = values[~np.isnan(values)] if values.dtype.kind == 'f' else values
+        points.append({
+            'taken_at': taken_at,
+            'subscribers': len(columns['id_hash']),
+            'active': int(columns['active'].sum()),
+            'mean': _mean(values),
+            'median': round(float(np.median(known)), 4) if len(known) else None,
+        })
+    return points
+
+
+def cohort_decay(snapshots, field):
+    """How the readers active in the first snapshot engage in the later ones.
+
+    Following one fixed cohort separates a real decline in engagement from
+    changes in who is on the list. Per snapshot: how many of the cohort
+    are still active, and the mean ``field`` of those that are.
+    """
+    if not snapshots:
+        return {'cohort_size': 0, 'baseline': None, 'points': []}
+    first = snapshots[0][1]
+    cohort = first['id_hash'][first['active']]
+    baseline = _mean(first[field][first['active']])
+
+    points = []
+    for taken_at, columns in snapshots:
+        retained = np.isin(columns['id_hash'], cohort, assume_unique=True) & columns['active']
+        mean = _mean(columns[field][retained])
+        points.append({
+            'taken_at': taken_at,
+            'retained': int(retained.sum()),
+            'retention': round(int(retained.sum()) / len(cohort), 4) if len(cohort) else None,
+            'mean': mean,
+            'change': round(mean - baseline, 4) if mean is not None and baseline is not None else None,
+        })
+    return {'cohort_size': len(cohort), 'baseline': baseline, 'points': points}
+
+
+def engagement_history(publication_id, field, start=None, end=None):
+    """Trend and cohort decay of the stat ``field`` over the snapshots in a date range."""
+    if field not in STAT_COLUMNS:
+        raise SnapshotError(f'Unknown stat: {field}')
+    snapshots = load_snapshots(publication_id, (*KEY_COLUMNS, field), start, end)
+    return {
+        'field': field,
+        'trend': engagement_trend(snapshots, field),
+        'cohort': cohort_decay(snapshots, field),
+    }
@@ -0,0 +1,272 @@
+import logging
+from datetime import timedelta
+
+import numpy as np
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .churn import refresh_churn
+from .enrichment import (
+    STAT_ALIASES, UTM_FIELDS, enrich_subscribers, record_dates, stat_value,
+    to_datetime64, to_datetimes, utm_value
+)
+from .facets import (
+    apply_deltas, has_facets, object_contributions, rebuild_facets, stored_contributions
+)
+from .instrumentation import (
+    enrichment_seconds, sync_pages, sync_records, sync_records_per_second, sync_seconds
+)
+from .models import Subscriber, SyncState
+from .ranking import rank_publication
+from .response_cache import invalidate_publication
+from .rollups import refresh_rollups
+from .snapshots import SnapshotError, prune_snapshots, snapshot_due, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+INCREMENTAL_PAGE_SIZE = 100
+# Checkpoints count pages, so a resumed sync must page the same way
+FULL_SYNC_PAGE_SIZE = 1000
+
+UPDATE_FIELDS = [
+    'email', 'status', 'created_at', 'updated_at', 'days_to_unsubscribe',
+    *STAT_ALIASES.keys(), *UTM_FIELDS,
+    'data', 'synced_at',
+]
+
+
+def subscriber_fields(record, created_at, updated_at):
+    """Map an enriched API subscription onto Subscriber column values."""
+    stats = record.get('stats') or {}
+    fields = {
+        'email': record.get('email') or '',
+        'status': record.get('status') or '',
+        'created_at': created_at,
+        'updated_at': updated_at,
+        'days_to_unsubscribe': record.get('days_to_unsubscribe'),
+        'data': record,
+    }
+    for field in STAT_ALIASES:
+        fields[field] = stat_value(stats, field)
+    for field in UTM_FIELDS:
+        fields[field] = utm_value(record, field)[:255]
+    return fields
+
+
+def build_subscribers(publication_id, records, synced_at):
+    """Subscriber objects for a page of raw API records.
+
+    The page is enriched (and its dates parsed) in one batch; the records
+    are updated in place, so the stored copies carry the derived fields too.
+    """
+    created, updated = enrich_subscribers(records)
+    return [
+        Subscriber(
+            publication_id=publication_id,
+            beehiiv_id=str(record['id']),
+            synced_at=synced_at,
+            **subscriber_fields(record, created_at, updated_at)
+        )
+        for record, created_at, updated_at in zip(records, to_datetimes(created), to_datetimes(updated))
+    ]
+
+
+def upsert_subscribers(publication_id, records, synced_at, batch_size=1000, update_facets=False):
+    """Insert or update a page of records.
+
+    With ``update_facets`` the UTM facet index is adjusted for the page in
+    the same transaction (the caller's).
+    """
+    with enrichment_seconds.time():
+        objs = build_subscribers(publication_id, records, synced_at)
+    if update_facets:
+        previous = stored_contributions(publication_id, (obj.beehiiv_id for obj in objs))
+    Subscriber.objects.bulk_create(
+        objs,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['publication_id', 'beehiiv_id'],
+        update_fields=UPDATE_FIELDS,
+    )
+    if update_facets:
+        apply_deltas(publication_id, previous, object_contributions(objs))
+    return len(objs)
+
+
+def iter_changed_since(client, high_water_mark, limit=INCREMENTAL_PAGE_SIZE):
+    """Yield, page by page, the records created or updated after ``high_water_mark``.
+
+    Pages are requested newest-first, so the walk stops at the first record
+    created before the mark. The API can only order by creation date, which
+    means updates to older subscribers wait for the next full reconcile.
+    """
+    page = 1
+    while True:
+        response = client.get_subscribers(
+            page=page, limit=limit, order_by='created', direction='desc'
+        )
+        records = response.get('data', [])
+        if not records:
+            break
+
+        created, updated = record_dates(records)
+        latest = np.fmax(created, updated)
+        mark = to_datetime64(high_water_mark)
+        keep = np.isnat(latest) | (latest > mark)
+        yield [record for record, changed in zip(records, keep.tolist()) if changed]
+
+        reached_mark = bool((created <= mark).any())
+        if reached_mark:
+            break
+        page += 1
+
+
+def _newest(records, current=None):
+    """Latest created/updated timestamp in ``records`` (or ``current`` if later)."""
+    if not records:
+        return current
+    created, updated = record_dates(records)
+    latest = np.fmax(created, updated)
+    if np.isnat(latest).all():
+        return current
+    newest = to_datetimes(np.array([latest[~np.isnat(latest)].max()]))[0]
+    return newest if current is None or newest > current else current
+
+
+def needs_full_sync(state, now=None):
+    if state is None or state.high_water_mark is None or state.last_full_sync_at is None:
+        return True
+    now = now or timezone.now()
+    interval = timedelta(hours=settings.SUBSCRIBERS_FULL_SYNC_INTERVAL_HOURS)
+    return now - state.last_full_sync_at >= interval
+
+
+def resumable_checkpoint(state, now):
+    """Whether ``state`` holds a checkpoint recent enough to resume a full sync from."""
+    if state is None or state.checkpoint_page is None or state.checkpoint_started_at is None:
+        return False
+    interval = timedelta(hours=settings.SUBSCRIBERS_FULL_SYNC_INTERVAL_HOURS)
+    return now - state.checkpoint_started_at < interval
+
+
+def store_batch(publication_id, records, synced_at, update_facets=False, checkpoint_page=None):
+    """Upsert buffered records in one transaction, recording ``checkpoint_page`` with them."""
+    with transaction.atomic():
+        stored = upsert_subscribers(publication_id, records, synced_at, update_facets=update_facets)
+        if checkpoint_page is not None:
+            SyncState.objects.update_or_create(
+                publication_id=publication_id,
+                defaults={'checkpoint_page': checkpoint_page, 'checkpoint_started_at': synced_at},
+            )
+    return stored
+
+
+def sync_publication(client, mode='auto', progress=None, batch_size=None, resume=True):
+    """Bring the local store for the client's publication up to date.
+
+    ``mode`` is ``'full'``, ``'incremental'`` or ``'auto'``. A full sync
+    walks every page and removes rows Beehiiv no longer returns; an
+    incremental sync only fetches records past the stored high-water mark.
+    ``'auto'`` runs incremental syncs until a full reconcile is due.
+
+    Records are upserted ``batch_size`` (SUBSCRIBERS_SYNC_BATCH_SIZE) at a
+    time, one transaction per batch. Full syncs checkpoint the last stored
+    page with each batch; with ``resume`` a full sync picks up where an
+    interrupted one stopped.
+
+    ``progress(pages, records)`` is called after every batch is stored.
+    """
+    publication_id = client.publication_id
+    run_started = timezone.now()
+    # ``started`` marks this sync's rows (synced_at); a resumed sync keeps the original mark
+    started = run_started
+    state = SyncState.objects.filter(publication_id=publication_id).first()
+    batch_size = batch_size or settings.SUBSCRIBERS_SYNC_BATCH_SIZE
+
+    if mode == 'auto':
+        mode = 'full' if needs_full_sync(state, started) else 'incremental'
+    if mode == 'incremental' and (state is None or state.high_water_mark is None):
+        mode = 'full'
+
+    # Full syncs stream the list page by page instead of holding it all
+    start_page = 1
+    if mode == 'full':
+        if resume and resumable_checkpoint(state, run_started):
+            started = state.checkpoint_started_at
+            # Re-read the last stored page: records deleted upstream since
+            # may have shifted later ones back into it.
+            start_page = state.checkpoint_page
+            logger.info('Resuming full sync of %s from page %s', publication_id, start_page)
+        pages = client.iter_pages(limit=FULL_SYNC_PAGE_SIZE, start_page=start_page)
+    else:
+        pages = iter_changed_since(client, state.high_water_mark)
+
+    # Incremental syncs keep the facet index current page by page; full
+    # syncs (which may delete rows) rebuild it once at the end.
+    update_facets = mode == 'incremental' and has_facets(publication_id)
+
+    count = 0
+    pages_stored = 0
+    removed = 0
+    high_water_mark = state.high_water_mark if state else None
+    # Each batch is committed on its own so progress is visible (and kept)
+    # while a long sync runs; rows are only deleted once the whole sweep
+    # has succeeded.
+    pending = []
+    for page, records in enumerate(pages, start=start_page):
+        pending.extend(records)
+        high_water_mark = _newest(records, high_water_mark)
+        pages_stored += 1
+        if len(pending) >= batch_size:
+            count += store_batch(publication_id, pending, started, update_facets,
+                                 checkpoint_page=page if mode == 'full' else None)
+            pending = []
+            if progress:
+                progress(pages_stored, count)
+    if pending:
+        count += store_batch(publication_id, pending, started, update_facets,
+                             checkpoint_page=page if mode == 'full' else None)
+        if progress:
+            progress(pages_stored, count)
+
+    with transaction.atomic():
+        defaults = {
+            'last_synced_at': started,
+            'high_water_mark': high_water_mark,
+        }
+        if mode == 'full':
+            removed, _ = Subscriber.objects.filter(
+                publication_id=publication_id, synced_at__lt=started
+            ).delete()
+            # Incremental syncs leave an interrupted full sync's checkpoint for it to resume from
+            defaults.update(last_full_sync_at=started, checkpoint_page=None, checkpoint_started_at=None)
+        if not update_facets:
+            rebuild_facets(publication_id)
+        defaults['subscriber_count'] = Subscriber.objects.filter(publication_id=publication_id).count()
+        SyncState.objects.update_or_create(publication_id=publication_id, defaults=defaults)
+
+    rank_publication(publication_id)
+    refresh_churn(publication_id, now=run_started)
+    refresh_rollups(publication_id, now=run_started)
+    invalidate_publication(publication_id)
+    try:
+        if mode == 'full' or snapshot_due(publication_id, now=run_started):
+            write_snapshot(publication_id, taken_at=run_started)
+        prune_snapshots(publication_id, now=run_started)
+    except (OSError, SnapshotError):
+        # The sync itself is stored; a missing snapshot only leaves a gap in the history
+        logger.exception('Could not write the snapshot of %s', publication_id)
+
+    duration = (timezone.now() - run_started).total_seconds()
+    sync_pages.inc(pages_stored, mode=mode)
+    sync_records.inc(count, mode=mode)
+    sync_seconds.observe(duration, mode=mode)
+    sync_records_per_second.set(round(count / duration, 1) if duration else 0, mode=mode)
+
+    logger.info(
+        'Synced %s subscribers for %s (%s sync, %s pages, %s removed) in %.1fs',
+        count, publication_id, mode, pages_stored, removed, duration
+    )
+    return count
@@ -0,0 +1,160 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .locks import acquire_lock, release_lock
+from .models import SyncJob, SyncState
+from .publications import get_client, get_publication, publication_configs
+from .sync import sync_publication
+from .webhooks import apply_pending_events, pending_events
+
+logger = logging.getLogger(__name__)
+
+
+def _lock_key(publication_id):
+    return f'subscribers:{publication_id}:sync-lock'
+
+
+def acquire_sync_lock(publication_id):
+    """Take the publication's sync lock; returns a token, or None if it is held.
+
+    The lock lives in the shared cache (Redis in production), so it holds
+    across workers and hosts.
+    """
+    return acquire_lock(_lock_key(publication_id), settings.SUBSCRIBERS_SYNC_LOCK_TIMEOUT)
+
+
+def release_sync_lock(publication_id, token):
+    """Release the publication's sync lock, then apply webhook events queued while it was held."""
+    release_lock(_lock_key(publication_id), token)
+    if pending_events(publication_id).exists():
+        schedule_webhook_apply(publication_id)
+
+
+def active_sync_job(publication_id):
+    """The queued or running job of a publication, ignoring ones old enough to be dead."""
+    cutoff = timezone.now() - timedelta(seconds=settings.SUBSCRIBERS_SYNC_LOCK_TIMEOUT)
+    return SyncJob.objects.filter(
+        publication_id=publication_id,
+        status__in=[SyncJob.QUEUED, SyncJob.RUNNING],
+        created_at__gte=cutoff,
+    ).order_by('-created_at').first()
+
+
+def enqueue_sync(publication_id, mode='auto'):
+    """Record a queued SyncJob and hand it to Celery."""
+    job = SyncJob.objects.create(publication_id=publication_id, mode=mode)
+    sync_publication_task.delay(job.id)
+    job.refresh_from_db()  # eager mode has already run it
+    return job
+
+
+@shared_task
+def sync_publication_task(job_id):
+    job = SyncJob.objects.get(id=job_id)
+    config = get_publication(job.publication_id)
+    if config is None:
+        job.status = SyncJob.FAILED
+        job.error = 'Publication is not configured'
+        job.finished_at = timezone.now()
+        job.save()
+        return
+
+    token = acquire_sync_lock(job.publication_id)
+    if token is None:
+        logger.info('Sync of %s already running, skipping job %s', job.publication_id, job.id)
+        job.status = SyncJob.SKIPPED
+        job.finished_at = timezone.now()
+        job.save()
+        return
+
+    try:
+        job.status = SyncJob.RUNNING
+        job.started_at = timezone.now()
+        job.save()
+
+        def progress(pages, records):
+            SyncJob.objects.filter(id=job.id).update(pages_fetched=pages, records_synced=records)
+
+        records = sync_publication(get_client(config), mode=job.mode, progress=progress)
+
+        job.refresh_from_db()
+        job.status = SyncJob.SUCCEEDED
+        job.records_synced = records
+    except Exception as e:
+        logger.exception('Sync of %s failed', job.publication_id)
+        job.refresh_from_db()
+        job.status = SyncJob.FAILED
+        job.error = f'{e}\n{traceback.format_exc()}'
+    finally:
+        job.finished_at = timezone.now()
+        job.save()
+        release_sync_lock(job.publication_id, token)
+
+
+def fair_order(publication_ids):
+    """Publications ordered least recently synced first (never-synced ones lead)."""
+    last_synced = dict(
+        SyncState.objects.filter(publication_id__in=publication_ids)
+        .values_list('publication_id', 'last_synced_at')
+    )
+    return sorted(
+        publication_ids,
+        key=lambda publication_id: (last_synced.get(publication_id) is not None,
+                                    last_synced.get(publication_id) or 0),
+    )
+
+
+@shared_task
+def sync_all_publications(mode='auto'):
+    """Queue a sync job for every publication.
+
+    Each publication is its own task, so workers sync publications in
+    parallel. They are queued least recently synced first; together with
+    one-task prefetch (CELERY_WORKER_PREFETCH_MULTIPLIER) no tenant waits
+    behind a long queue on a busy worker.
+    """
+    publication_ids = [config['publication_id'] for config in publication_configs()]
+    for publication_id in fair_order(publication_ids):
+        if active_sync_job(publication_id) is None:
+            enqueue_sync(publication_id, mode=mode)
+
+
+def _webhook_scheduled_key(publication_id):
+    return f'subscribers:{publication_id}:webhooks-scheduled'
+
+
+def schedule_webhook_apply(publication_id):
+    """Apply the publication's queued webhook events shortly.
+
+    At most one task is scheduled per publication at a time; events that
+    arrive before it runs are applied in the same batch.
+    """
+    delay = settings.WEBHOOK_APPLY_DELAY
+    if cache.add(_webhook_scheduled_key(publication_id), 1, timeout=delay + 60):
+        apply_webhook_events.apply_async((publication_id,), countdown=delay)
+
+
+@shared_task
+def apply_webhook_events(publication_id):
+    """Apply the publication's queued webhook events under its sync lock.
+
+    Syncs and applies write the same rows, facets and rollups, so they
+    never run at once. If the lock is held, whoever holds it schedules
+    the events when releasing it.
+    """
+    token = acquire_sync_lock(publication_id)
+    if token is None:
+        cache.delete(_webhook_scheduled_key(publication_id))
+        return 0
+    try:
+        # Events queued from here on schedule another run
+        cache.delete(_webhook_scheduled_key(publication_id))
+        return apply_pending_events(publication_id)
+    finally:
+        release_sync_lock(publication_id, token)
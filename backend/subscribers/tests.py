@@ -1,3 +1,919 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import numpy as np
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .beehiiv_client import AsyncBeehiivClient, BeehiivAPIError, BeehiivClient
+from .churn import compute_churn
+from .enrichment import calculate_days_to_unsubscribe, enrich_subscribers, parse_dates, to_datetimes
+from .facets import rebuild_facets
+from .instrumentation import Counter, Histogram, Registry
+from .publications import (
+    CacheRateLimiter, client_pool, get_client, get_publication, publication_configs, save_publication
+)
+from .locks import RELEASE_SCRIPT, release_lock
+from .models import DailyRollup, RankingPreset, Subscriber, SyncJob, SyncState, UtmFacet, WebhookEvent
+from .queries import keyset_condition, order_subscribers
+from .ranking import compute_scores, rank_publication, rerank_subscribers, top_k
+from .renderers import dumps
+from .response_cache import cache_key, cached_payload
+from .rollups import SNAPSHOT_FIELDS, refresh_rollups
+from .snapshots import (
+    engagement_history, list_snapshots, load_snapshot, prune_snapshots, snapshot_due, snapshot_ids
+)
+from .sync import sync_publication, upsert_subscribers
+from .tasks import acquire_sync_lock, enqueue_sync, release_sync_lock, sync_all_publications
+from .webhooks import SIGNATURE_HEADER, TIMESTAMP_HEADER, sign
+
+
+def setUpModule():
+    # Syncs archive snapshots; keep the test runs' out of the project
+    snapshot_dir = tempfile.mkdtemp()
+    snapshots = override_settings(SUBSCRIBER_SNAPSHOT_DIR=snapshot_dir)
+    snapshots.enable()
+    unittest.addModuleCleanup(shutil.rmtree, snapshot_dir, ignore_errors=True)
+    unittest.addModuleCleanup(snapshots.disable)
+
+
+def make_subscriber(n, status='active', clicks=0, **extra):
+    record = {
+        'id': f'sub_{n}',
+        'email': f'user{n}@example.com',
+        'status': status,
+        'created_at': '2024-01-01T00:00:00Z',
+        'updated_at': '2024-01-11T00:00:00Z',
+        'utm_source': 'twitter',
+        'utm_channel': 'social',
+        'stats': {
+            'total_received': 10,
+            'open_rate': 50.0,
+            'click_rate': 10.0,
+            'total_clicked': clicks,
+            'total_unique_clicked': clicks,
+        },
+    }
+    record.update(extra)
+    return record
+
+
+class FakeClient:
+    def __init__(self, subscribers, publication_id='pub_test'):
+        self.subscribers = subscribers
+        self.publication_id = publication_id
+        self.api_key = 'key'
+        self.requests = 0
+
+    def get_subscribers(self, page=1, limit=100, order_by=None, direction=None):
+        self.requests += 1
+        records = list(self.subscribers)
+        if order_by == 'created':
+            records.sort(key=lambda r: r['created_at'], reverse=direction == 'desc')
+        start = (page - 1) * limit
+        return {'data': records[start:start + limit], 'page': page, 'limit': limit}
+
+    def iter_pages(self, concurrency=None, limit=1000, start_page=1):
+        for start in range((start_page - 1) * limit, len(self.subscribers), limit):
+            self.requests += 1
+            yield self.subscribers[start:start + limit]
+
+
+class FakeRedis:
+    """The few hash commands the shared metrics use, on a dict."""
+
+    def __init__(self):
+        self.hashes = {}
+
+    def hincrbyfloat(self, name, field, amount):
+        values = self.hashes.setdefault(name, {})
+        values[field.encode()] = str(float(values.get(field.encode(), 0)) + amount).encode()
+
+    hincrby = hincrbyfloat
+
+    def hset(self, name, field, value):
+        self.hashes.setdefault(name, {})[field.encode()] = str(value).encode()
+
+    def hgetall(self, name):
+        return dict(self.hashes.get(name, {}))
+
+    def pipeline(self, transaction=True):
+        return mock.Mock(hincrby=self.hincrby, hincrbyfloat=self.hincrbyfloat)
+
+
+class PagedClientTests(TestCase):
+    def make_client(self, total, page_size=1000, **kwargs):
+        records = [make_subscriber(n) for n in range(total)]
+        client = BeehiivClient('key', 'pub_test', requests_per_second=1000, **kwargs)
+
+        def get_subscribers(page=1, limit=100, **params):
+            start = (page - 1) * limit
+            return {'data': records[start:start + limit], 'total_pages': -(-total // limit)}
+
+        client.get_subscribers = mock.Mock(side_effect=get_subscribers)
+        return client, records
+
+    def test_concurrent_fetch_matches_sequential(self):
+        client, records = self.make_client(4500)
+        self.assertEqual(client.get_all_subscribers(), records)
+        self.assertEqual(client.get_all_subscribers(concurrency=3), records)
+        # 5 pages + the empty page that ends the sequential walk
+        self.assertEqual(client.get_subscribers.call_count, 6 + 5)
+
+    def test_iter_subscribers_streams_pages(self):
+        client, records = self.make_client(2500)
+        stream = client.iter_subscribers()
+        self.assertEqual(next(stream), records[0])
+        self.assertEqual(client.get_subscribers.call_count, 1)
+
+    def test_metrics_without_subscriber_list(self):
+        client, records = self.make_client(3)
+        client.get_subscribers.side_effect = [
+            {'data': [make_subscriber(1, clicks=1), make_subscriber(2, status='inactive')]},
+            {'data': [make_subscriber(3)]},
+            {'data': []},
+        ]
+        metrics = client.get_subscriber_metrics(include_subscribers=False)
+        self.assertNotIn('subscribers', metrics)
+        self.assertEqual(metrics['total_subscribers'], 3)
+        self.assertEqual(metrics['active_subscribers'], 2)
+        self.assertEqual(metrics['percent_clicked_once'], 33.3)
+
+    def test_transport_retries_server_errors_and_rate_limits(self):
+        client = BeehiivClient('key', 'pub_test', requests_per_second=1000)
+        client.transport.backoff = lambda attempt: 0
+        responses = [
+            mock.Mock(status_code=503, headers={}),
+            mock.Mock(status_code=429, headers={'Retry-After': '0'}),
+            mock.Mock(status_code=200, headers={}, json=lambda: {'data': []}),
+        ]
+        with mock.patch.object(client.session, 'get', side_effect=responses) as get:
+            self.assertEqual(client.get_subscribers(page=1), {'data': []})
+
+        self.assertEqual(get.call_count, 3)
+        self.assertEqual(get.call_args.kwargs['timeout'], (5, 30))
+        self.assertEqual([t.status_code for t in client.transport.timings], [503, 429, 200])
+
+    def test_transport_gives_up_after_max_retries(self):
+        client = BeehiivClient('key', 'pub_test', requests_per_second=1000, max_retries=1)
+        client.transport.backoff = lambda attempt: 0
+        with mock.patch.object(client.session, 'get', return_value=mock.Mock(status_code=502, headers={}, text='Bad gateway')):
+            with self.assertRaises(BeehiivAPIError):
+                client.get_subscribers(page=1)
+
+    def test_async_client_pages_concurrently_and_retries(self):
+        records = [make_subscriber(n) for n in range(4500)]
+        client = AsyncBeehiivClient('key', 'pub_test', requests_per_second=1000)
+
+        async def get_subscribers(page=1, limit=100, **params):
+            await asyncio.sleep(0)
+            start = (page - 1) * limit
+            return {'data': records[start:start + limit], 'total_pages': 5}
+
+        with mock.patch.object(client, 'get_subscribers', side_effect=get_subscribers):
+            self.assertEqual(asyncio.run(client.get_all_subscribers(concurrency=3)), records)
+            self.assertEqual(asyncio.run(client.get_all_subscribers()), records)
+
+        client.transport.backoff = lambda attempt: 0
+        responses = [
+            httpx.Response(503),
+            httpx.Response(429, headers={'Retry-After': '0'}),
+            httpx.Response(200, json={'data': []}),
+        ]
+        with mock.patch.object(client.transport.client, 'get', side_effect=responses) as get:
+            self.assertEqual(asyncio.run(client.get_subscribers(page=1)), {'data': []})
+        self.assertEqual(get.call_count, 3)
+        self.assertEqual(get.call_args.kwargs['params']['expand[]'], ['stats', 'utm_data'])
+        self.assertEqual([t.status_code for t in client.transport.timings], [503, 429, 200])
+
+
+class RankingTests(TestCase):
+    def test_top_k_matches_full_sort(self):
+        rng = np.random.default_rng(0)
+        arrays = {
+            'open_rate': rng.uniform(0, 100, 5000),
+            'total_clicked': rng.integers(0, 50, 5000).astype(float),
+        }
+        scores = compute_scores(arrays, {'open_rate': 1, 'total_clicked': 3})
+        self.assertTrue(((scores >= 0) & (scores <= 1)).all())
+        expected = np.argsort(-scores, kind='stable')[:25]
+        np.testing.assert_array_equal(scores[top_k(scores, 25)], scores[expected])
+
+    def test_sync_stores_rank_using_publication_preset(self):
+        RankingPreset.objects.create(
+            publication_id='pub_test', name='clicks', weights={'total_clicked': 1}, is_default=True
+        )
+        sync_publication(FakeClient([make_subscriber(n, clicks=n) for n in range(1, 5)]))
+
+        ranked = Subscriber.objects.order_by('engagement_rank')
+        self.assertEqual([s.beehiiv_id for s in ranked], ['sub_4', 'sub_3', 'sub_2', 'sub_1'])
+        self.assertEqual([s.engagement_percentile for s in ranked], [100.0, 75.0, 50.0, 25.0])
+
+        # Re-ranking unchanged data writes nothing; only moved rows are written
+        with mock.patch('subscribers.ranking.store_ranks') as store:
+            rank_publication('pub_test')
+            store.assert_not_called()
+            Subscriber.objects.filter(beehiiv_id='sub_1').update(total_clicked=10)
+            rank_publication('pub_test')
+            self.assertEqual(len(store.call_args.args[0]), 4)
+
+    def test_rerank_places_changed_subscribers_among_stored_scores(self):
+        cache.clear()
+        sync_publication(FakeClient([make_subscriber(n, clicks=n) for n in range(1, 9)]))
+        # Within the stored bounds, so only the two rows are re-scored
+        Subscriber.objects.filter(beehiiv_id='sub_2').update(total_clicked=6, total_unique_clicked=6)
+        Subscriber.objects.filter(beehiiv_id='sub_7').update(total_clicked=3, total_unique_clicked=3)
+
+        def reranked():
+            self.assertEqual(rerank_subscribers('pub_test', ['sub_2', 'sub_7']), 2)
+            return dict(Subscriber.objects.values_list('beehiiv_id', 'engagement_rank'))
+
+        counted = reranked()
+        with mock.patch('subscribers.ranking.RERANK_COUNT_LIMIT', 0):
+            self.assertEqual(reranked(), counted)
+        # Each lands just below the stored row it now ties with
+        self.assertEqual((counted['sub_2'], counted['sub_7']), (2, 6))
+
+
+class EnrichmentTests(TestCase):
+    def test_batch_dates_and_days_to_unsubscribe(self):
+        records = [
+            {'id': 1, 'status': 'inactive', 'created_at': '2024-01-01T00:00:00.500Z', 'updated_at': '2024-01-31T12:00:00.000Z'},
+            {'id': 2, 'status': 'inactive', 'created_at': '2024-01-01T00:00:00Z', 'updated_at': '2023-12-01 00:00:00'},
+            {'id': 3, 'status': 'inactive', 'created': 1704067200, 'updated_at': None},
+            {'id': 4, 'status': 'active', 'created_at': '2024-01-01T00:00:00Z', 'updated_at': '2024-03-01T00:00:00Z'},
+        ]
+        created, _ = enrich_subscribers(records)
+
+        self.assertEqual([r.get('days_to_unsubscribe') for r in records], [30, 0, None, None])
+        self.assertEqual(to_datetimes(created)[2], datetime(2024, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(calculate_days_to_unsubscribe(records[0]), 30)
+
+    def test_churn_histogram_and_cohort_survival(self):
+        now = datetime(2024, 12, 1, tzinfo=dt_timezone.utc)
+        created = parse_dates(['2024-01-05T00:00:00Z'] * 4 + ['2024-11-10T00:00:00Z'])
+        days = np.array([np.nan, 3, 45, 400, 2])
+        inactive = np.array([False, True, True, True, True])
+
+        churn = compute_churn(created, days, inactive, now)
+
+        self.assertEqual(churn['unsubscribed'], 4)
+        self.assertEqual({b['bucket']: b['count'] for b in churn['histogram'] if b['count']},
+                         {'1-6': 2, '30-89': 1, '365+': 1})
+        january, november = churn['cohorts']
+        self.assertEqual((january['month'], january['subscribers'], january['active']), ('2024-01', 4, 1))
+        self.assertEqual(january['survival'], {'30': 0.75, '90': 0.5, '180': 0.5, '365': None})
+        self.assertEqual(november['survival']['30'], None)
+
+
+class SubscriberViewTests(TestCase):
+    config = {'api_key': 'key', 'publication_id': 'pub_test'}
+
+    def setUp(self):
+        cache.clear()
+        save_publication(self.config['api_key'], self.config['publication_id'])
+
+    def test_reads_from_local_store(self):
+        sync_publication(FakeClient([
+            make_subscriber(1, clicks=2),
+            make_subscriber(2, status='inactive'),
+        ]))
+
+        with mock.patch('subscribers.tasks.get_client') as get_client:
+            response = self.client.get('/api/subscribers/')
+            get_client.assert_not_called()
+
+        body = response.json()
+        self.assertEqual(body['total_subscribers'], 2)
+        self.assertEqual(body['percent_clicked_once'], 50.0)
+        self.assertEqual(body['subscribers'][1]['days_to_unsubscribe'], 10)
+
+    def test_churn_is_precomputed_by_sync(self):
+        self.assertEqual(self.client.get('/api/subscribers/churn/').status_code, 404)
+        sync_publication(FakeClient([
+            make_subscriber(1),
+            make_subscriber(2, status='inactive'),
+        ]))
+
+        body = self.client.get('/api/subscribers/churn/').json()
+        self.assertEqual((body['subscribers'], body['unsubscribed']), (2, 1))
+        self.assertEqual(body['median_days_to_unsubscribe'], 10)
+        self.assertEqual(body['cohorts'][0]['month'], '2024-01')
+
+    def test_summary_and_trends_read_daily_rollups(self):
+        sync_publication(FakeClient([
+            make_subscriber(1, clicks=2, stats={'open_rate': 95.0, 'click_rate': 20.0, 'total_unique_clicked': 1}),
+            make_subscriber(2, status='inactive'),
+            make_subscriber(3, created_at='2024-01-03T00:00:00Z'),
+        ]))
+
+        publication_configs()  # warm the in-process config cache
+        with self.assertNumQueries(1):
+            summary = self.client.get('/api/subscribers/summary/').json()
+        self.assertEqual(summary['total_subscribers'], 3)
+        self.assertEqual(summary['percent_clicked_once'], 33.3)
+        self.assertEqual(summary['open_rate_distribution'], [0, 0, 0, 0, 0, 2, 0, 0, 0, 1])
+        self.assertEqual(summary['average_open_rate'], 65.0)
+
+        response = self.client.get('/api/subscribers/trends/', {'start': '2024-01-01', 'end': '2024-01-11'})
+        days = {day['date']: day for day in response.json()['days']}
+        self.assertEqual(len(days), 11)
+        self.assertEqual(days['2024-01-01']['new_subscribers'], 2)
+        self.assertEqual(days['2024-01-03']['new_subscribers'], 1)
+        self.assertEqual(days['2024-01-11']['unsubscribed'], 1)
+        self.assertEqual(self.client.get('/api/subscribers/trends/', {'days': 'x'}).status_code, 400)
+
+    def test_summary_errors_are_json(self):
+        with mock.patch('subscribers.views.latest_rollup', side_effect=RuntimeError('boom')), \
+                self.assertLogs('subscribers.views', 'ERROR'):
+            response = self.client.get('/api/subscribers/summary/')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json()['message'], 'Error loading summary: boom')
+
+    def test_syncs_archive_snapshots_for_history_queries(self):
+        def subscriber(n, open_rate, status='active'):
+            record = make_subscriber(n, status=status)
+            record['stats'] = {**record['stats'], 'open_rate': open_rate}
+            return record
+
+        snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, snapshot_dir)
+        snapshots_setting = override_settings(SUBSCRIBER_SNAPSHOT_DIR=snapshot_dir)
+        snapshots_setting.enable()
+        self.addCleanup(snapshots_setting.disable)
+        sync_publication(FakeClient([subscriber(1, 60.0), subscriber(2, 40.0)]), mode='full')
+        sync_publication(FakeClient([subscriber(1, 30.0), subscriber(2, 40.0, 'inactive'), subscriber(3, 90.0)]),
+                         mode='full')
+
+        snapshots = list_snapshots('pub_test')
+        self.assertEqual(len(snapshots), 2)
+        latest = load_snapshot(snapshots[-1][1], ['active', 'id_buffer', 'id_offsets'])
+        self.assertEqual(set(latest), {'active', 'id_buffer', 'id_offsets'})
+        self.assertEqual(sorted(snapshot_ids(latest)), ['sub_1', 'sub_2', 'sub_3'])
+
+        body = self.client.get('/api/subscribers/history/', {'field': 'open_rate'}).json()
+        self.assertEqual([(p['active'], p['mean']) for p in body['trend']], [(2, 50.0), (2, 60.0)])
+        # The first sync's active readers: sub_2 left, sub_1 engages less
+        self.assertEqual((body['cohort']['cohort_size'], body['cohort']['baseline']), (2, 50.0))
+        self.assertEqual(body['cohort']['points'][-1]['retained'], 1)
+        self.assertEqual(body['cohort']['points'][-1]['change'], -20.0)
+
+        tomorrow = (timezone.now() + timedelta(days=1)).date()
+        self.assertEqual(engagement_history('pub_test', 'open_rate', start=tomorrow)['trend'], [])
+        response = self.client.get('/api/subscribers/history/', {'field': 'email'})
+        self.assertEqual(response.status_code, 400)
+
+        # Incremental syncs snapshot only once the latest snapshot is a day old
+        sync_publication(FakeClient([subscriber(1, 30.0)]), mode='incremental')
+        self.assertEqual(len(list_snapshots('pub_test')), 2)
+        later = timezone.now() + timedelta(days=2)
+        self.assertTrue(snapshot_due('pub_test', now=later))
+        with override_settings(SUBSCRIBER_SNAPSHOT_RETENTION_DAYS=1):
+            self.assertEqual(prune_snapshots('pub_test', now=later), 2)
+        self.assertEqual(list_snapshots('pub_test'), [])
+
+    def test_facets_follow_full_and_incremental_syncs(self):
+        records = [
+            make_subscriber(1, clicks=1),
+            make_subscriber(2, status='inactive'),
+            make_subscriber(3, utm_source='google', utm_campaign='spring'),
+        ]
+        client = FakeClient(records)
+        sync_publication(client, mode='full')
+
+        records[1]['utm_source'] = 'google'
+        records[1]['updated_at'] = '2030-01-01T00:00:00Z'
+        records.append(make_subscriber(4, utm_source='google', created_at='2030-01-02T00:00:00Z', clicks=3))
+        with mock.patch('subscribers.sync.rebuild_facets') as rebuild:
+            sync_publication(client, mode='incremental')
+            rebuild.assert_not_called()
+
+        body = self.client.get('/api/subscribers/facets/', {'by': 'utm_source'}).json()
+        self.assertEqual(body['facets'], [
+            {'utm_source': 'google', 'subscribers': 3, 'active': 2, 'clicked_once': 1,
+             'percent_clicked_once': 33.3, 'total_clicks': 3, 'average_open_rate': 50.0, 'average_click_rate': 10.0},
+            {'utm_source': 'twitter', 'subscribers': 1, 'active': 1, 'clicked_once': 1,
+             'percent_clicked_once': 100.0, 'total_clicks': 1, 'average_open_rate': 50.0, 'average_click_rate': 10.0},
+        ])
+        # the deltas agree with a from-scratch rebuild
+        by_key = lambda: sorted(UtmFacet.objects.values_list('utm_source', 'utm_campaign', 'subscribers', 'active'))
+        incremental = by_key()
+        rebuild_facets('pub_test')
+        self.assertEqual(by_key(), incremental)
+        self.assertEqual(self.client.get('/api/subscribers/facets/', {'by': 'nope'}).status_code, 400)
+
+    def post_webhook(self, events, secret='whsec', timestamp=None):
+        body = json.dumps(events).encode()
+        timestamp = str(timestamp or int(time.time()))
+        return self.client.post(
+            '/api/webhooks/beehiiv/pub_test/', body, content_type='application/json',
+            headers={TIMESTAMP_HEADER: timestamp, SIGNATURE_HEADER: f'sha256={sign(secret, timestamp, body)}'},
+        )
+
+    def test_webhooks_require_a_valid_recent_signature(self):
+        event = {'uid': 'evt_1', 'event_type': 'subscription.created', 'data': make_subscriber(1)}
+        self.assertEqual(self.post_webhook(event).status_code, 403)
+
+        save_publication('key', 'pub_test', webhook_secret='whsec')
+        self.assertEqual(self.post_webhook(event, secret='wrong').status_code, 401)
+        self.assertEqual(self.post_webhook(event, timestamp=int(time.time()) - 3600).status_code, 401)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+        response = self.post_webhook(event)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {'received': 1, 'queued': 1})
+        self.assertTrue(Subscriber.objects.filter(beehiiv_id='sub_1').exists())
+        # A redelivery is dropped and schedules nothing
+        with mock.patch('subscribers.views.schedule_webhook_apply') as schedule:
+            response = self.post_webhook(event)
+        self.assertEqual(response.json(), {'received': 1, 'queued': 0})
+        schedule.assert_not_called()
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+
+    def test_webhook_events_wait_for_a_running_sync(self):
+        save_publication('key', 'pub_test', webhook_secret='whsec')
+        token = acquire_sync_lock('pub_test')
+        event = {'uid': 'evt_1', 'event_type': 'subscription.created', 'data': make_subscriber(1)}
+        self.assertEqual(self.post_webhook(event).json()['queued'], 1)
+        self.assertFalse(Subscriber.objects.exists())
+
+        # Releasing the lock applies what was queued meanwhile
+        release_sync_lock('pub_test', token)
+        self.assertTrue(Subscriber.objects.filter(beehiiv_id='sub_1').exists())
+        self.assertFalse(WebhookEvent.objects.filter(processed_at__isnull=True).exists())
+
+    def test_webhook_events_are_coalesced_into_incremental_updates(self):
+        save_publication('key', 'pub_test', webhook_secret='whsec')
+        sync_publication(FakeClient([make_subscriber(1), make_subscriber(2), make_subscriber(3, clicks=1)]))
+
+        clicked = make_subscriber(1, clicks=5, stats={'open_rate': 90.0, 'click_rate': 40.0, 'total_clicked': 5,
+                                                      'total_unique_clicked': 2, 'total_received': 10})
+        events = [
+            {'uid': 'evt_1', 'event_type': 'subscription.updated', 'data': clicked},
+            {'uid': 'evt_2', 'event_type': 'subscription.unsubscribed', 'data': {'id': 'sub_1'}},
+            {'uid': 'evt_3', 'event_type': 'subscription.deleted', 'data': {'id': 'sub_2'}},
+            {'uid': 'evt_4', 'event_type': 'subscription.created', 'data': make_subscriber(4, utm_source='google')},
+            {'uid': 'evt_5', 'event_type': 'post.sent', 'data': {'id': 'post_1'}},
+        ]
+        with mock.patch('subscribers.webhooks.upsert_subscribers', wraps=upsert_subscribers) as upsert, \
+                mock.patch('subscribers.sync.rebuild_facets') as rebuild:
+            response = self.post_webhook(events)
+        self.assertEqual(response.json(), {'received': 5, 'queued': 4})
+        upsert.assert_called_once()
+        self.assertEqual(len(upsert.call_args.args[1]), 2)
+        rebuild.assert_not_called()
+
+        first = Subscriber.objects.get(beehiiv_id='sub_1')
+        self.assertEqual((first.status, first.total_clicked), ('inactive', 5))
+        self.assertEqual(first.data['email'], 'user1@example.com')
+        self.assertFalse(Subscriber.objects.filter(beehiiv_id='sub_2').exists())
+        self.assertEqual(SyncState.objects.get(publication_id='pub_test').subscriber_count, 3)
+        self.assertIsNotNone(Subscriber.objects.get(beehiiv_id='sub_4').engagement_rank)
+
+        # The deltas agree with recomputing from the table
+        rollup_fields = (*SNAPSHOT_FIELDS, 'open_rate_distribution', 'click_rate_distribution',
+                         'new_subscribers', 'unsubscribed')
+        rollups = lambda: list(DailyRollup.objects.order_by('date').values_list(*rollup_fields))
+        facets = lambda: sorted(UtmFacet.objects.values_list('utm_source', 'subscribers', 'active', 'total_clicks'))
+        incremental = rollups(), facets()
+        refresh_rollups('pub_test')
+        rebuild_facets('pub_test')
+        self.assertEqual((rollups(), facets()), incremental)
+
+        # Within the last ranking's bounds only the changed subscriber is re-scored
+        ranks = dict(Subscriber.objects.values_list('beehiiv_id', 'engagement_rank'))
+        opened = make_subscriber(4, stats={'open_rate': 90.0, 'click_rate': 20.0, 'total_received': 10})
+        event = {'uid': 'evt_6', 'event_type': 'subscription.updated', 'data': opened}
+        with mock.patch('subscribers.ranking.rank_publication') as rank:
+            self.post_webhook(event)
+            rank.assert_not_called()
+        self.assertEqual(Subscriber.objects.get(beehiiv_id='sub_4').engagement_rank, ranks['sub_3'])
+
+    def test_publications_are_cached_and_selected_per_request(self):
+        save_publication('key', 'pub_other', name='Other')
+        sync_publication(FakeClient([make_subscriber(1)]))
+        sync_publication(FakeClient([make_subscriber(1), make_subscriber(2)], publication_id='pub_other'))
+
+        publication_configs()
+        with self.assertNumQueries(0):
+            self.assertEqual([c['publication_id'] for c in publication_configs()], ['pub_test', 'pub_other'])
+        self.assertEqual(self.client.get('/api/subscribers/').json()['total_subscribers'], 1)
+        response = self.client.get('/api/subscribers/', {'publication': 'pub_other'})
+        self.assertEqual(response.json()['total_subscribers'], 2)
+        self.assertEqual(self.client.get('/api/subscribers/', {'publication': 'nope'}).status_code, 404)
+
+        # Changing a publication invalidates the cached list
+        save_publication('key', 'pub_other', name='Renamed', make_default=True)
+        names = [p['name'] for p in self.client.get('/api/publications/').json()['publications']]
+        self.assertEqual(names, ['Renamed', ''])
+
+    def test_pooled_clients_share_a_rate_limit_per_api_key(self):
+        client_pool.clear()
+        first = get_client({'api_key': 'key', 'publication_id': 'pub_a'})
+        self.assertIs(get_client({'api_key': 'key', 'publication_id': 'pub_a'}), first)
+        second = get_client({'api_key': 'key', 'publication_id': 'pub_b'})
+        other = get_client({'api_key': 'other-key', 'publication_id': 'pub_c'})
+        self.assertIsNot(second, first)
+        self.assertIs(second.rate_limiter, first.rate_limiter)
+        self.assertIsNot(other.rate_limiter, first.rate_limiter)
+        self.assertIsNot(get_client({'api_key': 'new-key', 'publication_id': 'pub_a'}), first)
+
+        limiter = CacheRateLimiter('test', rate=3)
+        with mock.patch('subscribers.publications.time.sleep') as sleep, \
+                mock.patch('subscribers.publications.time.time', return_value=1000.2):
+            for _ in range(3):
+                limiter.acquire()
+            sleep.assert_not_called()
+            sleep.side_effect = RuntimeError('would wait')
+            with self.assertRaises(RuntimeError):
+                limiter.acquire()
+
+        # 2.5/s is 3 per 1.2s, and a full window just before a boundary
+        # still counts against the start of the next one
+        limiter = CacheRateLimiter('test-fraction', rate=2.5)
+        self.assertEqual((limiter.capacity, limiter.window), (3, 1.2))
+        with mock.patch('subscribers.publications.time.time', return_value=1199.9):
+            self.assertEqual([limiter.reserve() for _ in range(3)], [0, 0, 0])
+        with mock.patch('subscribers.publications.time.time', return_value=1200.0):
+            self.assertAlmostEqual(limiter.reserve(), 0.4)
+        with mock.patch('subscribers.publications.time.time', return_value=1200.5):
+            self.assertEqual(limiter.reserve(), 0)
+
+    def test_save_config_checks_credentials_with_the_async_client(self):
+        client = mock.MagicMock()
+        client.__aenter__.return_value = client
+        client.get_subscribers = mock.AsyncMock(return_value={'data': []})
+        with mock.patch('subscribers.views.get_async_client', return_value=client):
+            response = self.client.post('/api/config', {'apiKey': 'new-key', 'publicationId': 'pub_new'},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        client.get_subscribers.assert_awaited_once()
+        client.__aexit__.assert_awaited_once()
+        self.assertIsNotNone(get_publication('pub_new'))
+
+        client.get_subscribers.side_effect = BeehiivAPIError(401)
+        with mock.patch('subscribers.views.get_async_client', return_value=client):
+            response = self.client.post('/api/config', {'apiKey': 'bad', 'publicationId': 'pub_bad'},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        self.assertIsNone(get_publication('pub_bad'))
+
+    def test_sync_all_queues_least_recently_synced_first(self):
+        save_publication('key', 'pub_new')
+        save_publication('key', 'pub_old')
+        SyncState.objects.create(publication_id='pub_test', last_synced_at=timezone.now())
+        SyncState.objects.create(publication_id='pub_old', last_synced_at=timezone.now() - timedelta(days=1))
+        with mock.patch('subscribers.tasks.sync_publication_task.delay'):
+            sync_all_publications()
+        queued = list(SyncJob.objects.order_by('id').values_list('publication_id', flat=True))
+        self.assertEqual(queued, ['pub_new', 'pub_old', 'pub_test'])
+
+    def test_first_load_syncs(self):
+        # Tests run Celery eagerly, so the queued sync has finished by the
+        # time the view checks again.
+        fake = FakeClient([make_subscriber(1)])
+        with mock.patch('subscribers.tasks.get_client', return_value=fake):
+            response = self.client.get('/api/subscribers/')
+
+        self.assertEqual(response.json()['total_subscribers'], 1)
+        self.assertTrue(SyncState.objects.filter(publication_id='pub_test').exists())
+        self.assertEqual(SyncJob.objects.get().status, SyncJob.SUCCEEDED)
+
+    def test_first_load_returns_202_while_sync_is_queued(self):
+        with mock.patch('subscribers.tasks.sync_publication_task.delay'):
+            response = self.client.get('/api/subscribers/')
+            self.client.get('/api/subscribers/')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['job']['status'], SyncJob.QUEUED)
+        self.assertEqual(SyncJob.objects.count(), 1)
+
+    def test_sync_status_reports_progress_and_errors(self):
+        fake = FakeClient([make_subscriber(n) for n in range(2500)])
+        with mock.patch('subscribers.tasks.get_client', return_value=fake):
+            response = self.client.post('/api/sync/', {'mode': 'full'})
+        self.assertEqual(response.status_code, 202)
+
+        body = self.client.get('/api/sync/').json()
+        self.assertEqual(body['subscriber_count'], 2500)
+        self.assertEqual(body['job']['status'], SyncJob.SUCCEEDED)
+        self.assertEqual(body['job']['pages_fetched'], 3)
+        self.assertEqual(body['job']['records_synced'], 2500)
+        self.assertIsNone(body['last_error'])
+
+        with mock.patch('subscribers.tasks.get_client', side_effect=BeehiivAPIError(500)):
+            self.client.post('/api/sync/', {'mode': 'full'})
+        body = self.client.get('/api/sync/').json()
+        self.assertEqual(body['job']['status'], SyncJob.FAILED)
+        self.assertIn('API Error (Status 500)', body['last_error']['error'])
+
+    def test_interrupted_full_sync_resumes_from_its_checkpoint(self):
+        records = [make_subscriber(n) for n in range(2500)]
+
+        class FlakyClient(FakeClient):
+            pages_before_failure = 2
+
+            def iter_pages(self, concurrency=None, limit=1000, start_page=1):
+                self.start_page = start_page
+                for served, page in enumerate(super().iter_pages(concurrency, limit, start_page)):
+                    if served == self.pages_before_failure:
+                        raise BeehiivAPIError(502)
+                    yield page
+
+        client = FlakyClient(records)
+        with self.assertRaises(BeehiivAPIError):
+            sync_publication(client, mode='full', batch_size=500)
+        state = SyncState.objects.get(publication_id='pub_test')
+        self.assertEqual((state.checkpoint_page, state.last_synced_at), (2, None))
+        self.assertEqual(Subscriber.objects.count(), 2000)
+
+        # The dashboard keeps waiting for the first sync to finish
+        with mock.patch('subscribers.views.queue_first_sync', return_value=SyncJob(publication_id='pub_test')):
+            self.assertEqual(self.client.get('/api/subscribers/').status_code, 202)
+
+        client.pages_before_failure = None
+        self.assertEqual(sync_publication(client, mode='full', batch_size=500), 1500)
+        self.assertEqual(client.start_page, 2)
+        state.refresh_from_db()
+        self.assertEqual((state.checkpoint_page, state.subscriber_count), (None, 2500))
+        self.assertEqual(state.last_synced_at, state.last_full_sync_at)
+
+        # Incremental syncs in between leave a full sync's checkpoint alone
+        SyncState.objects.filter(publication_id='pub_test').update(
+            checkpoint_page=2, checkpoint_started_at=timezone.now()
+        )
+        sync_publication(FakeClient(records[:1]), mode='incremental')
+        state.refresh_from_db()
+        self.assertEqual(state.checkpoint_page, 2)
+
+    def test_fetch_subscribers_command_reports_throughput(self):
+        output = io.StringIO()
+        with mock.patch('subscribers.management.commands.fetch_subscribers.build_client',
+                        return_value=FakeClient([make_subscriber(n) for n in range(1200)])):
+            call_command('fetch_subscribers', '--mode', 'full', '--batch-size', '1000', '-v', '2', stdout=output)
+        lines = output.getvalue().splitlines()
+        self.assertIn('2 pages, 1200 records stored', lines[-2])
+        self.assertIn('Synced 1200 subscribers', lines[-1])
+        self.assertIn('records/s', lines[-1])
+        self.assertEqual(Subscriber.objects.count(), 1200)
+
+        token = acquire_sync_lock('pub_test')
+        self.addCleanup(release_sync_lock, 'pub_test', token)
+        with self.assertRaisesMessage(CommandError, 'already running'):
+            call_command('fetch_subscribers', stdout=io.StringIO())
+
+    def test_overlapping_sync_is_skipped(self):
+        token = acquire_sync_lock('pub_test')
+        job = enqueue_sync('pub_test', mode='full')
+        self.assertEqual(job.status, SyncJob.SKIPPED)
+
+        release_sync_lock('pub_test', token)
+        with mock.patch('subscribers.tasks.get_client', return_value=FakeClient([])):
+            self.assertEqual(enqueue_sync('pub_test', mode='full').status, SyncJob.SUCCEEDED)
+
+        # A holder whose lock expired and was taken by another worker can't release it
+        token = acquire_sync_lock('pub_test')
+        cache.delete('subscribers:pub_test:sync-lock')
+        other = acquire_sync_lock('pub_test')
+        release_sync_lock('pub_test', token)
+        self.assertIsNone(acquire_sync_lock('pub_test'))
+        release_sync_lock('pub_test', other)
+
+        # On Redis the comparison and the delete are one script
+        redis_cache = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                   'LOCATION': 'redis://localhost:6379/0'}}
+        with override_settings(CACHES=redis_cache), \
+                mock.patch('django.core.cache.backends.redis.RedisCacheClient.get_client') as get_client:
+            self.assertIsInstance(caches['default'], RedisCache)
+            get_client.return_value.eval.return_value = 1
+            self.assertTrue(release_lock('lock', 42))
+        get_client.return_value.eval.assert_called_once_with(RELEASE_SCRIPT, 1, ':1:lock', 42)
+
+    def test_sorted_filtered_cursor_pages(self):
+        records = [
+            make_subscriber(n, clicks=n % 4, utm_source='google' if n % 2 else 'twitter')
+            for n in range(25)
+        ]
+        records[3]['status'] = 'inactive'
+        sync_publication(FakeClient(records))
+
+        params = {'sort': 'stats.total_clicked', 'direction': 'desc', 'limit': 4, 'utm_source': 'google'}
+        seen = []
+        cursor = None
+        while True:
+            body = self.client.get('/api/subscribers/', {**params, **({'cursor': cursor} if cursor else {})}).json()
+            seen.extend(sub['id'] for sub in body['subscribers'])
+            cursor = body['next_cursor']
+            if not cursor:
+                break
+
+        expected = sorted(
+            (r for r in records if r['utm_source'] == 'google'),
+            key=lambda r: (-r['stats']['total_clicked'], -int(r['id'].split('_')[1]))
+        )
+        self.assertEqual(seen, [r['id'] for r in expected])
+        self.assertEqual(body['total'], 12)
+        self.assertEqual(body['total_subscribers'], 25)
+        self.assertEqual(body['active_subscribers'], 24)
+        self.assertEqual(body['source_channels'], ['google/social', 'twitter/social'])
+
+        # NOT NULL sort keys page with one row comparison and no NULL handling
+        queryset, fields, descending = order_subscribers(Subscriber.objects.all(), params)
+        sql = str(queryset.filter(keyset_condition(fields, [2, 7], descending)).query)
+        self.assertIn('("subscribers_subscriber"."total_clicked", "subscribers_subscriber"."id") < (2, 7)', sql)
+        self.assertNotIn('NULL', sql)
+
+    def test_search_and_page_offset(self):
+        sync_publication(FakeClient([make_subscriber(n) for n in range(30)]))
+        body = self.client.get('/api/subscribers/', {'search': 'user1', 'limit': 5, 'page': 2}).json()
+        self.assertEqual(body['total'], 11)
+        self.assertEqual([s['id'] for s in body['subscribers']], [f'sub_{n}' for n in range(14, 19)])
+
+    def test_invalid_sort_is_rejected(self):
+        sync_publication(FakeClient([make_subscriber(1)]))
+        response = self.client.get('/api/subscribers/', {'sort': 'password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_top_subscribers(self):
+        sync_publication(FakeClient([make_subscriber(n, clicks=n) for n in range(10)]))
+        body = self.client.get('/api/subscribers/top/', {'k': 3, 'preset': 'clicks'}).json()
+        self.assertEqual([s['id'] for s in body['subscribers']], ['sub_9', 'sub_8', 'sub_7'])
+
+        # The default preset reads the stored ranks instead of scoring everyone
+        with mock.patch('subscribers.ranking.load_stats') as load_stats:
+            body = self.client.get('/api/subscribers/top/', {'k': 2}).json()
+        load_stats.assert_not_called()
+        expected = Subscriber.objects.order_by('engagement_rank').values_list('beehiiv_id', flat=True)[:2]
+        self.assertEqual([s['id'] for s in body['subscribers']], list(expected))
+
+        response = self.client.get('/api/subscribers/top/', {'preset': 'revenue'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cached_response_is_served_stale_then_refreshed(self):
+        sync_publication(FakeClient([make_subscriber(1)]))
+        self.assertEqual(self.client.get('/api/subscribers/').json()['total_subscribers'], 1)
+
+        # A sync invalidates the cache, but the old payload is still served
+        # immediately while a single refresh rebuilds it.
+        with mock.patch('subscribers.response_cache.refresh_in_background') as background:
+            sync_publication(FakeClient([make_subscriber(1), make_subscriber(2)]), mode='full')
+            self.assertEqual(self.client.get('/api/subscribers/').json()['total_subscribers'], 1)
+            self.assertEqual(self.client.get('/api/subscribers/').json()['total_subscribers'], 1)
+            self.assertEqual(background.call_count, 1)
+            background.call_args[0][0]()
+
+        self.assertEqual(self.client.get('/api/subscribers/').json()['total_subscribers'], 2)
+
+    def test_concurrent_misses_share_one_build(self):
+        builds = []
+        release = threading.Event()
+
+        def build():
+            builds.append(1)
+            release.wait(5)
+            return {'built': len(builds)}
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cached_payload('pub_test', 'slow', None, build)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual((len(builds), results), (1, [{'built': 1}] * 8))
+
+        # Another worker holds the build lock: wait for its entry instead of building
+        key = cache_key('pub_test', 'other', None)
+        cache.add(f'{key}:building', 'other-worker')
+        threading.Timer(0.2, lambda: cache.set(key, {'payload': 'theirs', 'version': 1, 'fresh_until': 0})).start()
+        self.assertEqual(cached_payload('pub_test', 'other', None, build), 'theirs')
+        self.assertEqual(len(builds), 1)
+
+    def test_conditional_get_and_precompressed_payload(self):
+        sync_publication(FakeClient([make_subscriber(n) for n in range(5)]))
+        response = self.client.get('/api/subscribers/')
+        etag = response['ETag']
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        unchanged = self.client.get('/api/subscribers/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((unchanged.status_code, unchanged.content), (304, b''))
+        since = self.client.get('/api/subscribers/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(since.status_code, 304)
+
+        compressed = self.client.get('/api/subscribers/', HTTP_ACCEPT_ENCODING='br;q=0, gzip, deflate')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(compressed['ETag'], etag)
+        self.assertEqual(gzip.decompress(compressed.content), response.content)
+        self.assertLess(len(compressed.content), len(response.content))
+
+        # Once the refresh after a sync has landed the old ETag no longer matches
+        with mock.patch('subscribers.response_cache.refresh_in_background', side_effect=lambda refresh: refresh()):
+            sync_publication(FakeClient([make_subscriber(n) for n in range(6)]), mode='full')
+            self.client.get('/api/subscribers/')
+        changed = self.client.get('/api/subscribers/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['total_subscribers'], 6)
+
+    @override_settings(SUBSCRIBERS_CACHE_TTL=300)
+    def test_cache_hit_skips_the_database(self):
+        sync_publication(FakeClient([make_subscriber(1)]))
+        self.client.get('/api/subscribers/', {'limit': 10})
+        with self.assertNumQueries(1):  # SyncState existence check only
+            self.client.get('/api/subscribers/', {'limit': 10})
+
+    def test_pages_join_rows_rendered_once_per_sync(self):
+        client = FakeClient([make_subscriber(n, clicks=n) for n in range(5)])
+        sync_publication(client)
+        ascending = self.client.get('/api/subscribers/', {'sort': 'total_clicked'}).json()['subscribers']
+        with mock.patch('subscribers.fragments.dumps', wraps=dumps) as render_row:
+            descending = self.client.get('/api/subscribers/', {'sort': 'total_clicked', 'direction': 'desc'})
+            render_row.assert_not_called()
+            self.assertEqual(descending.json()['subscribers'], ascending[::-1])
+
+            sync_publication(client, mode='full')
+            self.client.get('/api/subscribers/', {'sort': 'email'})
+            self.assertEqual(render_row.call_count, 5)
+
+        # orjson and the stdlib fallback write the same JSON
+        data = {'at': timezone.now(), 'day': date(2024, 1, 2), 'amount': Decimal('1.50'), 'name': 'Zoë',
+                'rates': [50.0, 0.1], 'nested': {'rank': None, 'ok': True}}
+        with mock.patch('subscribers.renderers.orjson', None):
+            fallback = dumps(data)
+        self.assertEqual(dumps(data), fallback)
+
+    def test_export_streams_filtered_ranked_rows(self):
+        sync_publication(FakeClient([
+            make_subscriber(n, clicks=n, status='inactive' if n == 2 else 'active') for n in range(1, 5)
+        ]))
+
+        response = self.client.get('/api/subscribers/export/', {
+            'format': 'csv', 'columns': 'email,total_clicked,engagement_rank', 'status': 'active'
+        })
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, [
+            'email,total_clicked,engagement_rank',
+            'user4@example.com,4,1',
+            'user3@example.com,3,2',
+            'user1@example.com,1,4',
+        ])
+
+        response = self.client.get('/api/subscribers/export/', {'format': 'ndjson', 'columns': 'id,email'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(rows[0], {'id': 'sub_4', 'email': 'user4@example.com'})
+
+        response = self.client.get('/api/subscribers/export/', {'columns': 'api_key'})
+        self.assertEqual(response.status_code, 400)
+
+        # Over ASGI the rows come from an async iterator, so they are sent as produced
+        async def export_over_asgi():
+            response = await self.async_client.get('/api/subscribers/export/', {'columns': 'id', 'status': 'active'})
+            self.assertTrue(response.is_async)
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        with mock.patch('subscribers.export.ASYNC_BATCH_SIZE', 2):
+            self.assertEqual(async_to_sync(export_over_asgi)().decode().splitlines(), ['id', 'sub_4', 'sub_3', 'sub_1'])
+
+    def test_metrics_endpoint_exposes_sync_and_serialization_timings(self):
+        sync_publication(FakeClient([make_subscriber(1)]), mode='full')
+        self.client.get('/api/subscribers/')
+
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('subscriber_sync_records_total{mode="full"}', body)
+        self.assertIn('api_serialization_seconds_count{view="get_subscribers"}', body)
+        self.assertIn('# TYPE subscriber_enrichment_seconds histogram', body)
+
+    def test_worker_metrics_are_shared_through_redis(self):
+        redis = FakeRedis()
+        with mock.patch('subscribers.instrumentation.shared_client', return_value=redis):
+            # Recorded in a worker...
+            sync_publication(FakeClient([make_subscriber(1), make_subscriber(2)]), mode='full')
+            # ...and scraped from the web process, whose own metrics never saw the sync
+            web = Registry()
+            web.register(Counter('subscriber_sync_records_total', 'Records', labels=('mode',), shared=True))
+            web.register(Histogram('subscriber_sync_seconds', 'Duration', labels=('mode',), shared=True))
+            body = web.render()
+        self.assertIn('subscriber_sync_records_total{mode="full"} 2\n', body)
+        self.assertIn('subscriber_sync_seconds_count{mode="full"} 1\n', body)
+        self.assertIn('subscriber_sync_seconds_bucket{mode="full",le="+Inf"} 1\n', body)
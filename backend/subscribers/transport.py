@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque, namedtuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from .instrumentation import api_request_seconds
+
+logger = logging.getLogger(__name__)
+
+# Beehiiv does not publish a hard number; stay comfortably under the
+# documented per-key limit unless told otherwise.
+DEFAULT_REQUESTS_PER_SECOND = 2.5
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+LATENCY_SAMPLES = 1000
+
+RequestTiming = namedtuple('RequestTiming', ['url', 'status_code', 'seconds'])
+
+
+class BeehiivAPIError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"API Error (Status {status_code})")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every request of a client.
+
+    ``acquire()`` blocks until a token is available (``aacquire()`` awaits
+    instead). ``pause()`` stops all callers until the given delay has
+    passed, which is how a 429's ``Retry-After`` is honoured across workers.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token if one is available; otherwise return the seconds to wait."""
+        with self.lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self.reserve()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def aacquire(self):
+        while True:
+            wait = self.reserve()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+            self.updated = self.paused_until
+
+
+def parse_retry_after(value, default=1.0):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def _auth_headers(api_key):
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Accept": "application/json",
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive",
+    }
+
+
+class _TimedRetries:
+    """Backoff and latency bookkeeping shared by the sync and async transports."""
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    def _record(self, url, status_code, started):
+        seconds = time.monotonic() - started
+        self.timings.append(RequestTiming(url, status_code, seconds))
+        api_request_seconds.observe(seconds, status=status_code or 'error')
+        logger.debug('GET %s -> %s in %.3fs', url, status_code, seconds)
+
+
+class BeehiivTransport(_TimedRetries):
+    """Pooled, retrying HTTP session for the Beehiiv API.
+
+    Connections are kept alive in a pool sized for the client's
+    concurrency. 5xx responses and connection errors are retried with
+    exponential backoff and full jitter; 429s pause the shared rate limiter
+    for ``Retry-After`` (or the backoff delay when the header is missing).
+    The latency of every attempt is kept in ``timings``.
+    """
+
+    def __init__(self, api_key, pool_size=10, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES,
+                 requests_per_second=DEFAULT_REQUESTS_PER_SECOND, rate_limiter=None):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update(_auth_headers(api_key))
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter or TokenBucket(requests_per_second)
+        self.timings = deque(maxlen=LATENCY_SAMPLES)
+
+    def get(self, url, params=None):
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            self.rate_limiter.acquire()
+            started = time.monotonic()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(url, None, started)
+                if last_attempt:
+                    raise
+                time.sleep(self.backoff(attempt))
+                continue
+
+            self._record(url, response.status_code, started)
+            if last_attempt:
+                return response
+            if response.status_code == 429:
+                delay = parse_retry_after(response.headers.get("Retry-After"), default=self.backoff(attempt))
+                self.rate_limiter.pause(delay)
+                continue
+            if response.status_code >= 500:
+                time.sleep(self.backoff(attempt))
+                continue
+            return response
+
+
+class AsyncBeehiivTransport(_TimedRetries):
+    """asyncio counterpart of ``BeehiivTransport`` on an ``httpx.AsyncClient``.
+
+    Same keep-alive pool, retry and rate-limit behaviour, but waiting (for
+    a token, a backoff or the response) yields to the event loop instead of
+    blocking a thread. An ``httpx.AsyncClient`` belongs to the event loop it
+    is used on, so close it with ``aclose()`` when done.
+    """
+
+    def __init__(self, api_key, pool_size=10, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES,
+                 requests_per_second=DEFAULT_REQUESTS_PER_SECOND, rate_limiter=None):
+        self.client = httpx.AsyncClient(
+            headers=_auth_headers(api_key),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter or TokenBucket(requests_per_second)
+        self.timings = deque(maxlen=LATENCY_SAMPLES)
+
+    async def get(self, url, params=None):
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            await self.rate_limiter.aacquire()
+            started = time.monotonic()
+            try:
+                response = await self.client.get(url, params=params)
+            except httpx.TransportError:
+                self._record(url, None, started)
+                if last_attempt:
+                    raise
+                await asyncio.sleep(self.backoff(attempt))
+                continue
+
+            self._record(url, response.status_code, started)
+            if last_attempt:
+                return response
+            if response.status_code == 429:
+                delay = parse_retry_after(response.headers.get("Retry-After"), default=self.backoff(attempt))
+                self.rate_limiter.pause(delay)
+                continue
+            if response.status_code >= 500:
+                await asyncio.sleep(self.backoff(attempt))
+                continue
+            return response
+
+    async def aclose(self):
+        await self.client.aclose()
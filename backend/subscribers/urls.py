@@ -4,5 +4,16 @@ from . import views
 urlpatterns = [
     path('api/cors-check/', views.cors_check, name='cors-check'),
     path('api/config', views.save_config, name='save_config'),
+    path('api/publications/', views.list_publications, name='list_publications'),
     path('api/subscribers/', views.get_subscribers, name='get_subscribers'),
+    path('api/subscribers/top/', views.get_top_subscribers, name='get_top_subscribers'),
+    path('api/subscribers/summary/', views.get_summary, name='get_summary'),
+    path('api/subscribers/trends/', views.get_trends, name='get_trends'),
+    path('api/subscribers/history/', views.get_history, name='get_history'),
+    path('api/subscribers/facets/', views.get_facets, name='get_facets'),
+    path('api/subscribers/churn/', views.get_churn, name='get_churn'),
+    path('api/subscribers/export/', views.export_subscribers, name='export_subscribers'),
+    path('api/webhooks/beehiiv/<str:publication_id>/', views.receive_webhook, name='receive_webhook'),
+    path('api/sync/', views.sync_status, name='sync_status'),
+    path('metrics', views.metrics, name='metrics'),
 ]
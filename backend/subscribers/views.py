@@ -1,212 +1,486 @@
-from django.shortcuts import render
+from asgiref.sync import sync_to_async
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from .beehiiv_client import BeehiivClient
-from django.http import JsonResponse
+from .conditional import encode_content, encoded_response
+from .export import EXPORT_FORMATS, aiter_export, iter_export, parse_columns
+from .facets import InvalidFacet, facet_breakdown, parse_group_by, source_channels
+from .fragments import subscriber_fragments
+from .instrumentation import registry
+from .publications import get_async_client, get_publication, publication_configs, save_publication
+from .models import ChurnReport, Subscriber, SyncJob, SyncState
+from .queries import (
+    InvalidQuery, filter_subscribers, order_subscribers, paginate_subscriber_ids,
+    publication_totals
+)
+from .ranking import UnknownPreset, top_subscribers
+from .renderers import TimedJSONRenderer, splice_list
+from .response_cache import cached_payload
+from .rollups import latest_rollup, rollup_summary, rollup_totals, trend
+from .snapshots import SnapshotError, engagement_history
+from .tasks import active_sync_job, enqueue_sync, schedule_webhook_apply
+from .webhooks import (
+    SIGNATURE_HEADER, TIMESTAMP_HEADER, InvalidSignature, InvalidWebhook, parse_events, queue_events,
+    verify_signature
+)
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_GET, require_http_methods
 import json
-import os
+import logging
 import traceback
-from datetime import datetime
-import pytz
-from django.conf import settings
+from datetime import date, timedelta
+from functools import partial
+from django.utils import timezone
 
-@api_view(['GET'])
-def get_subscribers(request):
+logger = logging.getLogger(__name__)
+
+DEFAULT_TREND_DAYS = 90
+MAX_TREND_DAYS = 3660
+DEFAULT_HISTORY_DAYS = 180
+
+def render_json(request, data):
+    """Render ``data`` the way the DRF views do, for the async views.
+
+    DRF views are sync only; the async ones return plain Django responses
+    but go through the same renderer, so the JSON is identical.
+    """
+    return TimedJSONRenderer().render(data, renderer_context={'request': request})
+
+def json_response(request, data, status=200):
+    return HttpResponse(render_json(request, data), status=status, content_type='application/json')
+
+def render_content(request, data):
+    return data if isinstance(data, bytes) else render_json(request, data)
+
+async def cached_json_response(request, publication_id, name, build, last_modified=None):
+    """Cached JSON of ``build()``, stored rendered and precompressed.
+
+    ``build()`` returns the data, or bytes it has already rendered.
+    Requests whose ``If-None-Match``/``If-Modified-Since`` still match
+    get an empty 304; otherwise the stored bytes are sent in the best
+    encoding the client accepts.
+    """
+    encoded = await sync_to_async(cached_payload)(
+        publication_id, name, request.GET,
+        lambda: encode_content(render_content(request, build()), last_modified)
+    )
+    return encoded_response(request, encoded)
+
+def get_publication_config(request, respond=Response):
+    """Resolve the publication a request is for.
+
+    ``?publication=<id>`` picks one of the configured publications; without
+    it the default publication is used. Returns ``(config, None)`` or
+    ``(None, error_response)``.
+    """
+    publication_id = request.GET.get('publication')
+    config = get_publication(publication_id)
+    if config is None:
+        if publication_id:
+            return None, respond({'message': f'Unknown publication: {publication_id}'}, status=404)
+        return None, respond({'message': 'API configuration not found'}, status=400)
+    logger.debug("Using publication %s", config['publication_id'])
+    return config, None
+
+async def aget_publication_config(request):
+    return await sync_to_async(get_publication_config)(request, respond=partial(json_response, request))
+
+def queue_first_sync(publication_id):
+    """Queue a full sync of a publication with no local data; returns the job."""
+    logger.info("No local data for %s yet, queueing a sync", publication_id)
+    return active_sync_job(publication_id) or enqueue_sync(publication_id, mode='full')
+
+@require_GET
+async def get_subscribers(request):
     try:
-        # Read configuration
-        config_path = os.path.join(os.path.dirname(__file__), 'config.json')
-        
+        config, error = await aget_publication_config(request)
+        if error:
+            return error
+        publication_id = config['publication_id']
+
+        # The store is filled by the background sync; the very first load of
+        # a publication starts one and asks the dashboard to come back.
+        state = SyncState.objects.filter(publication_id=publication_id).values('last_synced_at')
+        # (A state row without last_synced_at belongs to a first sync still in progress.)
+        synced = await state.afirst()
+        if synced is None or synced['last_synced_at'] is None:
+            job = await sync_to_async(queue_first_sync)(publication_id)
+            synced = await state.afirst()
+            if synced is None or synced['last_synced_at'] is None:
+                return json_response(
+                    request,
+                    {'message': 'Subscribers are being synced', 'job': job.as_dict()},
+                    status=202
+                )
+
+        def build_payload():
+            queryset = Subscriber.objects.filter(publication_id=publication_id)
+
+            # Filtering, sorting and pagination happen in the database so only
+            # the requested page is sent to the browser.
+            filtered = filter_subscribers(queryset, request.GET)
+            ids, next_cursor = paginate_subscriber_ids(filtered, request.GET)
+            logger.debug("Returning %s subscribers", len(ids))
+
+            # Header totals come from the sync's rollup when there is one
+            rollup = latest_rollup(publication_id)
+            header = render_json(request, {
+                **(rollup_totals(rollup) if rollup else publication_totals(queryset)),
+                'total': filtered.count(),
+                'next_cursor': next_cursor,
+                'source_channels': source_channels(publication_id),
+            })
+            # The rows were rendered once for this sync; just join them
+            return splice_list(header, 'subscribers', subscriber_fragments(publication_id, ids))
+
         try:
-            with open(config_path, 'r') as f:
-                config = json.load(f)
-                print("=== Configuration ===")
-                print(f"Publication ID: {config['publication_id']}")
-                print(f"API Key length: {len(config['api_key'])}")
-        except FileNotFoundError:
-            return Response(
-                {'message': 'API configuration not found'}, 
-                status=400
-            )
-        except json.JSONDecodeError:
-            return Response(
-                {'message': 'Invalid configuration file'}, 
-                status=400
+            return await cached_json_response(
+                request, publication_id, 'subscribers', build_payload, last_modified=synced['last_synced_at']
             )
+        except InvalidQuery as e:
+            return json_response(request, {'message': str(e)}, status=400)
         
-        # Validate configuration
-        if not config.get('api_key') or not config.get('publication_id'):
-            return Response(
-                {'message': 'Missing API key or publication ID'}, 
-                status=400
-            )
-        
-        # Create client
-        client = BeehiivClient(
-            api_key=config['api_key'],
-            publication_id=config['publication_id']
+    except Exception as e:
+        logger.exception("Error in get_subscribers")
+        return json_response(
+            request,
+            {'message': f'Error fetching subscribers: {str(e)}'}, 
+            status=500
         )
-        
-        print("=== Fetching Subscribers ===")
-        response_data = client.get_subscribers(limit=500)  # Increased from 100 to 1000
-        
-        if not response_data or 'data' not in response_data:
-            print("Warning: No data in response")
-            return Response(
-                {'message': 'No data received from API'}, 
-                status=404
-            )
-        
-        # Format response
-        formatted_response = {
-            'data': response_data.get('data', []),
-            'total': response_data.get('total', 0),
-            'page': response_data.get('page', 1),
-            'limit': response_data.get('limit', 1000)
-        }
-        
-        print(f"Returning {len(formatted_response['data'])} subscribers")
 
-        # Calculate days to unsubscribe
-        for subscriber in formatted_response['data']:
-            if subscriber.get('status') == 'inactive':
-                subscriber['days_to_unsubscribe'] = calculate_days_to_unsubscribe(subscriber)
+@require_http_methods(["GET"])
+def export_subscribers(request):
+    """Stream the (ranked) subscriber list as CSV or NDJSON.
+
+    Takes the table's filters and sort params plus ``format`` and a
+    comma-separated ``columns`` list; rows are streamed straight from a
+    database cursor (in batches over ASGI), so memory use does not grow
+    with the list.
+    """
+    config, error = get_publication_config(request, respond=JsonResponse)
+    if error:
+        return error
+    publication_id = config['publication_id']
+
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'message': 'format must be csv or ndjson'}, status=400)
+
+    try:
+        columns = parse_columns(request.GET.get('columns'))
+        queryset = filter_subscribers(
+            Subscriber.objects.filter(publication_id=publication_id), request.GET
+        )
+        queryset, _, _ = order_subscribers(queryset, request.GET, default_sort='engagement_rank')
+    except InvalidQuery as e:
+        return JsonResponse({'message': str(e)}, status=400)
+
+    # Under ASGI only an async iterator is sent as it is produced
+    rows = aiter_export if isinstance(request, ASGIRequest) else iter_export
+    response = StreamingHttpResponse(
+        rows(queryset, columns, export_format),
+        content_type=EXPORT_FORMATS[export_format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="subscribers.{export_format}"'
+    return response
+
+@api_view(['GET', 'POST'])
+def sync_status(request):
+    """GET: state of the publication's sync. POST: queue a sync (``mode`` in the body)."""
+    try:
+        config, error = get_publication_config(request)
+        if error:
+            return error
+        publication_id = config['publication_id']
+
+        if request.method == 'POST':
+            mode = request.data.get('mode', 'auto')
+            if mode not in ('auto', 'full', 'incremental'):
+                return Response({'message': 'mode must be auto, full or incremental'}, status=400)
+            job = active_sync_job(publication_id) or enqueue_sync(publication_id, mode=mode)
+            return Response({'job': job.as_dict()}, status=202)
 
-        # Get metrics
-        metrics = client.get_subscriber_metrics()
+        state = SyncState.objects.filter(publication_id=publication_id).first()
+        jobs = SyncJob.objects.filter(publication_id=publication_id).order_by('-created_at')
+        latest = jobs.first()
+        failed = jobs.filter(status=SyncJob.FAILED).first()
 
         return Response({
-            'total_subscribers': metrics['total_subscribers'],
-            'percent_clicked_once': metrics['percent_clicked_once'],
-            'subscribers': metrics['subscribers']
+            'publication_id': publication_id,
+            'last_synced_at': state.last_synced_at if state else None,
+            'last_full_sync_at': state.last_full_sync_at if state else None,
+            'subscriber_count': state.subscriber_count if state else 0,
+            'job': latest.as_dict() if latest else None,
+            'last_error': {
+                'job_id': failed.id,
+                'finished_at': failed.finished_at,
+                'error': failed.error,
+            } if failed else None,
         })
-        
+
     except Exception as e:
-        print(f"Error in get_subscribers: {str(e)}")
-        print(traceback.format_exc())  # Print full traceback
+        logger.exception("Error in sync_status")
         return Response(
-            {'message': f'Error fetching subscribers: {str(e)}'}, 
+            {'message': f'Error reading sync status: {str(e)}'}, 
             status=500
         )
 
-def calculate_days_to_unsubscribe(subscriber):
-    if subscriber.get('status') != 'inactive':
-        return None
-    
-    # Debug print entire subscriber object for inactive subscribers
-    print("Inactive subscriber data:")
-    print(subscriber)
-    
-    created_at = subscriber.get('created_at')
-    updated_at = subscriber.get('updated_at')
-    
-    print(f"Created at: {created_at}")
-    print(f"Updated at: {updated_at}")
-    
-    # Check if either date is missing
-    if not created_at or not updated_at:
-        return None
-        
+@require_GET
+async def get_top_subscribers(request):
     try:
-        # Try different date formats
-        date_formats = [
-            '%Y-%m-%dT%H:%M:%S.%fZ',
-            '%Y-%m-%dT%H:%M:%SZ',
-            '%Y-%m-%d %H:%M:%S'
-        ]
-        
-        subscribe_date = None
-        unsubscribe_date = None
-        
-        for date_format in date_formats:
-            try:
-                subscribe_date = datetime.strptime(created_at, date_format)
-                unsubscribe_date = datetime.strptime(updated_at, date_format)
-                break
-            except ValueError:
-                continue
-                
-        if not subscribe_date or not unsubscribe_date:
-            return None
-            
-        # Convert to UTC if needed
-        subscribe_date = subscribe_date.replace(tzinfo=pytz.UTC)
-        unsubscribe_date = unsubscribe_date.replace(tzinfo=pytz.UTC)
-        
-        days_difference = (unsubscribe_date - subscribe_date).days
-        return max(0, days_difference)  # Ensure we don't return negative days
-        
+        config, error = await aget_publication_config(request)
+        if error:
+            return error
+
+        try:
+            k = min(int(request.GET.get('k', 10)), 1000)
+        except ValueError:
+            return json_response(request, {'message': 'k must be an integer'}, status=400)
+        preset = request.GET.get('preset')
+
+        def build_payload():
+            ranked = top_subscribers(config['publication_id'], k=k, preset=preset)
+            return {
+                'preset': preset,
+                'subscribers': [
+                    {**subscriber, 'engagement_score': round(score, 4)}
+                    for subscriber, score in ranked
+                ]
+            }
+
+        try:
+            return await cached_json_response(request, config['publication_id'], 'top', build_payload)
+        except UnknownPreset as e:
+            return json_response(request, {'message': str(e)}, status=400)
+
+    except Exception as e:
+        logger.exception("Error in get_top_subscribers")
+        return json_response(
+            request,
+            {'message': f'Error ranking subscribers: {str(e)}'}, 
+            status=500
+        )
+
+@require_GET
+async def get_summary(request):
+    """Publication totals, averages and rate distributions from the latest daily rollup."""
+    try:
+        config, error = await aget_publication_config(request)
+        if error:
+            return error
+
+        rollup = await sync_to_async(latest_rollup)(config['publication_id'])
+        if rollup is None:
+            return json_response(request, {'message': 'No summary yet; run a sync first'}, status=404)
+        return json_response(request, rollup_summary(rollup))
     except Exception as e:
-        print(f"Error calculating days to unsubscribe: {e}")
-        return None
+        logger.exception("Error in get_summary")
+        return json_response(request, {'message': f'Error loading summary: {str(e)}'}, status=500)
+
+@require_GET
+async def get_trends(request):
+    """Daily signups, unsubscribes and totals for ``days`` days (or ``start``/``end`` dates)."""
+    try:
+        config, error = await aget_publication_config(request)
+        if error:
+            return error
+
+        params = request.GET
+        try:
+            end = date.fromisoformat(params['end']) if params.get('end') else timezone.localdate()
+            if params.get('start'):
+                start = date.fromisoformat(params['start'])
+            else:
+                days = int(params.get('days', DEFAULT_TREND_DAYS))
+                if days < 1:
+                    raise ValueError('days must be positive')
+                start = end - timedelta(days=days - 1)
+        except ValueError as e:
+            return json_response(request, {'message': f'Invalid trend range: {e}'}, status=400)
+        if start > end or (end - start).days >= MAX_TREND_DAYS:
+            return json_response(request, {'message': f'Trend range must be 1 to {MAX_TREND_DAYS} days'}, status=400)
+
+        return json_response(request, {
+            'start': start,
+            'end': end,
+            'days': await sync_to_async(trend)(config['publication_id'], start, end),
+        })
+    except Exception as e:
+        logger.exception("Error in get_trends")
+        return json_response(request, {'message': f'Error loading trends: {str(e)}'}, status=500)
+
+@require_GET
+async def get_history(request):
+    """Engagement trend and cohort decay of one stat across the sync snapshots.
+
+    ``field`` is the stat (default ``open_rate``); ``start``/``end`` are
+    dates, by default the last DEFAULT_HISTORY_DAYS days.
+    """
+    try:
+        config, error = await aget_publication_config(request)
+        if error:
+            return error
+
+        params = request.GET
+        try:
+            end = date.fromisoformat(params['end']) if params.get('end') else timezone.now().date()
+            start = date.fromisoformat(params['start']) if params.get('start') else end - timedelta(days=DEFAULT_HISTORY_DAYS)
+        except ValueError as e:
+            return json_response(request, {'message': f'Invalid history range: {e}'}, status=400)
+
+        try:
+            # Reads and crunches files only, so it can run off the request thread
+            history = await sync_to_async(engagement_history, thread_sensitive=False)(
+                config['publication_id'], params.get('field', 'open_rate'), start, end
+            )
+        except SnapshotError as e:
+            return json_response(request, {'message': str(e)}, status=400)
+        return json_response(request, {'start': start, 'end': end, **history})
+    except Exception as e:
+        logger.exception("Error in get_history")
+        return json_response(request, {'message': f'Error loading history: {str(e)}'}, status=500)
+
+@require_GET
+async def get_facets(request):
+    """Subscriber counts and engagement per UTM combination.
+
+    ``by`` picks the UTM fields to group on (comma-separated, default all four).
+    """
+    try:
+        config, error = await aget_publication_config(request)
+        if error:
+            return error
+        publication_id = config['publication_id']
+
+        try:
+            group_by = parse_group_by(request.GET.get('by'))
+        except InvalidFacet as e:
+            return json_response(request, {'message': str(e)}, status=400)
+
+        return await cached_json_response(
+            request, publication_id, 'facets',
+            lambda: {'group_by': group_by, 'facets': facet_breakdown(publication_id, group_by)}
+        )
+    except Exception as e:
+        logger.exception("Error in get_facets")
+        return json_response(request, {'message': f'Error loading facets: {str(e)}'}, status=500)
+
+@require_GET
+async def get_churn(request):
+    """Churn histogram and cohort survival, as precomputed by the last sync."""
+    try:
+        config, error = await aget_publication_config(request)
+        if error:
+            return error
+
+        report = await ChurnReport.objects.filter(publication_id=config['publication_id']).afirst()
+        if report is None:
+            return json_response(request, {'message': 'No churn data yet; run a sync first'}, status=404)
+        return json_response(request, report.as_dict())
+    except Exception as e:
+        logger.exception("Error in get_churn")
+        return json_response(request, {'message': f'Error loading churn: {str(e)}'}, status=500)
+
+@require_GET
+async def list_publications(request):
+    """Configured publications (without their API keys), default first."""
+    try:
+        configs = await sync_to_async(publication_configs)()
+        return json_response(request, {
+            'publications': [
+                {key: config[key] for key in ('publication_id', 'name', 'is_default')}
+                for config in configs
+            ]
+        })
+    except Exception as e:
+        logger.exception("Error in list_publications")
+        return json_response(request, {'message': f'Error listing publications: {str(e)}'}, status=500)
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def save_config(request):
+async def save_config(request):
     try:
-        print("=== Starting save_config ===")
-        print("Request method:", request.method)
-        print("Request headers:", dict(request.headers))
-        
         data = json.loads(request.body)
-        print("Parsed request data:", {
-            'apiKey': '***' if data.get('apiKey') else None,
-            'publicationId': data.get('publicationId')
-        })
+        logger.info("Saving configuration for publication %s", data.get('publicationId'))
         
         api_key = data.get('apiKey', '').strip()
         publication_id = data.get('publicationId', '').strip()
 
         if not api_key or not publication_id:
-            print("Missing required fields")
             return JsonResponse(
                 {'message': 'API key and Publication ID are required'}, 
                 status=400
             )
 
-        # Test the credentials
-        print("Testing credentials...")
-        client = BeehiivClient(api_key, publication_id)
-        
+        # Test the credentials without holding a worker while Beehiiv answers
         try:
-            result = client.get_subscribers(page=1)
-            print("Credentials test successful")
+            async with get_async_client({'api_key': api_key, 'publication_id': publication_id}) as client:
+                await client.get_subscribers(page=1, limit=1)
             
-            # Save config
-            config_path = os.path.join(os.path.dirname(__file__), 'config.json')
-            with open(config_path, 'w') as f:
-                json.dump({
-                    'api_key': api_key,
-                    'publication_id': publication_id
-                }, f)
-            print("Configuration saved successfully")
+            webhook_secret = data.get('webhookSecret')
+            await sync_to_async(save_publication)(
+                api_key, publication_id,
+                name=data.get('name'), make_default=bool(data.get('makeDefault')),
+                webhook_secret=webhook_secret.strip() if webhook_secret is not None else None,
+            )
+            logger.info("Configuration saved for publication %s", publication_id)
             
             return JsonResponse({'message': 'Configuration saved successfully'})
             
         except Exception as e:
-            print(f"Error testing credentials: {str(e)}")
+            logger.warning("Credential check failed for %s: %s", publication_id, e)
             return JsonResponse({'message': str(e)}, status=401)
             
     except Exception as e:
-        print(f"Error in save_config: {str(e)}")
-        print(f"Full traceback: {traceback.format_exc()}")
+        logger.exception("Error in save_config")
         return JsonResponse({
             'message': f'Server error: {str(e)}',
             'traceback': traceback.format_exc()
         }, status=500)
 
+@csrf_exempt
+@require_http_methods(["POST"])
+async def receive_webhook(request, publication_id):
+    """Queue the subscription events of a signed Beehiiv webhook delivery.
+
+    Answers as soon as the events are stored; they are applied by a task.
+    """
+    config = await sync_to_async(get_publication)(publication_id)
+    if config is None:
+        return JsonResponse({'message': 'Unknown publication'}, status=404)
+    if not config['webhook_secret']:
+        return JsonResponse({'message': 'Webhooks are not enabled for this publication'}, status=403)
+    try:
+        verify_signature(
+            config['webhook_secret'], request.body,
+            request.headers.get(TIMESTAMP_HEADER), request.headers.get(SIGNATURE_HEADER),
+        )
+        events = parse_events(request.body)
+    except InvalidSignature as e:
+        return JsonResponse({'message': str(e)}, status=401)
+    except InvalidWebhook as e:
+        return JsonResponse({'message': str(e)}, status=400)
+
+    queued = await sync_to_async(queue_events)(publication_id, events)
+    if queued:
+        await sync_to_async(schedule_webhook_apply)(publication_id)
+    return JsonResponse({'received': len(events), 'queued': queued}, status=202)
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """Prometheus scrape endpoint for this process's counters and timings."""
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4')
+
 @csrf_exempt
 def cors_check(request):
     try:
-        print("CORS check endpoint hit")  # Debug print
         return JsonResponse({
             "status": "ok",
             "message": "CORS check successful"
         })
     except Exception as e:
-        print(f"Error in cors_check: {str(e)}")
-        print(f"Full traceback: {traceback.format_exc()}")  # Add full traceback
+        logger.exception("Error in cors_check")
         return JsonResponse({
             "status": "error",
             "message": str(e),
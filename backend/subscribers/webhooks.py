@@ -0,0 +1,223 @@
+"""Beehiiv webhook ingestion.
+
+A delivery is verified (an HMAC-SHA256 of ``<timestamp>.<body>`` with the
+publication's webhook secret) and its events are stored as WebhookEvent
+rows; nothing else happens before the response. A task then applies the
+queued events in batches: all events of one subscriber in a batch fold
+into a single write, and the facet index, today's rollup and the changed
+subscribers' ranks are moved by the difference instead of recomputed.
+Syncs still reconcile everything on their usual schedule.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .facets import apply_deltas, has_facets, stored_contributions
+from .models import Subscriber, SyncState, WebhookEvent
+from .ranking import rerank_subscribers
+from .response_cache import invalidate_publication
+from .rollups import ROW_FIELDS, apply_changes
+from .sync import upsert_subscribers
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = 'X-Beehiiv-Signature'
+TIMESTAMP_HEADER = 'X-Beehiiv-Timestamp'
+
+UPSERT, UNSUBSCRIBE, DELETE = 'upsert', 'unsubscribe', 'delete'
+EVENT_ACTIONS = {
+    'subscription.created': UPSERT,
+    'subscription.confirmed': UPSERT,
+    'subscription.updated': UPSERT,
+    'subscription.upgraded': UPSERT,
+    'subscription.downgraded': UPSERT,
+    'subscription.unsubscribed': UNSUBSCRIBE,
+    'subscription.deleted': DELETE,
+}
+
+
+class InvalidWebhook(ValueError):
+    pass
+
+
+class InvalidSignature(InvalidWebhook):
+    pass
+
+
+def sign(secret, timestamp, body):
+    """Hex signature of a delivery ``body`` (bytes) sent at ``timestamp``."""
+    message = f'{timestamp}.'.encode() + body
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def verify_signature(secret, body, timestamp, signature, now=None):
+    """Raise InvalidSignature unless ``signature`` is ``body``'s, signed recently."""
+    if not timestamp or not signature:
+        raise InvalidSignature('Missing signature')
+    try:
+        age = (now or time.time()) - int(timestamp)
+    except ValueError:
+        raise InvalidSignature('Invalid timestamp')
+    if abs(age) > settings.WEBHOOK_SIGNATURE_TOLERANCE:
+        raise InvalidSignature('Timestamp outside the allowed window')
+    signature = signature.split('=', 1)[1] if signature.startswith('sha256=') else signature
+    if not hmac.compare_digest(sign(secret, timestamp, body), signature):
+        raise InvalidSignature('Signature mismatch')
+
+
+def parse_events(body):
+    """The events of a delivery body: one event object or a list of them."""
+    try:
+        payload = json.loads(body)
+    except (TypeError, ValueError):
+        raise InvalidWebhook('Body is not JSON')
+    events = payload if isinstance(payload, list) else [payload]
+    for event in events:
+        if not isinstance(event, dict) or not isinstance(event.get('data'), dict):
+            raise InvalidWebhook('Every event needs a data object')
+        if not (event.get('event_type') or event.get('type')):
+            raise InvalidWebhook('Every event needs an event_type')
+    return events
+
+
+def event_type(event):
+    return event.get('event_type') or event.get('type')
+
+
+def event_id(event):
+    """Beehiiv's event uid, or a hash of the event so redeliveries still match."""
+    uid = event.get('uid') or event.get('event_id')
+    if uid:
+        return str(uid)[:128]
+    return hashlib.sha256(json.dumps(event, sort_keys=True).encode()).hexdigest()
+
+
+def queue_events(publication_id, events):
+    """Store the subscription events of a delivery; returns how many are new.
+
+    Other event types are ignored, and events already queued (Beehiiv
+    redelivers until it gets a 2xx) are skipped. The unique
+    (publication_id, event_id) constraint still drops a redelivery racing
+    this one, which is then counted by both.
+    """
+    rows = {}
+    for event in events:
+        if event_type(event) in EVENT_ACTIONS and event['data'].get('id'):
+            uid = event_id(event)
+            rows.setdefault(uid, WebhookEvent(
+                publication_id=publication_id,
+                event_id=uid,
+                event_type=event_type(event),
+                subscriber_id=str(event['data']['id']),
+                payload=event,
+            ))
+    queued = set(WebhookEvent.objects.filter(
+        publication_id=publication_id, event_id__in=list(rows)
+    ).values_list('event_id', flat=True))
+    new = [row for uid, row in rows.items() if uid not in queued]
+    WebhookEvent.objects.bulk_create(new, ignore_conflicts=True)
+    return len(new)
+
+
+def coalesce(events):
+    """Fold a batch of events (oldest first) into one change per subscriber.
+
+    Returns ``{subscriber_id: (record, replace)}``: ``record`` holds the
+    fields the events set, or is None if the subscriber ends up deleted;
+    ``replace`` means it was deleted earlier in the batch, so the record
+    must not be merged into the stored copy.
+    """
+    changes = {}
+    for event in events:
+        action = EVENT_ACTIONS[event.event_type]
+        record, replace = changes.get(event.subscriber_id, ({}, False))
+        if action == DELETE:
+            changes[event.subscriber_id] = (None, True)
+            continue
+        record = {**(record or {}), **event.payload['data']}
+        if action == UNSUBSCRIBE:
+            record['status'] = 'inactive'
+            if not event.payload['data'].get('updated_at'):
+                record['updated_at'] = event.payload.get('event_timestamp') or int(event.received_at.timestamp())
+        changes[event.subscriber_id] = (record, replace)
+    return changes
+
+
+def _stored_rows(publication_id, beehiiv_ids):
+    """``{beehiiv_id: (data, rollup row)}`` of the stored subscribers among ``beehiiv_ids``."""
+    rows = Subscriber.objects.filter(
+        publication_id=publication_id, beehiiv_id__in=list(beehiiv_ids)
+    ).values_list('beehiiv_id', 'data', *ROW_FIELDS)
+    return {row[0]: (row[1], row[2:]) for row in rows}
+
+
+def apply_events(publication_id, events, now=None):
+    """Apply one batch of queued events in a single transaction.
+
+    Returns the ids of the subscribers that were written (not deleted).
+    """
+    now = now or timezone.now()
+    changes = coalesce(events)
+    with transaction.atomic():
+        before = _stored_rows(publication_id, changes)
+        records, deleted = [], []
+        for subscriber_id, (record, replace) in changes.items():
+            if record is None:
+                if subscriber_id in before:
+                    deleted.append(subscriber_id)
+                continue
+            stored = {} if replace or subscriber_id not in before else dict(before[subscriber_id][0])
+            # Derived again by the upsert's enrichment
+            stored.pop('days_to_unsubscribe', None)
+            records.append({**stored, **record, 'id': subscriber_id})
+
+        update_facets = has_facets(publication_id)
+        if deleted:
+            if update_facets:
+                apply_deltas(publication_id, stored_contributions(publication_id, deleted), [])
+            Subscriber.objects.filter(publication_id=publication_id, beehiiv_id__in=deleted).delete()
+        if records:
+            upsert_subscribers(publication_id, records, now, update_facets=update_facets)
+
+        written = [record['id'] for record in records]
+        after = _stored_rows(publication_id, written)
+        apply_changes(
+            publication_id, [row for _, row in before.values()], [row for _, row in after.values()], now
+        )
+        added = len(after) - len(before)
+        if added:
+            SyncState.objects.filter(publication_id=publication_id).update(
+                subscriber_count=F('subscriber_count') + added
+            )
+        WebhookEvent.objects.filter(id__in=[event.id for event in events]).update(processed_at=now)
+    return written
+
+
+def pending_events(publication_id):
+    return WebhookEvent.objects.filter(publication_id=publication_id, processed_at__isnull=True)
+
+
+def apply_pending_events(publication_id, batch_size=None):
+    """Apply every queued event of a publication, oldest first; returns how many."""
+    batch_size = batch_size or settings.WEBHOOK_BATCH_SIZE
+    pending = pending_events(publication_id)
+    applied, written = 0, set()
+    while True:
+        events = list(pending.order_by('id')[:batch_size])
+        if not events:
+            break
+        written.update(apply_events(publication_id, events))
+        applied += len(events)
+
+    if applied:
+        rerank_subscribers(publication_id, written)
+        invalidate_publication(publication_id)
+        logger.info('Applied %s webhook events to %s subscribers of %s', applied, len(written), publication_id)
+    return applied
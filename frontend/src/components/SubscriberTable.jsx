@@ -90,23 +90,65 @@ export default function SubscriberTable() {
   // Add these new state variables after other state declarations
   const [currentPage, setCurrentPage] = useState(1);
   const [itemsPerPage, setItemsPerPage] = useState(10);
+  const [totalItems, setTotalItems] = useState(0);
+  const [sourceChannelOptions, setSourceChannelOptions] = useState([]);
+
+  // Keyset cursors returned by the API, by the page number they lead to
+  const cursorsRef = useRef({});
+  const queryKey = JSON.stringify({ sortConfig, filters, itemsPerPage });
+  const lastQueryKeyRef = useRef(queryKey);
 
   useEffect(() => {
+    // Any change to what is shown starts again from the first page
+    if (lastQueryKeyRef.current !== queryKey) {
+      lastQueryKeyRef.current = queryKey
+      cursorsRef.current = {}
+      if (currentPage !== 1) {
+        setCurrentPage(1)
+        return
+      }
+    }
+
+    let cancelled = false
     const fetchSubscribers = async () => {
       try {
-        const response = await fetch(`${API_URL}/api/subscribers/`)
+        // Sorting, filtering and pagination are done by the API
+        const params = new URLSearchParams({ limit: itemsPerPage, status: filters.status })
+        if (sortConfig.key) {
+          params.set('sort', sortConfig.key)
+          params.set('direction', sortConfig.direction)
+        }
+        filters.sourceChannels
+          .filter(source => source !== 'all')
+          .forEach(source => params.append('source_channel', source))
+
+        const cursor = cursorsRef.current[currentPage]
+        if (cursor) {
+          params.set('cursor', cursor)
+        } else {
+          params.set('page', currentPage)
+        }
+
+        const response = await fetch(`${API_URL}/api/subscribers/?${params}`)
+        if (cancelled) return
+        if (response.status === 202) {
+          // The first sync of this publication is still running
+          setTimeout(() => { if (!cancelled) fetchSubscribers() }, 3000)
+          return
+        }
         const data = await response.json()
-        console.log("Fetched subscribers data:", data)
+        if (cancelled) return
         setSubscribers(data.subscribers || [])
-        
-        // Calculate active subscribers
-        const activeCount = data.subscribers.filter(sub => sub.status === 'active').length;
+        setTotalItems(data.total || 0)
+        if (data.next_cursor) {
+          cursorsRef.current[currentPage + 1] = data.next_cursor
+        }
         
         setStats({
           total_subscribers: data.total_subscribers || 0,
-          active_subscribers: activeCount,
+          active_subscribers: data.active_subscribers || 0,
           percent_clicked_once: data.percent_clicked_once || 0,
-          subscribers_clicked: Math.round((data.percent_clicked_once * data.total_subscribers) / 100)
+          subscribers_clicked: data.subscribers_clicked || 0
         })
         setLoading(false)
       } catch (err) {
@@ -117,31 +159,26 @@ export default function SubscriberTable() {
     }
 
     fetchSubscribers()
-  }, [])
-
-  const sortData = (data, key) => {
-    if (!key) return data
-
-    return [...data].sort((a, b) => {
-      let aValue, bValue
-
-      if (key === 'utm_data') {
-        aValue = `${a.utm_source || ''}/${a.utm_channel || ''}`
-        bValue = `${b.utm_source || ''}/${b.utm_channel || ''}`
-      } else if (key.includes('stats')) {
-        aValue = a.stats?.[key.split('.')[1]] || 0
-        bValue = b.stats?.[key.split('.')[1]] || 0
-      } else {
-        aValue = a[key] || ''
-        bValue = b[key] || ''
-      }
+    return () => { cancelled = true }
+  }, [queryKey, currentPage])
 
-      if (sortConfig.direction === 'asc') {
-        return aValue > bValue ? 1 : -1
-      }
-      return aValue < bValue ? 1 : -1
-    })
-  }
+  // Source/channel options and their subscriber counts come from the
+  // server-side facet index, so no utm_data has to be scanned here
+  useEffect(() => {
+    if (loading) return
+    let cancelled = false
+    fetch(`${API_URL}/api/subscribers/facets/?by=utm_source,utm_channel`)
+      .then(response => response.ok ? response.json() : { facets: [] })
+      .then(data => {
+        if (cancelled) return
+        setSourceChannelOptions((data.facets || []).map(facet => ({
+          value: `${facet.utm_source || '-'}/${facet.utm_channel || '-'}`,
+          subscribers: facet.subscribers
+        })))
+      })
+      .catch(err => console.error('Error fetching UTM facets:', err))
+    return () => { cancelled = true }
+  }, [loading, stats.total_subscribers])
 
   const handleSort = (key) => {
     setSortConfig(prevConfig => ({
@@ -169,44 +206,11 @@ export default function SubscriberTable() {
     )
   }
 
-  // Get unique source/channel combinations
-  const getUniqueSourceChannels = (data) => {
-    const combinations = new Set(data.map(sub => 
-      `${sub.utm_source || '-'}/${sub.utm_channel || '-'}`
-    ));
-    return ['all', ...Array.from(combinations).sort()];
+  // Source/channel combinations come from the API's facet index
+  const getUniqueSourceChannels = () => {
+    return [{ value: 'all', subscribers: stats.total_subscribers }, ...sourceChannelOptions];
   }
 
-  // Filter function
-  const filterSubscribers = (data) => {
-    return data.filter(subscriber => {
-      // Status filter
-      if (filters.status !== 'all') {
-        const isActive = subscriber.status === 'active';
-        const filterIsActive = filters.status === 'active';
-        if (isActive !== filterIsActive) {
-          return false;
-        }
-      }
-
-      // Source/Channel filter
-      if (!filters.sourceChannels.includes('all')) {
-        const subSourceChannel = `${subscriber.utm_source || '-'}/${subscriber.utm_channel || '-'}`;
-        if (!filters.sourceChannels.includes(subSourceChannel)) {
-          return false;
-        }
-      }
-
-      return true;
-    });
-  }
-
-  // Add this helper function before the return statement
-  const paginateData = (data) => {
-    const startIndex = (currentPage - 1) * itemsPerPage;
-    return data.slice(startIndex, startIndex + itemsPerPage);
-  };
-
   // Add this pagination component right before the table div
   const PaginationControls = ({ totalItems }) => {
     const totalPages = Math.ceil(totalItems / itemsPerPage);
@@ -353,7 +357,7 @@ export default function SubscriberTable() {
               {isSourceMenuOpen && (
                 <div className="absolute z-10 mt-1 w-full bg-white rounded-md shadow-lg border border-pink-100">
                   <div className="p-2 space-y-1 max-h-60 overflow-y-auto">
-                    {getUniqueSourceChannels(subscribers).map(source => (
+                    {getUniqueSourceChannels().map(({ value: source, subscribers: count }) => (
                       <label key={source} className="flex items-center p-2 hover:bg-pink-50 rounded cursor-pointer">
                         <input
                           type="checkbox"
@@ -378,7 +382,8 @@ export default function SubscriberTable() {
                           }}
                           className="rounded border-pink-300 text-pink-600 focus:ring-pink-500 mr-2"
                         />
-                        <span className="text-sm text-gray-700">{source}</span>
+                        <span className="text-sm text-gray-700 flex-1">{source}</span>
+                        <span className="text-xs text-gray-400">{count}</span>
                       </label>
                     ))}
                   </div>
@@ -422,7 +427,7 @@ export default function SubscriberTable() {
       </div>
 
       {/* Add pagination controls */}
-      <PaginationControls totalItems={filterSubscribers(subscribers).length} />
+      <PaginationControls totalItems={totalItems} />
 
       {/* Updated table container */}
       <div className="overflow-x-auto shadow-md rounded-lg">
@@ -443,7 +448,7 @@ export default function SubscriberTable() {
             </tr>
           </thead>
           <tbody className="divide-y divide-pink-200">
-            {paginateData(sortData(filterSubscribers(subscribers), sortConfig.key)).map((subscriber) => (
+            {subscribers.map((subscriber) => (
               <tr key={subscriber.id} className="hover:bg-pink-50">
                 {visibleColumns.email && (
                   <td className="px-4 py-3 whitespace-nowrap text-sm">{subscriber.email}</td>